@@ -30,515 +30,4811 @@
 #                resolved keyword partial string matching 
 # 2025-01-28 dcm corrected for case-sensitive duplicate keywords in ini
 #                made keyword matching case-insensitive
+# 2026-10-18 dcm keyword matcher compiled once per run from a keyword trie
+#                added --jobs to process folders with a pool of workers
+#                stream files through obfuscation with bounded memory
+#                text header end found with C speed block scans
+#                all rules applied in a single pass of one compiled scanner
+#                prefilters skip the rules a line cannot match
+#                encoding detection fast path and --encoding-cache
+#                added --incremental to skip files unchanged since the last run
+#                added --mapping-store to keep replacements in SQLite across runs
+#                added --hash-key-file for keyed hash replacements needing no shared state
+#                --jobs splits a single large file into chunks obfuscated in parallel
+#                detailed changes written as JSON Lines by a background thread
+#                stream gzip, bz2, xz, zip and tar inputs and added --output-archive
+#                added --follow to obfuscate live log files as they are written
+#                added '-' and --stdout for pipelines, and the Obfuscator class
+#                JSON run report of stage times and counts, and --profile
+#                single pass folder walk feeding files as found, and --include/--exclude
+#                binary bodies copied by the kernel, or through one reused buffer
+#                files nothing can change in cloned instead of obfuscated
+#                --scan to report the hits of each rule without writing any output
+#                compiled keywords cached on disk by the content of the .ini file
+#                --map-memory to bound the mapping, packing IPv4 and spilling it to disk
 #
 
 import os
+import posixpath
+import io
 import sys
 import re
+import codecs
+import glob
+import fnmatch
+import contextlib
+import string
+import collections
+import json
+import hashlib
+import sqlite3
+import socket
+import time
+import hmac
+import gzip
+import bz2
+import lzma
+import tarfile
+import zipfile
+import tempfile
+import functools
+import itertools
+import array
+import marshal
+import types
+import pstats
+import cProfile
 import logging
+import logging.handlers
+import threading
+import queue
+import multiprocessing
 import chardet  # Add this to imports for encoding detection
+try:  # Internals of re, only used for the code of the keyword cache
+    import _sre
+    try:
+        from re import _compiler as sre_compile, _parser as sre_parse
+    except ImportError:  # Before Python 3.11
+        import sre_compile, sre_parse
+except ImportError:
+    _sre = sre_compile = sre_parse = None
+try:
+    import fcntl
+except ImportError:  # Not on Windows
+    fcntl = None
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from multiprocessing.managers import BaseManager
+
+# version number
+VERSION = "1.1.0" 
+
+# Open addressing hash table of IPv4 addresses packed into 32-bit integers
+class PackedAddressTable:
+    """
+    Maps IPv4 addresses, packed into 32-bit integers, to non-zero codes,
+    holding both in arrays rather than as Python objects, so an address
+    takes 18 to 36 bytes instead of the 150 or so of a pair of strings in a
+    dict. Slots are probed linearly from a multiplicative hash of the
+    address, and the arrays are doubled once two thirds of them are used.
+
+    Arguments:
+    slots (int): The number of slots to start with, a power of two (default: MIN_SLOTS).
+    """
+
+    MIN_SLOTS = 1024
+
+    def __init__(self, slots=MIN_SLOTS):
+        self.length = 0
+        self._allocate(slots)
+
+    def _allocate(self, slots):
+        self.addresses = array.array("I", bytes(4 * slots))
+        self.codes = array.array("Q", bytes(8 * slots))  # 0 marks an empty slot
+        self.mask = slots - 1
+        self.shift = 32 - (slots.bit_length() - 1)
+
+    def __len__(self):
+        return self.length
+
+    def _index(self, address):
+        index = ((address * 2654435769) & 0xFFFFFFFF) >> self.shift
+        codes, addresses, mask = self.codes, self.addresses, self.mask
+        while codes[index] and addresses[index] != address:
+            index = (index + 1) & mask
+        return index
+
+    def get(self, address):
+        """
+        Returns the code of an address, or 0 if it is not in the table.
+        """
+        return self.codes[self._index(address)]
+
+    def setdefault(self, address, code):
+        """
+        Returns the code of an address, adding the address with the given
+        non-zero code if it is not in the table.
+        """
+        index = self._index(address)
+        if self.codes[index]:
+            return self.codes[index]
+        if self.is_full():
+            addresses, codes = self.addresses, self.codes
+            self._allocate(2 * len(codes))
+            for entry_address, entry_code in zip(addresses, codes):
+                if entry_code:
+                    index = self._index(entry_address)
+                    self.addresses[index] = entry_address
+                    self.codes[index] = entry_code
+            index = self._index(address)
+        self.addresses[index] = address
+        self.codes[index] = code
+        self.length += 1
+        return code
+
+    def is_full(self):
+        """
+        Returns whether adding another address doubles the arrays.
+        """
+        return 3 * (self.length + 1) > 2 * len(self.codes)
+
+    def nbytes(self):
+        return self.addresses.itemsize * len(self.addresses) + self.codes.itemsize * len(self.codes)
+
+    def items(self):
+        """
+        Yields the (address, code) pairs of the table.
+        """
+        for address, code in zip(self.addresses, self.codes):
+            if code:
+                yield address, code
+
+# Mapping of original values to their generic replacements, consistent for the whole run
+class ReplacementMap:
+    """
+    Maps original values (domains, IP addresses) to generic replacements.
+    Every new value takes the next number of a single counter shared by all
+    the value types, e.g. 'generic-domain-1.com' then '192.0.2.2'.
+
+    In a parallel run one instance is served to all the worker processes by
+    a ReplacementManager, so the lookup of a new value is locked.
+    """
+
+    def __init__(self):
+        self.replacements = {}
+        self.served = 0  # Values in the map when it was served to a parallel run
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.replacements)
+
+    def __contains__(self, value):
+        return value in self.replacements
+
+    def get(self, value, template):
+        """
+        Returns the replacement for a value, creating the next one if the value is new.
+
+        Arguments:
+        value (str): The original value to be replaced.
+        template (str): Format string for a new replacement, given the next number.
+
+        Returns:
+        str: The replacement value.
+        """
+        replacement = self.replacements.get(value)
+        if replacement is None:
+            with self.lock:
+                replacement = self.replacements.get(value)
+                if replacement is None:
+                    replacement = template.format(len(self.replacements) + 1)
+                    self.replacements[value] = replacement
+        return replacement
+
+    def items(self, first=1):
+        """
+        Returns the (value, replacement) pairs of the map, in the order they were added.
+
+        Arguments:
+        first (int): The position of the first pair to return, counting from 1 (default: 1).
+
+        Returns:
+        list: The (value, replacement) pairs.
+        """
+        with self.lock:
+            return list(itertools.islice(self.replacements.items(), max(first - 1, 0), None))
+
+    def update(self, items):
+        with self.lock:
+            self.replacements.update(items)
+
+    def rollback(self, count):
+        """
+        Forgets the values added after the first count, as if they had never been looked up.
+        """
+        with self.lock:
+            while len(self.replacements) > count:
+                self.replacements.popitem()
+
+    def footprint(self):
+        """
+        Returns the number of values in the map and the bytes they take in memory.
+
+        Returns:
+        dict: The values, the bytes in memory now and at most, and the values and bytes spilled to disk.
+        """
+        with self.lock:
+            memory_bytes = sys.getsizeof(self.replacements) + sum(
+                sys.getsizeof(value) + sys.getsizeof(replacement) for value, replacement in self.replacements.items()
+            )
+            return {
+                "values": len(self.replacements),
+                "memory_bytes": memory_bytes,
+                "peak_memory_bytes": memory_bytes,
+                "spilled_values": 0,
+                "spill_bytes": 0,
+            }
+
+    def flush(self):
+        pass  # Nothing is kept beyond the run
+
+    def close(self):
+        pass
+
+    def serve(self, manager):
+        """
+        Returns a proxy to a copy of the mapping served by the manager to a parallel run.
+        """
+        proxy = manager.ReplacementMap()
+        proxy.update(self.items())
+        self.served = len(self)
+        return proxy
+
+    def collect(self, proxy):
+        """
+        Takes back the values added by a parallel run from the proxy given by serve.
+        """
+        self.update(proxy.items(self.served + 1))
+
+# Replacement map bounded in memory with --map-memory, spilling to disk past the bound
+class CompactReplacementMap:
+    """
+    Stands in for the ReplacementMap when --map-memory bounds its memory,
+    numbering new values the same way.
+
+    A value only keeps the number of its replacement and which template
+    made it, as one integer code, from which the replacement is formatted
+    again. IPv4 addresses written the usual way are kept packed in a
+    PackedAddressTable, and other values as strings in a dict. The values
+    in memory are moved to a temporary SQLite database whenever they would
+    take more than the limit, and values not found in memory are looked up
+    there, so a run with tens of millions of distinct values stays within
+    the limit and still replaces every value consistently.
+    The replacements of up to CACHE_SIZE values are also kept as strings, the
+    cache being emptied when full, so hot values are not looked up again.
+
+    In a parallel run one instance is served to all the worker processes by
+    a ReplacementManager, so the lookup of a new value is locked.
+
+    Arguments:
+    memory_limit (int): The bytes the values may take in memory before they are spilled to disk.
+    spill_folder (str): The folder for the database of spilled values (default: None, the system's temporary folder).
+    """
+
+    CACHE_SIZE = 65536
+    TEMPLATE_BITS = 2  # Low bits of a code holding the index of its template
+
+    def __init__(self, memory_limit, spill_folder=None):
+        self.memory_limit = memory_limit
+        self.spill_folder = spill_folder
+        self.count = 0
+        self.addresses = PackedAddressTable()
+        self.values = {}  # Code of each value that is not a packed IPv4 address
+        self.value_bytes = 0  # Size of the values and codes in the dict
+        self.others = {}  # Replacements given to update that no template makes
+        self.templates = []
+        self.template_indexes = {}
+        self.template_regexes = []
+        self.spill_path = None
+        self.spill_connection = None
+        self.spilled = 0
+        self.peak_memory_bytes = 0
+        self.served = 0  # Values in the map when it was served to a parallel run
+        self.cache = {}  # Replacements of recently looked up values
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, value):
+        with self.lock:
+            return value in self.others or self._find(self._key(value)) is not None
+
+    def _key(self, value):
+        # An IPv4 address written the usual way is packed, any other value is kept as it is
+        if not value[-1:].isdigit():
+            return value  # Such as a domain, without trying to pack it
+        try:
+            packed = socket.inet_aton(value)
+        except (OSError, ValueError):
+            return value
+        return int.from_bytes(packed, "big") if socket.inet_ntoa(packed) == value else value
+
+    def _value(self, key):
+        return socket.inet_ntoa(key.to_bytes(4, "big")) if isinstance(key, int) else key
+
+    def _template_index(self, template):
+        index = self.template_indexes.get(template)
+        if index is None:
+            if len(self.templates) == 1 << self.TEMPLATE_BITS:
+                raise ValueError(f"Too many replacement templates for the replacement map: {template}")
+            prefix, _, suffix = template.partition("{}")
+            index = self.template_indexes[template] = len(self.templates)
+            self.templates.append(template)
+            self.template_regexes.append(re.compile(re.escape(prefix) + r"(\d+)" + re.escape(suffix)))
+        return index
+
+    def _format(self, code):
+        return self.templates[code & ((1 << self.TEMPLATE_BITS) - 1)].format(code >> self.TEMPLATE_BITS)
+
+    def _parse(self, replacement):
+        # The code of a replacement made by one of the templates, or None
+        for template in (DOMAIN_TEMPLATE, IPV4_TEMPLATE):
+            self._template_index(template)
+        for index, regex in enumerate(self.template_regexes):
+            match = regex.fullmatch(replacement)
+            if match:
+                code = int(match.group(1)) << self.TEMPLATE_BITS | index
+                if self._format(code) == replacement:
+                    return code
+        return None
+
+    def _find(self, key):
+        if isinstance(key, int):
+            code = self.addresses.get(key)
+        else:
+            code = self.values.get(key)
+        if not code and self.spill_connection is not None:
+            row = self.spill_connection.execute("SELECT code FROM spilled WHERE value = ?", (key,)).fetchone()
+            code = row and row[0]
+        return code or None
+
+    def _add(self, key, code):
+        # Returns the code of a value held in memory, adding it with the given code if it is new
+        if isinstance(key, int):
+            if (self.memory_limit and self.addresses.is_full()
+                    and self.memory_bytes() + 2 * self.addresses.nbytes() > self.memory_limit):
+                self._spill()  # Rather than double the arrays past the limit
+            added = self.addresses.setdefault(key, code)
+        else:
+            added = self.values.setdefault(key, code)
+            if added == code:
+                self.value_bytes += sys.getsizeof(key) + sys.getsizeof(code)
+        if added == code:
+            self.count += 1
+            if self.memory_limit and self.memory_bytes() > self.memory_limit:
+                self._spill()
+        return added
+
+    def _spill(self):
+        # Moves the values in memory to the database, creating it the first time
+        self.peak_memory_bytes = max(self.peak_memory_bytes, self.memory_bytes())
+        if self.spill_connection is None:
+            descriptor, self.spill_path = tempfile.mkstemp(prefix=OWN_FILE_PREFIX + "map_", suffix=".db", dir=self.spill_folder)
+            os.close(descriptor)
+            self.spill_connection = sqlite3.connect(self.spill_path, isolation_level=None, check_same_thread=False)
+            self.spill_connection.execute("PRAGMA journal_mode=OFF")  # Thrown away at the end of the run
+            self.spill_connection.execute("PRAGMA synchronous=OFF")
+            self.spill_connection.execute("CREATE TABLE spilled (value PRIMARY KEY, code INTEGER NOT NULL) WITHOUT ROWID")
+            logging.info(f"Replacement map exceeded {self.memory_limit} bytes, spilling values to {self.spill_path}")
+        self.spill_connection.execute("BEGIN")
+        self.spill_connection.executemany("INSERT INTO spilled (value, code) VALUES (?, ?)", self.addresses.items())
+        self.spill_connection.executemany("INSERT INTO spilled (value, code) VALUES (?, ?)", self.values.items())
+        self.spill_connection.execute("COMMIT")
+        self.spilled += len(self.addresses) + len(self.values)
+        self.addresses = PackedAddressTable()
+        self.values = {}
+        self.value_bytes = 0
+
+    def _number(self, value, template):
+        with self.lock:
+            if value in self.others:
+                return self.others[value]
+            key = self._key(value)
+            code = self._find(key) if self.spill_connection is not None else None
+            if code is None:
+                code = self._add(key, (self.count + 1) << self.TEMPLATE_BITS | self._template_index(template))
+        return self._format(code)
+
+    def get(self, value, template):
+        """
+        Returns the replacement for a value, creating the next one if the value is new.
+
+        Arguments:
+        value (str): The original value to be replaced.
+        template (str): Format string for a new replacement, given the next number.
+
+        Returns:
+        str: The replacement value.
+        """
+        replacement = self.cache.get(value)
+        if replacement is None:
+            replacement = self._number(value, template)
+            if len(self.cache) >= self.CACHE_SIZE:
+                self.cache.clear()
+            self.cache[value] = replacement
+        return replacement
+
+    def items(self, first=1):
+        """
+        Returns the (value, replacement) pairs of the map, in the order they were numbered.
+
+        Arguments:
+        first (int): The number of the first replacement to return, leaving out
+                     the replacements given to update that no template makes
+                     unless it is 1 (default: 1).
+
+        Returns:
+        list: The (value, replacement) pairs.
+        """
+        bound = first << self.TEMPLATE_BITS
+        with self.lock:
+            if self.spill_connection is not None:
+                self._spill()
+                entries = self.spill_connection.execute(
+                    "SELECT value, code FROM spilled WHERE code >= ? ORDER BY code", (bound,)
+                )
+            else:
+                entries = sorted(
+                    (entry for entries in (self.addresses.items(), self.values.items()) for entry in entries if entry[1] >= bound),
+                    key=lambda entry: entry[1],
+                )
+            items = [(self._value(key), self._format(code)) for key, code in entries]
+            if first <= 1:
+                items.extend(self.others.items())
+        return items
+
+    def update(self, items):
+        """
+        Adds (value, replacement) pairs, such as those kept by an earlier run,
+        leaving the values already in the map as they are.
+        """
+        with self.lock:
+            for value, replacement in items:
+                key = self._key(value)
+                if value in self.others or self._find(key) is not None:
+                    continue
+                code = self._parse(replacement)
+                if code is None:
+                    self.others[value] = replacement
+                    self.count += 1
+                else:
+                    self._add(key, code)
+
+    def rollback(self, count):
+        """
+        Forgets the values numbered after the first count, as if they had never been looked up.
+        """
+        bound = (count + 1) << self.TEMPLATE_BITS
+        with self.lock:
+            addresses = PackedAddressTable()
+            for address, code in self.addresses.items():
+                if code < bound:
+                    addresses.setdefault(address, code)
+            self.addresses = addresses
+            self.values = {value: code for value, code in self.values.items() if code < bound}
+            self.value_bytes = sum(sys.getsizeof(value) + sys.getsizeof(code) for value, code in self.values.items())
+            if self.spill_connection is not None:
+                self.spill_connection.execute("DELETE FROM spilled WHERE code >= ?", (bound,))
+                self.spilled = self.spill_connection.execute("SELECT COUNT(*) FROM spilled").fetchone()[0]
+            self.count = count
+            self.cache = {}
+
+    def memory_bytes(self):
+        """
+        Returns the bytes the values in memory take, apart from the cache of replacements.
+        """
+        return self.addresses.nbytes() + sys.getsizeof(self.values) + self.value_bytes
+
+    def footprint(self):
+        """
+        Returns the number of values in the map and the bytes they take in memory and on disk.
+
+        Returns:
+        dict: The values, the bytes in memory now and at most, and the values and bytes spilled to disk.
+        """
+        with self.lock:
+            memory_bytes = self.memory_bytes()
+            return {
+                "values": self.count,
+                "memory_bytes": memory_bytes,
+                "peak_memory_bytes": max(self.peak_memory_bytes, memory_bytes),
+                "spilled_values": self.spilled,
+                "spill_bytes": os.path.getsize(self.spill_path) if self.spill_path else 0,
+            }
+
+    def flush(self):
+        pass  # Nothing is kept beyond the run
+
+    def close(self):
+        """
+        Removes the database of spilled values.
+        """
+        with self.lock:
+            if self.spill_connection is not None:
+                self.spill_connection.close()
+                self.spill_connection = None
+                os.remove(self.spill_path)
+
+    def serve(self, manager):
+        """
+        Returns a proxy to a copy of the mapping served by the manager to a parallel run.
+        """
+        proxy = manager.CompactReplacementMap(self.memory_limit, self.spill_folder)
+        proxy.update(self.items())
+        self.served = len(self)
+        return proxy
+
+    def collect(self, proxy):
+        """
+        Takes back the values numbered by a parallel run from the proxy given by serve.
+        """
+        self.update(proxy.items(self.served + 1))
+        proxy.close()
+
+# Mapping kept in a SQLite database, shared by runs on any machine it is copied to
+class StoredReplacementMap:
+    """
+    Keeps the ReplacementMap in a SQLite database, so a value maps to the
+    same replacement in every run using the database, e.g. on different days
+    or machines. Values are looked up by their index as they are first seen
+    in a run rather than loaded at startup, and up to CACHE_SIZE of the
+    values seen are kept in memory, the cache being emptied when full.
+
+    New values are numbered and written in batches, in one write transaction
+    committed after BATCH_SIZE values, BATCH_SECONDS after it began, or
+    when flush is called at the end of each file, whichever comes first.
+    A timer thread commits it should no new value follow, so the database's
+    write lock is never held for longer than that. Another process waits
+    for the lock before numbering a value and looks the value up again once
+    it has it, in case it was added first, so processes sharing the
+    database always agree. The database is opened in WAL mode, where a
+    commit does not wait for the disk, so lookups are not blocked by a
+    batch being written, and it must be on a local disk.
+
+    Arguments:
+    path (str): The path to the database, created if it does not exist.
+    """
+
+    CACHE_SIZE = 65536
+    BATCH_SIZE = 1000
+    BATCH_SECONDS = 0.1
+
+    def __init__(self, path):
+        self.path = path
+        self.replacements = {}  # The values seen in this run
+        self.lock = threading.Lock()
+        self.batch_timer = None  # Commits the open write transaction, if any
+        self.batch_count = 0  # New values written in it
+
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS replacements ("
+            "value TEXT PRIMARY KEY, number INTEGER NOT NULL UNIQUE, replacement TEXT NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM replacements").fetchone()[0]
+
+    def __contains__(self, value):
+        return self._lookup(value) is not None
+
+    def _lookup(self, value):
+        row = self.connection.execute("SELECT replacement FROM replacements WHERE value = ?", (value,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, value, template):
+        """
+        Returns the replacement for a value, creating the next one if the value is new.
+
+        Arguments:
+        value (str): The original value to be replaced.
+        template (str): Format string for a new replacement, given the next number.
+
+        Returns:
+        str: The replacement value.
+        """
+        replacement = self.replacements.get(value)
+        if replacement is not None:
+            return replacement
+
+        with self.lock:
+            replacement = self._lookup(value)
+            if replacement is None and self.batch_timer is None:
+                self._begin()
+                # Another process may have added the value before the lock was free
+                replacement = self._lookup(value)
+            if replacement is None:
+                number = self.connection.execute("SELECT COALESCE(MAX(number), 0) + 1 FROM replacements").fetchone()[0]
+                replacement = template.format(number)
+                self.connection.execute(
+                    "INSERT INTO replacements (value, number, replacement) VALUES (?, ?, ?)",
+                    (value, number, replacement),
+                )
+                self.batch_count += 1
+                if self.batch_count >= self.BATCH_SIZE:
+                    self._commit()
+            if len(self.replacements) >= self.CACHE_SIZE:
+                self.replacements.clear()
+            self.replacements[value] = replacement
+        return replacement
+
+    def items(self):
+        with self.lock:
+            return self.connection.execute("SELECT value, replacement FROM replacements ORDER BY number").fetchall()
+
+    def update(self, items):
+        with self.lock:
+            if self.batch_timer is None:
+                self._begin()
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO replacements (value, number, replacement) "
+                "VALUES (?, (SELECT COALESCE(MAX(number), 0) + 1 FROM replacements), ?)",
+                items,
+            )
+            self._commit()
+
+    def _begin(self):
+        # Takes the database's write lock for a batch of new values, committed by the timer at the latest
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.batch_count = 0
+        self.batch_timer = threading.Timer(self.BATCH_SECONDS, self.flush)
+        self.batch_timer.daemon = True
+        self.batch_timer.start()
+
+    def _commit(self):
+        self.batch_timer.cancel()
+        self.batch_timer = None
+        self.connection.execute("COMMIT")
+
+    def flush(self):
+        """
+        Commits the batch of new values written since the last commit, if any.
+        """
+        with self.lock:
+            if self.batch_timer is not None:
+                self._commit()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.connection.close()
+
+    def serve(self, manager):
+        """
+        Returns a proxy to the database opened by the manager for a parallel run.
+        """
+        self.flush()
+        return manager.StoredReplacementMap(self.path)
+
+    def collect(self, proxy):
+        """
+        Commits the parallel run's new values, which are already in the database.
+        """
+        proxy.close()
+
+# Worker side view of the ReplacementMap served to a parallel run
+class SharedReplacementMap:
+    """
+    Looks up replacements in the ReplacementMap of the ReplacementManager,
+    keeping the values seen in a bounded LRU cache so a hot value only costs
+    a single round trip to the manager process per worker.
+
+    Arguments:
+    proxy: The proxy to the ReplacementMap held by the ReplacementManager.
+    """
+
+    CACHE_SIZE = 65536
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self._replacement = functools.lru_cache(maxsize=self.CACHE_SIZE)(proxy.get)
+
+    def __len__(self):
+        return self._replacement.cache_info().currsize
+
+    def get(self, value, template):
+        return self._replacement(value, template)
+
+    def flush(self):
+        self.proxy.flush()
+
+# Mapping derived from a keyed hash of each value, needing no shared state
+class HashedReplacementMap:
+    """
+    Derives the replacement for a value from its HMAC-SHA256 under a secret
+    key instead of numbering values as they are seen, so every process,
+    on any machine, given the same key replaces a value the same way
+    without sharing a counter, locking or lookups.
+
+    Domains get 16 hex digits of the hash, e.g. generic-domain-9f86d081884c7d65.com,
+    which makes a collision unlikely among billions of domains. IPv4
+    addresses are too many to hash into a reserved range without two of
+    them sharing a replacement, so they are encrypted instead, with a
+    Feistel network whose round function is the HMAC. That is a permutation,
+    so distinct values always get distinct replacements, whichever process
+    or order they are seen in. The result numbers the replacement in the
+    same reserved range the numbered maps use, past the last part of any
+    dotted quad, e.g. 192.0.2.2271560481, so a replacement is never an
+    address that was routable, nor one left unchanged elsewhere in the log.
+    An address written the usual way, such as 10.1.2.3, is permuted among
+    all 2**32 addresses. Any other dotted quad of up to three digits a part,
+    such as 010.1.2.3 or 999.1.2.3, is permuted among all such dotted quads,
+    cycle walking past the numbers above them, and numbered after the
+    addresses, so it cannot take the replacement of an address.
+
+    Replacements are memoised in a bounded LRU cache so hot values are not
+    hashed again.
+
+    Arguments:
+    key (bytes): The secret key for the HMAC.
+    """
+
+    CACHE_SIZE = 65536
+    FEISTEL_ROUNDS = 8
+    # Every dotted quad part of 1 to 3 digits, numbered by length then value
+    PART_COUNT = 10 + 100 + 1000
+    PART_OFFSETS = {1: 0, 2: 10, 3: 110}
+    # IPv4 replacements are numbered from here, past the last part of any dotted quad
+    IPV4_NUMBER_OFFSET = 1000
+
+    def __init__(self, key):
+        self.key = key
+        self._hmac = hmac.new(key, digestmod=hashlib.sha256)
+        self._replacement = functools.lru_cache(maxsize=self.CACHE_SIZE)(self._derive)
+
+    def __reduce__(self):
+        # Workers rebuild the map from the key, with caches of their own
+        return type(self), (self.key,)
+
+    def __len__(self):
+        return self._replacement.cache_info().currsize
+
+    def __contains__(self, value):
+        return True  # Every value has a replacement
+
+    def _digest(self, message):
+        digest = self._hmac.copy()
+        digest.update(message)
+        return digest.digest()
+
+    def _permute(self, number, bits):
+        # Keyed Feistel permutation of the numbers below 2**bits, for an even number of bits
+        half = bits // 2
+        mask = (1 << half) - 1
+        left, right = number >> half, number & mask
+        for round_number in range(self.FEISTEL_ROUNDS):
+            message = b"ipv4 %d %d %d" % (bits, round_number, right)
+            left, right = right, left ^ (int.from_bytes(self._digest(message)[:8], "big") & mask)
+        return left << half | right
+
+    @staticmethod
+    def _is_address(parts):
+        # Whether dotted quad parts are an IPv4 address written the usual way
+        return all(part == str(int(part)) and int(part) <= 255 for part in parts)
+
+    def _permute_ipv4(self, value):
+        # Number of the replacement of a dotted quad, None for any other value
+        parts = value.split(".")
+        if len(parts) != 4 or not all(part.isascii() and part.isdigit() and len(part) <= 3 for part in parts):
+            return None
+        if self._is_address(parts):
+            return self._permute(int.from_bytes(bytes(int(part) for part in parts), "big"), 32)
+
+        # Cycle walk the 42 bit numbers until back among the dotted quads
+        count = self.PART_COUNT ** 4
+        number = 0
+        for part in parts:
+            number = number * self.PART_COUNT + self.PART_OFFSETS[len(part)] + int(part)
+        number = self._permute(number, 42)
+        while number >= count:
+            number = self._permute(number, 42)
+        return 2 ** 32 + number
+
+    def _derive(self, value, template):
+        if template == IPV4_TEMPLATE:
+            number = self._permute_ipv4(value)
+            if number is not None:
+                return template.format(self.IPV4_NUMBER_OFFSET + number)
+        return template.format(self._digest(value.encode("utf-8")).hex()[:16])
+
+    def get(self, value, template):
+        """
+        Returns the replacement for a value, derived from its keyed hash.
+
+        Arguments:
+        value (str): The original value to be replaced.
+        template (str): Format string for the replacement, given hex digits of the hash,
+                        or for IPv4 addresses the number they are permuted to.
+
+        Returns:
+        str: The replacement value.
+        """
+        return self._replacement(value, template)
+
+    def items(self):
+        return []  # Nothing needs keeping, the replacements can be derived again
+
+    def update(self, items):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def serve(self, manager):
+        """
+        Returns the map itself, which every worker rebuilds from the key.
+        """
+        return self
+
+    def collect(self, proxy):
+        pass
+
+# Raised when a chunk of a file obfuscated in parallel does not match its survey
+class ChunkFallback(Exception):
+    """
+    Raised when a chunk looks up a value that was not found in its survey,
+    so its numbering could differ from the sequential path and the file is
+    obfuscated sequentially instead.
+    """
+
+# Mapping used for one chunk of a file obfuscated in parallel
+class ChunkReplacementMap:
+    """
+    Stands in for the ReplacementMap while a worker obfuscates one chunk of a
+    file, recording the values looked up in the order they were first seen.
+
+    Surveying a chunk, the map numbers new values itself, and the main process
+    then numbers the values of every chunk in file order in the run's map.
+    Obfuscating a chunk, the map only holds those replacements and a value
+    missing from it raises ChunkFallback, as the chunk would not match the
+    sequential path.
+
+    Arguments:
+    replacements (dict): The replacements to look values up in (default: None, to survey).
+    """
+
+    def __init__(self, replacements=None):
+        self.frozen = replacements is not None
+        self.replacements = replacements if self.frozen else {}
+        self.values = {}  # Template of each value looked up, in the order first seen
+
+    def __len__(self):
+        return len(self.replacements)
+
+    def __contains__(self, value):
+        return value in self.replacements
+
+    def get(self, value, template):
+        replacement = self.replacements.get(value)
+        if replacement is None:
+            if self.frozen:
+                raise ChunkFallback(f"{value} was not surveyed")
+            replacement = self.replacements[value] = template.format(len(self.replacements) + 1)
+        self.values.setdefault(value, template)
+        return replacement
+
+# Mapping of a --scan run, which only counts what would be replaced
+class ScanReplacementMap:
+    """
+    Stands in for the ReplacementMap in a --scan run. Every value is given
+    the first replacement of its template and nothing is kept, so scanning
+    any amount of data takes no memory for the values found, and each worker
+    process can have its own.
+    """
+
+    def __len__(self):
+        return 0
+
+    def __contains__(self, value):
+        return False
+
+    def get(self, value, template):
+        return template.format(0)
+
+    def items(self):
+        return []
+
+    def update(self, items):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+# Manager process serving the run's ReplacementMap to the workers
+class ReplacementManager(BaseManager):
+    pass
+
+ReplacementManager.register("ReplacementMap", ReplacementMap)
+ReplacementManager.register("CompactReplacementMap", CompactReplacementMap)
+ReplacementManager.register("StoredReplacementMap", StoredReplacementMap)
+
+# Mapping for consistent obfuscation within a run
+replacement_map = ReplacementMap()
+
+# Cache of detected encodings shared by files from the same producer
+class EncodingCache:
+    """
+    Remembers the encoding chardet detected for a file so that the files
+    around it, written by the same producer, can skip chardet. Files share
+    an encoding by their folder, or by their folder and name pattern, being
+    the name with any runs of digits masked (e.g. app-2025-01-13.log and
+    app-2025-01-14.log). Each worker process of a parallel run keeps its own.
+
+    Arguments:
+    key (str): 'folder' or 'pattern', what files share an encoding by (default: None, no caching).
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self.encodings = {}
+
+    def _cache_key(self, file_path):
+        folder, name = os.path.split(os.path.abspath(file_path))
+        if self.key == "pattern":
+            return folder, DIGITS_REGEX.sub("#", name)
+        return folder
+
+    def get(self, file_path):
+        """
+        Returns the cached encoding for the file, None if there is none.
+        """
+        if not self.key:
+            return None
+        return self.encodings.get(self._cache_key(file_path))
+
+    def set(self, file_path, encoding):
+        """
+        Caches the encoding detected for the file, unless caching is off.
+        """
+        if self.key and encoding:
+            self.encodings[self._cache_key(file_path)] = encoding
+
+# Encodings detected within a run, set up by main and init_worker
+encoding_cache = EncodingCache()
+
+# Record of the files obfuscated into an output folder, for incremental runs
+class RunManifest:
+    """
+    Keeps the size, modification time and content hash of every file an
+    incremental run obfuscated, along with its output, so a later run into
+    the same output folder can skip the files that have not changed. The
+    manifest also holds the domain and IP mapping, so new outputs use the
+    same replacements as the outputs kept from earlier runs.
+
+    A manifest written with other keywords, flags or script version is
+    ignored, and every file is obfuscated again from a fresh mapping.
+
+    Arguments:
+    output_folder (str): The folder the obfuscated files are saved to, where the manifest is kept.
+    input_root (str): The file or folder being processed, which the files are recorded relative to.
+    fingerprint (str): The fingerprint of the keywords and flags of the run.
+    """
+
+    def __init__(self, output_folder, input_root, fingerprint):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self.input_root = input_root if os.path.isdir(input_root) else os.path.dirname(input_root)
+        self.fingerprint = fingerprint
+        self.previous_files = {}
+        self.files = {}  # Entries for the files of this run, so removed files drop out
+        self.replacements = {}
+        self.outputs = set()
+        self.load()
+
+    def load(self):
+        """
+        Reads the manifest of the last run, if there is one for the same keywords and flags.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            return
+
+        files = manifest.get("files", {})
+        self.outputs = {self._output_path(entry) for entry in files.values()}
+        if manifest.get("fingerprint") != self.fingerprint:
+            logging.info("Keywords, flags or version changed since the last run, obfuscating every file again.")
+            return
+        self.previous_files = files
+        self.replacements = manifest.get("replacements", {})
+
+    def save(self, replacements):
+        """
+        Writes the manifest, replacing the last one only once it is complete.
+
+        Arguments:
+        replacements (list): The (value, replacement) pairs of the run's mapping.
+        """
+        manifest = {
+            "version": VERSION,
+            "fingerprint": self.fingerprint,
+            "files": self.files,
+            "replacements": dict(replacements),
+        }
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1)
+        os.replace(temp_path, self.path)
+
+    def _key(self, file_path):
+        return os.path.relpath(file_path, self.input_root).replace(os.sep, "/")
+
+    def _output_path(self, entry):
+        # Outputs are recorded relative to the output folder
+        return os.path.normcase(os.path.abspath(os.path.join(self.output_folder, entry["output"])))
+
+    def is_own_file(self, file_path):
+        """
+        Returns whether the file is an output, log or manifest of a run, found
+        when the output folder is inside the folder being processed.
+        """
+        if os.path.basename(file_path).startswith(OWN_FILE_PREFIX):
+            return True
+        return os.path.normcase(os.path.abspath(file_path)) in self.outputs
+
+    def is_unchanged(self, file_path, output_path):
+        """
+        Returns whether the file was obfuscated to the output by the last run
+        and has not changed since, keeping its entry for this run if so. The
+        content is only hashed when the size matches but the time does not.
+        """
+        entry = self.previous_files.get(self._key(file_path))
+        if (entry is None or self._output_path(entry) != os.path.normcase(os.path.abspath(output_path))
+                or not os.path.isfile(output_path)):
+            return False
+
+        stat = os.stat(file_path)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns != entry["mtime_ns"]:
+            if file_hash(file_path) != entry["sha256"]:
+                return False
+            entry = dict(entry, mtime_ns=stat.st_mtime_ns)
+        self.files[self._key(file_path)] = entry
+        return True
+
+    def record(self, file_path, output_path):
+        """
+        Adds the entry for a file obfuscated by this run.
+        """
+        stat = os.stat(file_path)
+        self.files[self._key(file_path)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_hash(file_path),
+            "output": os.path.relpath(output_path, self.output_folder).replace(os.sep, "/"),
+        }
+
+# Stage times and counts of a run, saved as a JSON report
+class RunReport:
+    """
+    Collects the time spent in each stage of obfuscating every file, the
+    bytes and lines processed and the matches of each rule, for a JSON
+    report of the run with its slowest files and throughput.
+
+    The obfuscation stage is whatever of a file's time the timed stages do
+    not account for. The rules run together in a single pass, so the time
+    of each rule is only seen in the profile of a --profile run.
+
+    Arguments:
+    profile (bool): Whether the run is profiled, in worker processes as well (default: False).
+    """
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.files = []
+        self.skipped = 0
+        self.stages = dict.fromkeys(TIMED_STAGES + ("obfuscate",), 0.0)
+        self.counts = collections.Counter()
+        self.profiles = []  # Profile stats returned by worker processes
+
+    def add_counts(self, counts):
+        """
+        Adds prefilter and match counts that are not from a file of the report,
+        such as those of followed or piped input.
+        """
+        self.counts.update(counts)
+
+    def add_file(self, file_path, output_path, error, stats):
+        """
+        Adds a processed file, with the stats returned by obfuscate_file_timed.
+        """
+        stages = dict(stats["stages"])
+        stages["obfuscate"] = max(stats["seconds"] - sum(stages.values()), 0.0)
+        for stage, seconds in stages.items():
+            self.stages[stage] += seconds
+        self.add_counts(stats["counts"])
+        if stats.get("profile") is not None:
+            self.profiles.append(stats["profile"])
+
+        def size(path):
+            try:
+                return os.path.getsize(path)
+            except (OSError, TypeError):
+                return None  # Not written, or written into an archive
+
+        bytes_read = size(file_path)
+        seconds = stats["seconds"]
+        self.files.append({
+            "path": file_path,
+            "output": output_path,
+            "error": None if error is None else str(error),
+            "bytes_read": bytes_read,
+            "bytes_written": size(output_path),
+            "lines": stats["counts"].get("lines", 0),
+            "cloned": bool(stats["counts"].get("cloned files")),
+            "seconds": round(seconds, 6),
+            "mb_per_second": round(bytes_read / seconds / 1e6, 3) if bytes_read and seconds else None,
+            "stages": {stage: round(seconds, 6) for stage, seconds in stages.items()},
+        })
+
+    def merge_profile(self, profiler):
+        """
+        Returns the stats of the run's profiler merged with those of the worker processes.
+        """
+        stats = pstats.Stats(profiler)
+        for worker_stats in self.profiles:
+            stats.add(types.SimpleNamespace(stats=worker_stats, create_stats=lambda: None))
+        return stats
+
+    def save(self, path, profile_stats=None, mapping_footprint=None):
+        """
+        Writes the report.
+
+        Arguments:
+        path (str): The path to the JSON report.
+        profile_stats (pstats.Stats): The stats of a profiled run, whose slowest
+                                      functions are listed in the report (default: None).
+        mapping_footprint (dict): The footprint of the run's ReplacementMap (default: None).
+        """
+        seconds = time.perf_counter() - self.start
+        bytes_read = sum(entry["bytes_read"] or 0 for entry in self.files)
+        lines = self.counts.get("lines", 0)
+        report = {
+            "version": VERSION,
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": round(seconds, 3),
+            "totals": {
+                "files": len(self.files),
+                "errors": sum(entry["error"] is not None for entry in self.files),
+                "skipped": self.skipped,
+                "bytes_read": bytes_read,
+                "bytes_written": sum(entry["bytes_written"] or 0 for entry in self.files),
+                "lines": lines,
+                "mb_per_second": round(bytes_read / seconds / 1e6, 3) if seconds else None,
+                "lines_per_second": round(lines / seconds) if seconds else None,
+                "cloned": self.counts.get("cloned files", 0),
+            },
+            "stages": {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+            "matches": {RULE_NAMES[rule]: self.counts.get(key, 0) for rule, key in MATCH_COUNTS.items()},
+            "prefilters": {key: self.counts.get(key, 0) for key in
+                           ("lines", "url candidates", "ipv4 candidates", "keywords only", "in passes")},
+            "slowest_files": [entry["path"] for entry in
+                              sorted(self.files, key=lambda entry: entry["seconds"], reverse=True)[:REPORT_SLOWEST_FILES]],
+            "files": self.files,
+        }
+        if mapping_footprint is not None:
+            report["replacement_map"] = mapping_footprint
+        if profile_stats is not None:
+            functions = sorted(profile_stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+            report["profile"] = [
+                {"function": pstats.func_std_string(function), "calls": calls,
+                 "seconds": round(own_seconds, 6), "cumulative_seconds": round(cumulative_seconds, 6)}
+                for function, (primitive_calls, calls, own_seconds, cumulative_seconds, callers)
+                in functions[:REPORT_PROFILE_FUNCTIONS]
+            ]
+
+        with open(path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=1)
+
+# Archive or compressed file the obfuscated files are written into
+class ArchiveWriter:
+    """
+    Writes obfuscated files into a zip or tar archive, or a single compressed
+    file, as they are produced. Zip members and compressed files are streamed
+    straight into the output, while a tar member is spooled first, in memory
+    unless it is large, as its header holds its size. A file given the name of
+    one already added, such as 'app.log' from both 'app.log.gz' and
+    'app.log.xz', is renamed 'app_2.log'.
+
+    Arguments:
+    path (str): The path to the archive or compressed file to write.
+    root (str): The output folder member names are made relative to (default: None).
+    """
+
+    def __init__(self, path, root=None):
+        self.path = path
+        self.root = root
+        self.names = set()
+        suffix, self.kind, self.compression = get_archive_format(path)
+        if self.kind == "zip":
+            self.archive = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        elif self.kind == "tar":
+            self.archive = tarfile.open(path, "w|" + self.compression)
+        else:
+            self.archive = None
+
+    def member_name(self, output_folder, name):
+        """
+        Returns the name in the archive of a file that would be saved to the
+        output folder, its path relative to the root output folder.
+        """
+        return os.path.relpath(os.path.join(output_folder, name), self.root).replace(os.sep, "/")
+
+    def _unique_name(self, name):
+        unique_name = name
+        base, extension = os.path.splitext(name)
+        number = 1
+        while unique_name in self.names:
+            number += 1
+            unique_name = f"{base}_{number}{extension}"
+        if unique_name != name:
+            logging.warning(f"Adding {name} to {self.path} as {unique_name}, the name is already taken")
+        self.names.add(unique_name)
+        return unique_name
+
+    @contextlib.contextmanager
+    def open_member(self, name, mtime, mode):
+        """
+        Adds a file to the archive, opened for its content to be written to.
+        A compressed file holds only the one file, whose name is not used.
+
+        Arguments:
+        name (str): The name of the file in the archive.
+        mtime (float): The modification time of the file.
+        mode (int): The permission bits of the file, 0 if not known.
+
+        Returns:
+        file: The file in the archive, open for writing in binary mode.
+        """
+        name = self._unique_name(name)
+        if self.kind == "zip":
+            info = zipfile.ZipInfo(name, time.localtime(max(mtime, ZIP_EPOCH))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            if mode:
+                info.external_attr = (0o100000 | mode & 0o7777) << 16  # A regular file
+            with self.archive.open(info, "w", force_zip64=True) as member_file:
+                yield member_file
+        elif self.kind == "tar":
+            with tempfile.SpooledTemporaryFile(TAR_SPOOL_SIZE) as member_file:
+                yield member_file
+                info = tarfile.TarInfo(name)
+                info.mtime = int(mtime)
+                info.mode = mode & 0o7777 or 0o644
+                info.size = member_file.tell()
+                member_file.seek(0)
+                self.archive.addfile(info, member_file)
+        else:
+            with COMPRESSION_MODULES[self.compression].open(self.path, "wb") as member_file:
+                yield member_file
+
+    def add_folder(self, name, mtime, mode):
+        """
+        Adds a folder to the archive, once, which a compressed file has no place for.
+        """
+        if name in self.names:
+            return
+        self.names.add(name)
+        if self.kind == "zip":
+            info = zipfile.ZipInfo(name + "/", time.localtime(max(mtime, ZIP_EPOCH))[:6])
+            info.external_attr = (0o40000 | (mode & 0o7777 or 0o755)) << 16 | 0x10  # A directory
+            self.archive.writestr(info, b"")
+        elif self.kind == "tar":
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            info.mtime = int(mtime)
+            info.mode = mode & 0o7777 or 0o755
+            self.archive.addfile(info)
+
+    def close(self):
+        """
+        Finishes the archive.
+        """
+        if self.archive is not None:
+            self.archive.close()
+
+# Rules applied by the obfuscation, named as reported in the detailed log
+URL_RULE = 'HTTP/HTTPS URL Obfuscation'
+IPV4_RULE = 'IPv4 Address Obfuscation'
+KEYWORD_RULE = 'Keyword Obfuscation'
+
+# Regex to match the domain and subdomain in a URL
+URL_REGEX = re.compile(r"(https?://)([a-zA-Z0-9.-]+)(/[^\s]*)?")
+
+# Regex to match IPv4 addresses
+IPV4_REGEX = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b")
+
+# Generic replacement values, given the next number of the ReplacementMap
+DOMAIN_TEMPLATE = "generic-domain-{}.com"
+IPV4_TEMPLATE = "192.0.2.{}"  # Use reserved IP range for generic values
+
+# Regexes to match the text a generic domain or IP replacement can end with
+DOMAIN_REPLACEMENT_END_REGEX = re.compile(
+    r"(?:" + "|".join(re.escape("generic-domain-"[i:]) for i in range(15)) + r")?\d+\.com|(?:(?:\.?c)?o)?m"
+)
+IPV4_REPLACEMENT_END_REGEX = re.compile(
+    r"(?:" + "|".join(re.escape("192.0.2."[i:]) for i in range(8)) + r")?\d+"
+)
+
+# Settings of a parallel worker process, set by init_worker
+worker_settings = {}
+
+# Stages of obfuscating a file that are timed as they run, the obfuscation
+# itself taking the rest of the file's time
+TIMED_STAGES = ("detect_encoding", "read", "write", "copy_binary", "log")
+
+# Seconds spent in each timed stage on the file being processed by this process
+file_stats = dict.fromkeys(TIMED_STAGES, 0.0)
+
+# Number of the slowest files, and of the functions taking the most time in a
+# --profile run, listed in the run report
+REPORT_SLOWEST_FILES = 10
+REPORT_PROFILE_FUNCTIONS = 25
+
+# Stage times and counts of the run
+run_report = RunReport()
+
+# Size of the blocks files are streamed through obfuscation in
+CHUNK_SIZE = 1024 * 1024
+
+# Number of lines obfuscated and written out together when streaming
+LINES_PER_WRITE = 1024
+
+# Name of the logger detailed changes are sent to, in batches of CHANGES_PER_RECORD
+CHANGES_LOGGER = "ObfuscateLogs.changes"
+CHANGES_PER_RECORD = 1024
+
+# Short names of the rules in the detailed changes
+RULE_NAMES = {URL_RULE: "url", IPV4_RULE: "ipv4", KEYWORD_RULE: "keyword"}
+
+# Keys of the RuleScanner counts of the matches of each rule
+MATCH_COUNTS = {rule: f"{name} matches" for rule, name in RULE_NAMES.items()}
+
+# Size of the line aligned chunks a large file is split into for --jobs,
+# files of at least two chunks being split
+INTRA_FILE_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Size of the blocks checked at once for the end of a text header
+ASCII_SCAN_BLOCK = 64 * 1024
+
+# Regex to match a non-ASCII byte
+NON_ASCII_BYTE = re.compile(rb"[\x80-\xff]")
+
+# Start of the names of the log and manifest files of a run
+OWN_FILE_PREFIX = "__obfuscation_"
+
+# Name of the manifest of an incremental run, kept in the output folder
+MANIFEST_NAME = OWN_FILE_PREFIX + "manifest.json"
+
+# Number of files a folder walk can find ahead of those being processed
+FOLDER_SCAN_QUEUE_SIZE = 1024
+
+# Output folders known to exist, so each is only created once
+output_folders_made = set()
+
+# Number of the hits of each file whose position a --scan report lists
+SCAN_SAMPLES = 10
+
+# Size of the sample from the start of a file its encoding is detected from
+ENCODING_SAMPLE_SIZE = 4096
+
+# Byte order marks and the encodings chardet reports for them, longest first
+BOMS = (
+    (codecs.BOM_UTF32_LE, "UTF-32"),
+    (codecs.BOM_UTF32_BE, "UTF-32"),
+    (codecs.BOM_UTF8, "UTF-8-SIG"),
+    (codecs.BOM_UTF16_LE, "UTF-16"),
+    (codecs.BOM_UTF16_BE, "UTF-16"),
+)
+
+# Regex to match a control byte not found in plain text, such as NUL or ESC
+CONTROL_BYTE = re.compile(rb"[\x00-\x08\x0e-\x1f]")
+
+# Regex to match where an IPv4 address could be, looser than the IPv4 rule
+IPV4_CANDIDATE_REGEX = re.compile(r"\d\.\d{1,3}\.\d{1,3}\.\d")
+
+# Linux ioctl making a file share the blocks of another, on filesystems such
+# as Btrfs and XFS that support it
+FICLONE = 0x40049409
+
+# Regex to match a run of digits, such as a date or counter in a file name
+DIGITS_REGEX = re.compile(r"\d+")
+
+# Suffixes of the archives and compressed files streamed through obfuscation,
+# longest first, with their kind and compression
+ARCHIVE_SUFFIXES = (
+    (".tar.gz", "tar", "gz"),
+    (".tar.bz2", "tar", "bz2"),
+    (".tar.xz", "tar", "xz"),
+    (".tgz", "tar", "gz"),
+    (".tbz2", "tar", "bz2"),
+    (".txz", "tar", "xz"),
+    (".tar", "tar", ""),
+    (".zip", "zip", ""),
+    (".gz", "compressed", "gz"),
+    (".bz2", "compressed", "bz2"),
+    (".xz", "compressed", "xz"),
+)
+
+# Modules reading and writing each compression
+COMPRESSION_MODULES = {"gz": gzip, "bz2": bz2, "xz": lzma}
+
+# Size up to which a tar member is spooled in memory before it is added
+TAR_SPOOL_SIZE = 16 * 1024 * 1024
+
+# Earliest modification time a zip member can have, 1980-01-01
+ZIP_EPOCH = 315532800
+
+# Seconds between checks of followed files for new lines, and of a followed
+# folder or pattern for new files
+FOLLOW_POLL_INTERVAL = 0.25
+FOLLOW_SCAN_INTERVAL = 2.0
+
+# Format of the keyword cache files, which are only used by the same version
+# of the script and Python they were written by
+KEYWORD_CACHE_FORMAT = f"2 {VERSION} {sys.version} {getattr(_sre, 'MAGIC', None)}"
+
+# Number of keyword cache files kept, the least recently written being removed
+KEYWORD_CACHE_FILES = 8
+
+# Whether followed files are kept open between checks. Windows cannot rename
+# a file held open, which would stop the application logging to it rotating it.
+KEEP_FOLLOWED_FILES_OPEN = os.name != "nt"
+
+def get_executable_directory():
+    """
+    Returns the directory where the script or compiled executable is located.
+    This is used to determine where the script resides to find associated files.
+    """
+    if getattr(sys, 'frozen', False):  # Check if running as a compiled executable
+        return os.path.dirname(sys.executable)
+    else:
+        return os.path.dirname(os.path.abspath(__file__))
+
+# Get the folder the compiled keywords are cached in
+def get_keyword_cache_folder():
+    """
+    Returns the folder of the user's cache the compiled keywords are kept in,
+    as the folder of the executable may not be writable.
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ObfuscateLogs")
+
+# Get the compiled code of a regex, for the keyword cache
+def regex_code(source):
+    """
+    Compiles a regex the way re.compile does, with the internals of re, and
+    returns its code, which load_regex can turn back into the regex without
+    parsing and compiling a large source again. Only the keyword cache uses
+    it, so the internals changing in another Python only loses the cache.
+
+    Arguments:
+    source (str): The regex source.
+
+    Returns:
+    tuple: The code, as (flags, code, groups, group index, index group) made only
+           of types marshal can save, or None if it cannot be compiled this way.
+    """
+
+    try:
+        parsed = sre_parse.parse(source, 0)
+        code = sre_compile._code(parsed, 0)
+        state = parsed.state
+        group_index = dict(state.groupdict)
+        index_group = [None] * state.groups
+        for name, index in group_index.items():
+            index_group[index] = name
+        return (state.flags, array.array("I" if _sre.CODESIZE == 4 else "H", code).tobytes(),
+                state.groups - 1, group_index, tuple(index_group))
+    except Exception:
+        return None
+
+# Turn the compiled code of a regex back into the regex
+def load_regex(source, code):
+    """
+    Returns the regex for code from regex_code, of the same Python as the
+    keyword cache format makes sure, compiling the source with re.compile
+    instead if there is no code or it cannot be loaded.
+    """
+    if code is not None:
+        try:
+            flags, code, groups, group_index, index_group = code
+            code = array.array("I" if _sre.CODESIZE == 4 else "H", code).tolist()
+            return _sre.compile(source, flags, code, groups, group_index, index_group)
+        except Exception:
+            pass
+    return re.compile(source)
+
+# Compiled keyword matcher, built once per run from the keywords .ini file
+class KeywordMatcher:
+    """
+    Matches the user defined keywords case-insensitively in a line of text.
+    The keywords are folded into a trie which is compiled into a single regex
+    once, so matching a line costs time in proportion to the length of the
+    line rather than the number of keywords.
+
+    Matches are leftmost-longest. A keyword that begins with a keyword listed
+    earlier in the .ini file could never match with the original alternation
+    regex (the earlier keyword always won), so it is left out of the trie and
+    recorded in 'shadowed'. This keeps the results identical to the original.
+
+    Building the regex for a large keyword file takes seconds, so the values
+    derived from the keywords are kept in 'compiled', and the source of every
+    regex built from them in 'regexes', along with its compiled code once
+    add_regex_code has been called for the keyword cache. The cache saves
+    them and from_cache builds a matcher from them again. They are also what
+    a worker process is sent, loading the regexes from their code.
+
+    Arguments:
+    keywords (dict): The dictionary of lowercase keywords and their replacement values.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = {}
+        self.shadowed = []  # (keyword, earlier keyword) pairs that can never match
+        self.rule_scanners = {}  # RuleScanner for each IPv4 setting, see get_rule_scanner
+        self.compiled = {}  # Values derived from the keywords, by name
+        self.regexes = {}  # (source, code or None) of each regex built from the keywords, by name
+
+        trie = {}
+        for keyword, replacement in keywords.items():
+            if not keyword:
+                continue
+
+            # Walk the trie, looking for an earlier keyword this one starts with
+            node = trie
+            earlier_keyword = None
+            for char in keyword:
+                if None in node:
+                    earlier_keyword = node[None]
+                    break
+                node = node.setdefault(char, {})
+            if earlier_keyword is None and None in node:
+                earlier_keyword = node[None]
+            if earlier_keyword is not None:
+                self.shadowed.append((keyword, earlier_keyword))
+                continue
+
+            node[None] = keyword
+            self.keywords[keyword] = replacement
+
+        # The regex source of the rest of the keywords starting with each character
+        self.branches = {char: self._trie_pattern(child) for char, child in trie.items()}
+        self._compile_pattern()
+
+    @classmethod
+    def from_cache(cls, cached):
+        """
+        Builds a matcher from what to_cache returned for it, without the trie.
+        """
+        keyword_matcher = cls.__new__(cls)
+        keyword_matcher.__setstate__(cached)
+        return keyword_matcher
+
+    def to_cache(self):
+        """
+        Returns everything the matcher was built from and derived, in types marshal can save.
+        """
+        return {
+            "keywords": self.keywords,
+            "shadowed": self.shadowed,
+            "branches": self.branches,
+            "compiled": self.compiled,
+            "regexes": self.regexes,
+        }
+
+    def __getstate__(self):
+        # Sent to worker processes without the regexes, which are loaded from their code
+        return self.to_cache()
+
+    def __setstate__(self, state):
+        self.keywords = state["keywords"]
+        self.shadowed = state["shadowed"]
+        self.branches = state["branches"]
+        self.compiled = state["compiled"]
+        self.regexes = state["regexes"]
+        self.rule_scanners = {}
+        self._compile_pattern()
+
+    def _compile_pattern(self):
+        if not self.keywords:
+            self.pattern = None
+            return
+        branches = [re.escape(char) + self.branches[char] for char in sorted(self.branches)]
+        self.pattern = self.compile("keywords", branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")")
+
+    def compile(self, name, source):
+        """
+        Compiles a regex built from the keywords, loading the code compiled
+        from the same source before if there is any, and keeping the source
+        in 'regexes' under the name.
+
+        Arguments:
+        name (str): The name the regex is kept under.
+        source (str): The regex source.
+
+        Returns:
+        re.Pattern: The compiled regex.
+        """
+        regex_entry = self.regexes.get(name)
+        if regex_entry is not None and regex_entry[0] == source:
+            return load_regex(*regex_entry)
+        self.regexes[name] = (source, None)
+        return re.compile(source)
+
+    def add_regex_code(self):
+        """
+        Adds the compiled code of the regexes kept without it, for the keyword cache.
+
+        Returns:
+        bool: Whether any regex was without its code.
+        """
+        added = False
+        for name, (source, code) in self.regexes.items():
+            if code is None:
+                self.regexes[name] = (source, regex_code(source))
+                added = True
+        return added
+
+    def __len__(self):
+        return len(self.keywords)
+
+    @classmethod
+    def _trie_pattern(cls, node):
+        """
+        Builds the regex source for a trie node. The children of a node all
+        start with different characters, so at most one branch can match and
+        the greedy optional group on a keyword end gives the longest match.
+        """
+        branches = [re.escape(char) + cls._trie_pattern(child)
+                    for char, child in sorted(node.items(), key=lambda item: item[0] or "")
+                    if char is not None]
+        if not branches:
+            return ""
+        if len(branches) == 1 and None not in node:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if None in node else group
+
+    @staticmethod
+    def fold_case(text):
+        """
+        Lowercases the text for matching while keeping every character at the
+        same offset, so matches on the folded text map back to the original.
+        """
+        folded = text.lower()
+        if len(folded) != len(text):
+            folded = "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+        return folded
+
+    def finditer(self, line):
+        """
+        Finds the keywords in a line.
+
+        Arguments:
+        line (str): The line to be searched.
+
+        Returns:
+        iterator: (start, end, keyword) tuples for each match, where keyword is
+                  the lowercase keyword from the .ini file.
+        """
+        if self.pattern is None:
+            return iter(())
+        return ((match.start(), match.end(), match.group(0))
+                for match in self.pattern.finditer(self.fold_case(line)))
+
+    def sub(self, line, on_replace=None):
+        """
+        Replaces every keyword in the line with its replacement value.
+
+        Arguments:
+        line (str): The line to be processed.
+        on_replace (callable): Optional callback, called with the offset, the matched
+                               text and its replacement for every keyword replaced.
+
+        Returns:
+        str: The line with the keywords replaced.
+        """
+        pieces = []
+        last_end = 0
+        for start, end, keyword in self.finditer(line):
+            replacement = self.keywords[keyword]
+            if on_replace:
+                on_replace(start, line[start:end], replacement)
+            pieces.append(line[last_end:start])
+            pieces.append(replacement)
+            last_end = end
+
+        if not pieces:
+            return line
+        pieces.append(line[last_end:])
+        return "".join(pieces)
+
+# Map an offset in a line with replacements made back to the original line
+def get_original_offset(offset, edits):
+    """
+    Maps an offset in a line with replacements made back to the line before
+    them. An offset within a replacement maps to the start of the text it
+    replaced, such as a keyword matched in a generic domain to the domain.
+    
+    Arguments:
+    offset (int): The offset in the line with the replacements made.
+    edits (list): (start, length, replacement length) of each replacement in
+                  line order, the start and length being those of the text replaced.
+    
+    Returns:
+    int: The offset in the line before the replacements.
+    """
+
+    shift = 0
+    for start, length, replacement_length in edits:
+        if offset < start + shift:
+            break
+        if offset < start + shift + replacement_length:
+            return start
+        shift += replacement_length - length
+    return offset - shift
+
+# Scanner applying every obfuscation rule in a single pass over a line
+class RuleScanner:
+    """
+    Applies the HTTP/HTTPS URL, IPv4 address and keyword rules to a line in a
+    single pass of one compiled regex, instead of a separate re.sub per rule.
+
+    The regex works on the lowercased line so the keywords match regardless
+    of case. Its alternatives are grouped by their first character, with the
+    rules in their original order of precedence (URL, IPv4, keyword) inside
+    each group, which lets the regex engine skip straight to the characters
+    that can start a match.
+
+    The rules used to run one after another, each on the output of the last,
+    so keywords were also matched within the generic domains and IPs and the
+    IPs within URL paths. The scanner keeps those results by applying the
+    later rules within each replacement and numbering the domains before the
+    IPs. It falls back to running the rules one after another for the rare
+    lines where a single pass could differ:
+    - lines with non-ASCII characters, where lowercasing is not one-to-one
+    - a URL scheme that is not lowercase, e.g. 'HTTP://'
+    - a URL on a line skipped for IPv4 because of 'version' or '.dll', which
+      may only be in the URL's domain
+    - a matched keyword that a URL or IPv4 address could start inside of
+    When some keyword could run across the edge of a generic replacement, the
+    keywords on lines with a URL or IP are matched after the replacements.
+
+    Each line is first checked with cheap prefilters, a substring check for
+    '://' and a count of the dots an IPv4 address needs. Lines that can hold
+    neither go straight to the keyword regex, which already skips to the
+    characters keywords start with. The number of lines seen and passed by
+    each prefilter are kept in 'counts' for the run report.
+
+    Arguments:
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    """
+
+    def __init__(self, keyword_matcher, ipv4=False):
+        self.keyword_matcher = keyword_matcher
+        self.ipv4 = ipv4
+        edges = keyword_matcher.compiled.get("edge keywords")
+        if edges is None:
+            hiding_keywords = {keyword for keyword in keyword_matcher.keywords if self._may_hide_match(keyword)}
+            edges = keyword_matcher.compiled["edge keywords"] = (hiding_keywords, bool(hiding_keywords) or any(
+                self._may_span_replacement(keyword) for keyword in keyword_matcher.keywords))
+        self.hiding_keywords, self.edge_keywords = edges
+        self.scanners = {}  # (regex, rule of each marker group) by whether IPv4 is scanned for
+        self.counts = self._new_counts()
+
+    @staticmethod
+    def _is_word_char(char):
+        return char.isalnum() or char == "_"
+
+    @classmethod
+    def _may_hide_match(cls, keyword):
+        """
+        Checks whether a URL or IPv4 address could start inside the keyword,
+        which the single pass would miss once the keyword had matched.
+        """
+        for i in range(1, len(keyword)):
+            tail = keyword[i:]
+            if tail.startswith(("http://", "https://")) or "https://".startswith(tail) or "http://".startswith(tail):
+                return True
+            if tail[0].isdigit() and not cls._is_word_char(keyword[i - 1]):
+                return True
+        return False
+
+    @classmethod
+    def _may_span_replacement(cls, keyword):
+        """
+        Checks whether the keyword could run out of the end of a generic
+        domain or IP, or out of a URL path into the whitespace after it.
+        """
+        for i in range(1, len(keyword)):
+            head, tail = keyword[:i], keyword[i:]
+            if tail[0].isspace() and not head[-1].isspace():
+                return True
+            if DOMAIN_REPLACEMENT_END_REGEX.fullmatch(head) and not re.match(r"[a-z0-9./-]", tail):
+                return True
+            if IPV4_REPLACEMENT_END_REGEX.fullmatch(head) and not cls._is_word_char(tail[0]):
+                return True
+        return False
+
+    def _scanner(self, ipv4):
+        """
+        Builds the single-pass regex for the enabled rules, once. Each
+        alternative ends with an empty marker group whose index identifies
+        the rule that matched.
+        """
+        scanner = self.scanners.get(ipv4)
+        if scanner is not None:
+            return scanner
+
+        keyword_branches = self.keyword_matcher.branches
+        first_chars = set(keyword_branches) | {"h"}
+        if ipv4:
+            first_chars |= set(string.digits)
+
+        alternatives = []
+        marker_rules = {}
+        for char in sorted(first_chars):
+            branches = []
+            if char == "h":
+                branches.append((r"ttps?://(?P<domain>[a-zA-Z0-9.-]+)(?P<path>/[^\s]*)?", URL_RULE))
+            if ipv4 and char in string.digits:
+                # The lookbehind is the \b before the first digit
+                branches.append((r"(?<!\w.)\d{0,2}\.(?:\d{1,3}\.){2}\d{1,3}\b", IPV4_RULE))
+            if char in keyword_branches:
+                branches.append((keyword_branches[char], KEYWORD_RULE))
+
+            parts = []
+            for pattern, rule in branches:
+                marker = f"rule{len(marker_rules)}"
+                marker_rules[marker] = rule
+                parts.append(f"{pattern}(?P<{marker}>)")
+            alternatives.append(re.escape(char) + "(?:" + "|".join(parts) + ")")
+
+        regex = self.keyword_matcher.compile(f"scanner ipv4={ipv4}", "|".join(alternatives))
+        group_rules = {regex.groupindex[marker]: rule for marker, rule in marker_rules.items()}
+        scanner = self.scanners[ipv4] = (regex, group_rules)
+        return scanner
+
+    def obfuscate_line(self, line):
+        """
+        Applies the enabled rules to a line.
+
+        Arguments:
+        line (str): The line to be processed.
+
+        Returns:
+        tuple: The obfuscated line and a list of the changes made, as (rule,
+               offset, before, after) tuples.
+        """
+        counts = self.counts
+        counts["lines"] += 1
+        if not line.isascii():
+            counts["in passes"] += 1
+            return self.obfuscate_line_in_passes(line)
+
+        # Prefilter the rules the line could match
+        url = "://" in line
+        ipv4 = self.ipv4 and line.count(".") >= 3
+        if url:
+            counts["url candidates"] += 1
+        if ipv4:
+            counts["ipv4 candidates"] += 1
+        if not (url or ipv4):
+            # Only the keywords can match, which the keyword regex does on its own
+            counts["keywords only"] += 1
+            return self.obfuscate_line_in_passes(line)
+
+        folded = line.lower()
+        skipped_ipv4 = ipv4 and ('version' in folded or '.dll' in folded)
+        ipv4 = ipv4 and not skipped_ipv4
+        regex, group_rules = self._scanner(ipv4)
+        hits = []  # (rule, match) in line order
+        for match in regex.finditer(folded):
+            rule = group_rules[match.lastindex]
+            if (rule is KEYWORD_RULE and match.group(0) in self.hiding_keywords
+                    or rule is URL_RULE and (skipped_ipv4 or not line.startswith(("http://", "https://"), match.start()))):
+                counts["in passes"] += 1
+                return self.obfuscate_line_in_passes(line)
+            hits.append((rule, match))
+
+        if not hits:
+            return line, []
+
+        # Number the domains, then the IPs, in the order the rules ran in. The IPs
+        # include any in a URL once its domain is replaced, e.g. in the path.
+        replaced_urls = {}  # URL with its domain replaced, the generic domain and the IPv4 matches in it, by offset
+        for rule, match in hits:
+            if rule is URL_RULE:
+                start, end = match.span()
+                domain_start, domain_end = match.span("domain")
+                generic_domain = replacement_map.get(line[domain_start:domain_end], DOMAIN_TEMPLATE)
+                url = line[start:domain_start] + generic_domain + line[domain_end:end]
+                ips = []
+                if ipv4:
+                    # Include the next character of the line for the \b at the end of an IP
+                    context = url + line[end:end + 1]
+                    ips = [ip for ip in IPV4_REGEX.finditer(context) if ip.end() <= len(url)]
+                replaced_urls[start] = (url, generic_domain, ips)
+        ip_replacements = {}
+        for rule, match in hits:
+            if rule is URL_RULE:
+                for ip in replaced_urls[match.start()][2]:
+                    replacement_map.get(ip.group(0), IPV4_TEMPLATE)  # Looked up again when rebuilding
+            elif rule is IPV4_RULE:
+                ip_replacements[match.start()] = replacement_map.get(line[match.start():match.end()], IPV4_TEMPLATE)
+
+        # Rebuild the line, applying the later rules within each replacement. Every
+        # change is given its offset in the original line (see get_original_offset).
+        changes = []
+        edits = []  # (start, length, replacement length) of the domains and IPs replaced
+        keywords_after = self.edge_keywords and len(replaced_urls) + len(ip_replacements) > 0
+        pieces = []
+        last_end = 0
+        for rule, match in hits:
+            start, end = match.span()
+            pieces.append(line[last_end:start])
+            last_end = end
+            before = line[start:end]
+
+            if rule is KEYWORD_RULE:
+                if keywords_after:
+                    pieces.append(before)
+                    continue
+                after = self.keyword_matcher.keywords[match.group(0)]
+                changes.append((KEYWORD_RULE, start, before, after))
+                pieces.append(after)
+                continue
+
+            if rule is IPV4_RULE:
+                after = ip_replacements[start]
+                changes.append((IPV4_RULE, start, before, after))
+                replaced = [(start, end - start, len(after))]
+            else:
+                url, generic_domain, ips = replaced_urls[start]
+                domain_start, domain_end = match.span("domain")
+                changes.append((URL_RULE, domain_start, line[domain_start:domain_end], generic_domain))
+                replaced = [(domain_start, domain_end - domain_start, len(generic_domain))]
+                after = []
+                url_end = 0
+                for ip in ips:
+                    generic_ip = replacement_map.get(ip.group(0), IPV4_TEMPLATE)
+                    ip_start = get_original_offset(start + ip.start(), replaced[:1])
+                    changes.append((IPV4_RULE, ip_start, ip.group(0), generic_ip))
+                    replaced.append((ip_start, ip.end() - ip.start(), len(generic_ip)))
+                    after += [url[url_end:ip.start()], generic_ip]
+                    url_end = ip.end()
+                after.append(url[url_end:])
+                after = "".join(after)
+            edits += replaced
+
+            if not keywords_after:
+                # The keyword offsets in the replacement are mapped as if it started the line
+                after = self.keyword_matcher.sub(after, lambda offset, keyword, replacement: changes.append(
+                    (KEYWORD_RULE, get_original_offset(start + offset, replaced), keyword, replacement)))
+            pieces.append(after)
+        pieces.append(line[last_end:])
+        new_line = "".join(pieces)
+
+        if keywords_after:
+            new_line = self.keyword_matcher.sub(new_line, lambda offset, keyword, replacement: changes.append(
+                (KEYWORD_RULE, get_original_offset(offset, edits), keyword, replacement)))
+
+        return new_line, changes
+
+    @staticmethod
+    def _new_counts():
+        # A plain dict, as incrementing a Counter costs as much as a prefilter
+        return dict.fromkeys(("lines", "url candidates", "ipv4 candidates", "keywords only", "in passes", "cloned files")
+                             + tuple(MATCH_COUNTS.values()), 0)
+
+    def pop_counts(self):
+        """
+        Returns the prefilter and match counts so far and starts them again from zero.
+        """
+        counts = self.counts
+        self.counts = self._new_counts()
+        return counts
+
+    def may_change(self, text):
+        """
+        Checks whether any rule could change ASCII text, searching all of it
+        at once rather than a line at a time. Anything a rule could match on
+        one of its lines is found, but a match found is not always changed.
+
+        Arguments:
+        text (str): Whole lines of ASCII text.
+
+        Returns:
+        bool: Whether the text holds something a rule could change.
+        """
+        if "://" in text:
+            return True
+        if self.ipv4 and IPV4_CANDIDATE_REGEX.search(text):
+            return True
+        return next(self.keyword_matcher.finditer(text), None) is not None
+
+    def obfuscate_line_in_passes(self, line):
+        """
+        Applies the enabled rules to a line one after another, each on the
+        output of the last.
+
+        Arguments:
+        line (str): The line to be processed.
+
+        Returns:
+        tuple: The obfuscated line and a list of the changes made, as (rule,
+               offset, before, after) tuples.
+        """
+        changes = []
+        line = obfuscate_http_https_urls(line, None, None, changes)
+        url_changes = len(changes)
+        if self.ipv4:
+            line = obfuscate_ipv4_addresses(line, None, None, changes)
+        ipv4_changes = len(changes)
+        line = obfuscate_keywords(line, None, None, self.keyword_matcher, changes=changes)
+
+        # Each rule gave offsets in the output of the last, so map them back to the original line
+        if url_changes < len(changes) and (url_changes or ipv4_changes < len(changes)):
+            url_edits = [(offset, len(before), len(after)) for rule, offset, before, after in changes[:url_changes]]
+            ipv4_edits = [(offset, len(before), len(after)) for rule, offset, before, after in changes[url_changes:ipv4_changes]]
+            for index in range(url_changes, len(changes)):
+                rule, offset, before, after = changes[index]
+                if index >= ipv4_changes:
+                    offset = get_original_offset(offset, ipv4_edits)
+                changes[index] = (rule, get_original_offset(offset, url_edits), before, after)
+        return line, changes
+
+# Get the rule scanner for the keywords, built once per run
+def get_rule_scanner(keyword_matcher, ipv4=False):
+    """
+    Returns the RuleScanner for the keywords and IPv4 setting, building it
+    the first time it is needed and keeping it with the keyword matcher.
+    
+    Arguments:
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    
+    Returns:
+    RuleScanner: The rule scanner.
+    """
+
+    rule_scanner = keyword_matcher.rule_scanners.get(ipv4)
+    if rule_scanner is None:
+        rule_scanner = keyword_matcher.rule_scanners[ipv4] = RuleScanner(keyword_matcher, ipv4)
+    return rule_scanner
+
+# Log how well the prefilters did over the run
+def log_prefilter_counts(counts):
+    """
+    Logs the share of lines that were candidates for the URL and IPv4 rules
+    and the share left for the keyword regex alone.
+    
+    Arguments:
+    counts (dict): The counts kept by the RuleScanner.
+    """
+
+    lines = counts["lines"]
+    if not lines:
+        return
+
+    def share(key):
+        return f"{counts[key] / lines:.1%}"
+
+    logging.info(
+        f"Prefilters over {lines} lines: URL candidates {share('url candidates')}, "
+        f"IPv4 candidates {share('ipv4 candidates')}, keywords only {share('keywords only')}, "
+        f"processed rule by rule {share('in passes')}."
+    )
+
+# read in the user defined keywords ini file
+def load_keywords_from_file(ini_filepath, script_filename, use_cache=True, ipv4=None):
+    """
+    Loads keyword/replacement pairs from a specified .ini file or a default file.
+    If the file doesn't exist, it creates one with a default template for easy customization.
+    
+    The compiled keywords are cached under the hash of the file's content, so
+    a later run with the same file loads them instead of compiling them again.
+    Given the IPv4 setting of the run, the rule scanner for it is compiled
+    too, and added to the cache if it is not cached yet.
+    
+    Arguments:
+    ini_filepath (str): Path to the user-defined .ini file (optional).
+    script_filename (str): The filename of the script, used to generate default paths.
+    use_cache (bool): Whether to load the compiled keywords from the cache, and
+                      save them to it when they are compiled (default: True).
+    ipv4 (bool): Whether the run obfuscates IPv4 addresses, or None to only
+                 compile the keywords (default: None).
+    
+    Returns:
+    KeywordMatcher: The compiled matcher for the keywords and their corresponding replacement values.
+    """
+
+    import configparser
+    config = configparser.ConfigParser()
+    config.optionxform = str  # Preserve case sensitivity for sections
+    keywords = {}
+
+    # If no .ini file is provided, use the default one based on the script name
+    if not ini_filepath:
+        exe_dir = get_executable_directory()
+        ini_filepath = os.path.join(exe_dir, os.path.splitext(os.path.basename(script_filename))[0] + '.ini')
+
+    # If the file doesn't exist, create it with a default comment and example sections
+    if not os.path.exists(ini_filepath):
+        print(f"{ini_filepath} not found. Creating a new blank keyword file.")
+        with open(ini_filepath, 'w') as f:
+            f.write("# This file contains keyword=replacement pairs organized by sections.\n")
+            f.write("[servers]\nserver1=generic_server1\nserver2=generic_server2\n\n")
+            f.write("[users]\nadmin=generic_admin\nguest=generic_guest\n\n")
+            f.write("[general]\npassword=obfuscated_password\nemail=obfuscated_email\n")
+        return KeywordMatcher({})
+
+    cache_path = None
+    if use_cache:
+        with open(ini_filepath, "rb") as ini_file:
+            content_hash = hashlib.sha256(ini_file.read() + KEYWORD_CACHE_FORMAT.encode()).hexdigest()
+        cache_path = os.path.join(get_keyword_cache_folder(), f"keywords_{content_hash[:32]}.cache")
+        cached = load_keyword_cache(cache_path)
+        if cached is not None:
+            keyword_matcher, duplicates, unique_keywords = cached
+            log_keyword_warnings(keyword_matcher, duplicates)
+            if ipv4 is not None:
+                get_rule_scanner(keyword_matcher, ipv4)._scanner(ipv4)
+            if keyword_matcher.add_regex_code():  # The scanner of the run was not cached yet
+                save_keyword_cache(cache_path, keyword_matcher, duplicates, unique_keywords)
+            logging.info(f"Loaded {unique_keywords} unique keywords from {ini_filepath}, compiled by an earlier run.")
+            return keyword_matcher
+
+    # Read the file using configparser
+    config.read(ini_filepath)
+
+    # Combine all sections into a single dictionary
+    duplicates = []  # (keyword, section) of each duplicate ignored
+    for section in config.sections():
+        for keyword, replacement in config.items(section):
+            lower_keyword = keyword.strip().lower()
+            if lower_keyword in keywords:
+                duplicates.append((keyword, section))
+            else:
+                keywords[lower_keyword] = replacement.strip()
+
+    keyword_matcher = KeywordMatcher(keywords)
+    log_keyword_warnings(keyword_matcher, duplicates)
+
+    if cache_path is not None:
+        # Compile the scanner of the run now, for the cache to hold it
+        if ipv4 is not None:
+            get_rule_scanner(keyword_matcher, ipv4)._scanner(ipv4)
+        keyword_matcher.add_regex_code()
+        save_keyword_cache(cache_path, keyword_matcher, duplicates, len(keywords))
+
+    logging.info(f"Loaded {len(keywords)} unique keywords from {ini_filepath}.")
+    return keyword_matcher
+
+# Warn about keywords that were ignored or can never match
+def log_keyword_warnings(keyword_matcher, duplicates):
+    """
+    Prints and logs a warning for every duplicate keyword and every keyword
+    another keyword always matches instead of.
+    
+    Arguments:
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    duplicates (list): The (keyword, section) of each duplicate keyword ignored.
+    """
+
+    for keyword, section in duplicates:
+        message = f"Duplicate keyword ignored: '{keyword}' in section [{section}]"
+        print(f"Warning: {message}")
+        logging.warning(message)
+    for keyword, earlier_keyword in keyword_matcher.shadowed:
+        message = f"Keyword '{keyword}' can never match, it always starts with earlier keyword '{earlier_keyword}'"
+        print(f"Warning: {message}")
+        logging.warning(message)
+
+# Load compiled keywords from the cache
+def load_keyword_cache(cache_path):
+    """
+    Reads the compiled keywords of a keyword file from the cache.
+    
+    Arguments:
+    cache_path (str): The path to the cache file of the keyword file's content.
+    
+    Returns:
+    tuple: The KeywordMatcher, the (keyword, section) of each duplicate keyword
+           and the number of unique keywords, or None if the keywords are not
+           cached or cannot be read.
+    """
+
+    try:
+        with open(cache_path, "rb") as cache_file:
+            cached = marshal.loads(cache_file.read())  # Much faster than reading from the file
+        if cached["format"] != KEYWORD_CACHE_FORMAT:
+            return None
+        keyword_matcher = KeywordMatcher.from_cache(cached["matcher"])
+        os.utime(cache_path)  # Kept as recently used when old cache files are removed
+        return keyword_matcher, cached["duplicates"], cached["unique_keywords"]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable keyword cache {cache_path}: {e}")
+        return None
+
+# Save compiled keywords to the cache
+def save_keyword_cache(cache_path, keyword_matcher, duplicates, unique_keywords):
+    """
+    Writes the compiled keywords of a keyword file to the cache, removing
+    the oldest cache files beyond KEYWORD_CACHE_FILES. A cache that cannot
+    be written is only logged, as the keywords are compiled again next time.
+    
+    Arguments:
+    cache_path (str): The path to the cache file of the keyword file's content.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    duplicates (list): The (keyword, section) of each duplicate keyword ignored.
+    unique_keywords (int): The number of unique keywords in the file.
+    """
+
+    cache_folder = os.path.dirname(cache_path)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        with open(temp_path, "wb") as cache_file:
+            marshal.dump({"format": KEYWORD_CACHE_FORMAT, "matcher": keyword_matcher.to_cache(),
+                          "duplicates": duplicates, "unique_keywords": unique_keywords}, cache_file)
+        os.replace(temp_path, cache_path)
+
+        cache_files = sorted(glob.glob(os.path.join(cache_folder, "keywords_*.cache")), key=os.path.getmtime)
+        for old_path in cache_files[:-KEYWORD_CACHE_FILES]:
+            os.remove(old_path)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Cannot save the keyword cache {cache_path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# Setup logging
+def setup_logging(output_folder):
+    """
+    Sets up logging configuration to record the obfuscation process.
+    
+    Arguments:
+    output_folder (str): The directory where log files will be stored.
+    
+    Returns:
+    str: The path to the log file created.
+    """
+    
+    log_filename = os.path.join(output_folder, f"__obfuscation_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+    logging.basicConfig(
+        filename=log_filename,
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+ 
+    # Add a console handler for real-time output
+    #console_handler = logging.StreamHandler()
+    #console_handler.setLevel(logging.DEBUG)
+    #console_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    #console_handler.setFormatter(console_formatter)
+    #logging.getLogger().addHandler(console_handler)
+
+    logging.info("Log file initialized.")
+    return log_filename 
+
+# Write detailed changes to a JSON Lines file
+class ChangeLogHandler(logging.Handler):
+    """
+    Writes the batches of changes logged by log_changes to a JSON Lines
+    file, one object per change with the file, line, rule, offset, original
+    text and replacement, e.g.
+    {"file": "app.log", "line": 12, "rule": "ipv4", "offset": 31, "before": "10.1.2.3", "after": "192.0.2.2"}
+
+    The offset is where the text changed starts in the original line, before
+    any rule ran. A change made inside the replacement of another, such as a
+    keyword matched in a generic domain, is given the offset of the text that
+    replacement stands for (see get_original_offset).
+
+    Arguments:
+    path (str): The path to the JSON Lines file.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.stream = open(path, "w", encoding="utf-8")
+
+    def emit(self, record):
+        try:
+            file_path = record.changed_file
+            self.stream.write("".join(
+                json.dumps({
+                    "file": file_path, "line": line_number, "rule": RULE_NAMES[rule],
+                    "offset": offset, "before": before, "after": after,
+                }) + "\n"
+                for line_number, rule, offset, before, after in record.changes
+            ))
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            self.stream.close()
+        finally:
+            self.release()
+        super().close()
+
+# Setup the change log for detailed logging
+def setup_change_log(output_folder):
+    """
+    Sets up the change log detailed changes are written to. The changes
+    logger only puts each batch on a queue, which a background thread drains
+    to the file, so the obfuscation never waits on the writes.
+    
+    Arguments:
+    output_folder (str): The directory where the change log will be stored.
+    
+    Returns:
+    tuple: The path to the change log and the QueueListener writing it, to
+           be stopped at the end of the run.
+    """
+
+    change_log = os.path.join(output_folder, f"__obfuscation_changes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+    change_queue = queue.SimpleQueue()
+    changes_logger = logging.getLogger(CHANGES_LOGGER)
+    changes_logger.propagate = False
+    changes_logger.setLevel(logging.INFO)
+    changes_logger.handlers[:] = [logging.handlers.QueueHandler(change_queue)]
+
+    listener = logging.handlers.QueueListener(change_queue, ChangeLogHandler(change_log))
+    listener.start()
+    return change_log, listener
+
+# Leave out the detailed changes already logged
+class ChangesAfterLine(logging.Filter):
+    """
+    Drops the changes to the lines up to a line number from the batches of
+    detailed changes, when a file's lines are obfuscated again.
+
+    Arguments:
+    line_number (int): The last line whose changes have been logged.
+    """
+
+    def __init__(self, line_number):
+        super().__init__()
+        self.line_number = line_number
+
+    def filter(self, record):
+        record.changes = [change for change in record.changes if change[0] > self.line_number]
+        return bool(record.changes)
+
+# Hand the records of worker processes to the logger they were logged to
+class DispatchHandler(logging.Handler):
+    """
+    Handles a record from a worker process with the logger of the same name in
+    this process, so the detailed changes go to the change log and everything
+    else to the run's log file.
+    """
+
+    def handle(self, record):
+        logging.getLogger(record.name).handle(record)
+        return True
+
+    def emit(self, record):
+        pass
+
+# Start logging the records of worker processes
+def start_log_listener(log_queue):
+    """
+    Starts the listener logging the records the worker processes of a
+    parallel run put on the log queue.
+    
+    Arguments:
+    log_queue (Queue): The queue the workers' QueueHandlers put records on.
+    
+    Returns:
+    QueueListener: The started listener, to be stopped once the workers are done.
+    """
+
+    listener = logging.handlers.QueueListener(log_queue, DispatchHandler())
+    listener.start()
+    return listener
+
+# Ensure the output folder exists
+def ensure_output_folder(output_folder):
+    """
+    Ensures that the output folder exists. If not, it creates the folder.
+    Folders made or found are remembered, so only the first call for each
+    touches the disk.
+    
+    Arguments:
+    output_folder (str): The path to the output folder.
+    
+    Raises:
+    Exception: If there is an error while creating the output folder.
+    """
+
+    if not output_folder or output_folder in output_folders_made:
+        return  # The current folder, or one already made
+    try:
+        os.makedirs(output_folder, exist_ok=True)
+    except Exception as e:
+        logging.error(f"Error creating output folder {output_folder}: {e}")
+        raise
+    output_folders_made.add(output_folder)
+
+# Primary obfuscation function
+def obfuscate_content(content, file_path, keyword_matcher, detailed_logging=False, ipv4=False):
+    """
+    Processes the content of a file to identify and obfuscate sensitive data.
+    Logs changes with before/after values, line numbers, and the type of obfuscation performed
+    if detailed_logging is True.
+    
+    Arguments:
+    content (str): The content of the file to be obfuscated.
+    file_path (str): The path to the file being processed.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    
+    Returns:
+    str: The obfuscated content.
+    """
+    
+    #lines = content.splitlines()
+    # Explicitly split content only on newlines to preserve other characters
+    lines = content.split("\n")  # Explicitly use "\n" to avoid splitting on other special characters
+    #logging.debug(f"Split lines from content: {lines}")
+
+    return "\n".join(obfuscate_lines(lines, file_path, keyword_matcher, detailed_logging, ipv4))
+
+# Obfuscate a sequence of lines
+def obfuscate_lines(lines, file_path, keyword_matcher, detailed_logging=False, ipv4=False, first_line_number=1):
+    """
+    Obfuscates each line in turn, yielding the obfuscated lines as it goes so
+    a file can be streamed through without holding all of its lines.
+    Logs the changes made in batches if detailed_logging is True.
+    
+    Arguments:
+    lines (iterable): The lines to be obfuscated, without their newlines.
+    file_path (str): The path to the file being processed.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    first_line_number (int): The line number of the first line (default: 1).
+    
+    Returns:
+    iterator: The obfuscated lines.
+    """
+
+    rule_scanner = get_rule_scanner(keyword_matcher, ipv4)
+
+    if not detailed_logging:
+        for line in lines:
+            # Apply every rule in a single pass of the compiled scanner
+            line, changes = rule_scanner.obfuscate_line(line)
+            for change in changes:
+                rule_scanner.counts[MATCH_COUNTS[change[0]]] += 1
+            yield line
+        return
+
+    # Send the changes to the change log in batches, one entry per change
+    batch = []
+    for line_number, line in enumerate(lines, start=first_line_number):
+        line, changes = rule_scanner.obfuscate_line(line)
+        if changes:
+            for change in changes:
+                rule_scanner.counts[MATCH_COUNTS[change[0]]] += 1
+            batch.extend((line_number,) + change for change in changes)
+            if len(batch) >= CHANGES_PER_RECORD:
+                log_changes(file_path, batch)
+                batch = []
+        yield line
+    if batch:
+        log_changes(file_path, batch)
+
+# Send a batch of detailed changes to the change log
+def log_changes(file_path, changes):
+    """
+    Logs a batch of changes made to a file as a single record of the changes
+    logger, which carries the changes as they are for the change log to
+    write out (see ChangeLogHandler).
+    
+    Arguments:
+    file_path (str): The path to the file being processed.
+    changes (list): (line number, rule, offset, before, after) tuples.
+    """
+
+    start = time.perf_counter()
+    logging.getLogger(CHANGES_LOGGER).info(
+        f"{len(changes)} changes in {file_path}", extra={"changed_file": file_path, "changes": changes})
+    file_stats["log"] += time.perf_counter() - start
+
+# Read the next chunk of a file, timed for the run report
+def read_chunk(input_file, size=CHUNK_SIZE):
+    """
+    Reads up to size bytes, or characters from a text file, adding the time
+    taken to the read stage of the file.
+    
+    Arguments:
+    input_file (file): The file to read from.
+    size (int): The most to read (default: CHUNK_SIZE).
+    
+    Returns:
+    bytes: The chunk read, empty at the end of the file.
+    """
+
+    start = time.perf_counter()
+    chunk = input_file.read(size)
+    file_stats["read"] += time.perf_counter() - start
+    return chunk
+
+# Write to a file, timed for the run report
+def write_chunk(output_file, data):
+    """
+    Writes the data, adding the time taken to the write stage of the file.
+    
+    Arguments:
+    output_file (file): The file to write to.
+    data (bytes): The data, or text for a text file.
+    """
+
+    start = time.perf_counter()
+    output_file.write(data)
+    file_stats["write"] += time.perf_counter() - start
+
+# Copy the rest of a file to the output, by the kernel where it can
+def copy_file_tail(input_file, output_file, offset=None):
+    """
+    Copies the input from the offset to its end onto the output. Between two
+    files on disk the copy is made by the kernel with os.copy_file_range or
+    os.sendfile, so the bytes never pass through Python. Otherwise, such as on
+    Windows or for the members of an archive or a compressed file, blocks are
+    read into a single buffer that is reused for every block and written from
+    a view of it.
+    
+    Arguments:
+    input_file (file): The file to copy from, opened in binary mode.
+    output_file (file): The file to copy to, opened in binary mode.
+    offset (int): Where to copy from, None to copy from the input's current
+                  position (default: None).
+    """
+
+    start = time.perf_counter()
+    input_fd = output_fd = None
+    # A compressed file gives the descriptor of the file it decompresses or compresses, so only plain files qualify
+    if all(isinstance(getattr(file, "raw", file), io.FileIO) for file in (input_file, output_file)):
+        try:
+            input_fd, output_fd = input_file.fileno(), output_file.fileno()
+        except (OSError, ValueError):
+            pass
+
+    if offset is not None and input_fd is not None:
+        output_file.flush()  # The kernel writes at the end of what has been flushed
+        for copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+            if copy is None:
+                continue
+            try:
+                while True:
+                    if copy is os.sendfile:
+                        copied = os.sendfile(output_fd, input_fd, offset, CHUNK_SIZE)
+                    else:
+                        copied = copy(input_fd, output_fd, CHUNK_SIZE, offset)
+                    if not copied:
+                        file_stats["copy_binary"] += time.perf_counter() - start
+                        return
+                    offset += copied
+            except OSError:
+                continue  # Not supported between these files, what was copied stays
+
+    if offset is not None:
+        input_file.seek(offset)
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        size = input_file.readinto(buffer)
+        if not size:
+            break
+        output_file.write(view[:size])
+    file_stats["copy_binary"] += time.perf_counter() - start
+
+# Split a stream of text into lines
+def iter_lines(chunks):
+    """
+    Splits a stream of text chunks only on newlines, the same as str.split("\n")
+    on the whole text would, so the last (possibly empty) line is always included.
+    
+    Arguments:
+    chunks (iterable): The chunks of text.
+    
+    Returns:
+    iterator: The lines, without their newlines.
+    """
+
+    pending = []  # Pieces of a line spanning several chunks
+    for chunk in chunks:
+        if "\n" not in chunk:
+            if chunk:
+                pending.append(chunk)
+            continue
+        lines = chunk.split("\n")
+        if pending:
+            pending.append(lines[0])
+            lines[0] = "".join(pending)
+            pending = []
+        pending.append(lines.pop())
+        yield from lines
+    yield "".join(pending)
+
+# Regroup a stream of text into blocks of whole lines
+def iter_line_blocks(chunks):
+    """
+    Regroups a stream of text or bytes chunks into blocks that each end with
+    a newline, apart from the last, which holds what follows the last newline
+    and is left out if empty. The pieces of a line spanning several chunks
+    are kept in a list and joined once its newline comes, so a very long line,
+    or a stream without any newline, costs time in proportion to its length.
+    
+    Arguments:
+    chunks (iterable): The chunks of text or bytes.
+    
+    Returns:
+    iterator: The blocks of whole lines.
+    """
+
+    pending = []  # Pieces of a line spanning several chunks
+    for chunk in chunks:
+        line_end = chunk.rfind("\n" if isinstance(chunk, str) else b"\n") + 1
+        if not line_end:
+            if chunk:
+                pending.append(chunk)
+            continue
+        if pending:
+            pending.append(chunk[:line_end])
+            yield chunk[:0].join(pending)
+            pending = []
+        else:
+            yield chunk[:line_end]
+        if line_end < len(chunk):
+            pending.append(chunk[line_end:])
+    if pending:
+        yield pending[0][:0].join(pending)
+
+# Join a stream of lines back together
+def iter_joined_lines(lines):
+    """
+    Joins the lines with newlines, the same as "\n".join(lines), yielding the
+    text in blocks of LINES_PER_WRITE lines to be written out.
+    
+    Arguments:
+    lines (iterable): The lines, without their newlines.
+    
+    Returns:
+    iterator: Blocks of the joined text.
+    """
+
+    batch = []
+    separator = ""
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= LINES_PER_WRITE:
+            yield separator + "\n".join(batch)
+            separator = "\n"
+            batch = []
+    if batch:
+        yield separator + "\n".join(batch)
+
+# Obfuscate a stream of log data fed a block at a time
+class Obfuscator:
+    """
+    Obfuscates log text fed to it a block of bytes at a time, such as from a
+    pipe or socket, for other Python code to use without the per-file set up
+    of process_file. The rules are compiled once, when it is created, and
+    each line is obfuscated as soon as its newline arrives:
+
+        obfuscator = Obfuscator(load_keywords_from_file("keywords.ini", __file__), ipv4=True)
+        for data in blocks:
+            obfuscator.feed(data)
+            for line in obfuscator.iter_lines():
+                send(line)
+        obfuscator.close()
+        for line in obfuscator.iter_lines():
+            send(line)
+
+    Domains and IPs are replaced through the module's replacement_map, so
+    they map to the same replacements for every Obfuscator in the process.
+
+    Arguments:
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values (default: None, no keywords).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    encoding (str): The encoding of the data, detected from the first block if not given (default: None).
+    name (str): The name the data is logged with in detailed changes (default: '<stream>').
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    """
+
+    def __init__(self, keyword_matcher=None, ipv4=False, encoding=None, name="<stream>", detailed_logging=False):
+        self.keyword_matcher = keyword_matcher if keyword_matcher is not None else KeywordMatcher({})
+        self.ipv4 = ipv4
+        self.name = name
+        self.detailed_logging = detailed_logging
+        self.encoding = None
+        self.decoder = None
+        if encoding is not None:
+            self._start_decoding(encoding)
+        self.line_number = 1
+        self.pending = ""  # The start of a line whose newline is still to come
+        self.ready = []  # Obfuscated lines not yet taken by iter_lines
+
+        get_rule_scanner(self.keyword_matcher, ipv4)  # Compile the rules now, not for the first line
+
+    def feed(self, data):
+        """
+        Adds a block of data, obfuscating the lines it completes.
+
+        Arguments:
+        data (bytes): The next block of data.
+        """
+        if not data:
+            return
+        if self.decoder is None:
+            # The start of a stream is often all ASCII, so decode it as UTF-8,
+            # of which ASCII is a subset, in case other characters follow
+            encoding = detect_encoding(self.name, data[:ENCODING_SAMPLE_SIZE]).lower()
+            self._start_decoding("utf-8" if encoding == "ascii" else encoding)
+
+        lines = (self.pending + self.decoder.decode(data)).split("\n")
+        self.pending = lines.pop()
+        if lines:
+            self._obfuscate(lines, "\n")
+
+    def close(self):
+        """
+        Marks the end of the data, obfuscating the last line even without its newline.
+        """
+        if self.decoder is not None:
+            self.pending += self.decoder.decode(b"", final=True)
+        if self.pending:
+            self._obfuscate([self.pending], "")
+            self.pending = ""
+
+    def iter_lines(self):
+        """
+        Yields the lines obfuscated since the last call, each with its newline
+        apart from a last line without one, obfuscated by close.
+
+        Returns:
+        iterator: The obfuscated lines.
+        """
+        lines, self.ready = self.ready, []
+        return iter(lines)
+
+    def _start_decoding(self, encoding):
+        self.encoding = encoding
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+
+    def _obfuscate(self, lines, end):
+        obfuscated_lines = list(obfuscate_lines(
+            lines, self.name, self.keyword_matcher, self.detailed_logging, self.ipv4, self.line_number,
+        ))
+        self.line_number += len(lines)
+        last_line = obfuscated_lines.pop()
+        self.ready.extend(line + "\n" for line in obfuscated_lines)
+        self.ready.append(last_line + end)
+
+# Obfuscate standard input, or another stream, to a stream as it arrives
+def obfuscate_piped_stream(input_file, output_file, keyword_matcher, detailed_logging=False, ipv4=False, name="<stdin>"):
+    """
+    Obfuscates the text read from a binary stream, such as standard input,
+    writing each line to a binary stream as soon as it is complete, so the
+    script can sit in a pipeline like 'zcat app.log.gz | ObfuscateLogs.py - | gzip'.
+    
+    Arguments:
+    input_file (file): The stream to read, opened in binary mode.
+    output_file (file): The stream to write to, opened in binary mode.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    name (str): The name the stream is logged with (default: '<stdin>').
+    """
+
+    obfuscator = Obfuscator(keyword_matcher, ipv4, name=name, detailed_logging=detailed_logging)
+    encoder = None
+
+    # Take whatever has arrived rather than waiting for a whole chunk
+    for data in iter(lambda: input_file.read1(CHUNK_SIZE), b""):
+        obfuscator.feed(data)
+        if encoder is None:
+            encoder = codecs.getincrementalencoder(obfuscator.encoding)(errors="ignore")
+        output_file.write(encoder.encode("".join(obfuscator.iter_lines())))
+        output_file.flush()
+
+    obfuscator.close()
+    if encoder is not None:
+        output_file.write(encoder.encode("".join(obfuscator.iter_lines()), final=True))
+    output_file.flush()
+
+# Sub-routine to obfuscate based on user defined keywords
+def obfuscate_keywords(line, line_number, file_path, keyword_matcher, detailed_logging=False, changes=None):
+    """
+    Replaces keywords in the line with their defined replacements.
+    The keywords and their replacements are loaded from the .ini file.
+    
+    Arguments:
+    line (str): The line to be processed.
+    line_number (int): The line number in the file.
+    file_path (str): The path to the file being processed.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    changes (list): Optional list to add a (rule, offset, before, after) tuple to for each replacement.
+    
+    Returns:
+    str: The obfuscated line.
+    """
+    
+    def replace_keyword(offset, keyword, replacement):
+        if detailed_logging:
+            logging.info(f"Keyword '{keyword}' replaced with '{replacement}' on line {line_number}")
+        if changes is not None:
+            changes.append((KEYWORD_RULE, offset, keyword, replacement))
+
+    # Apply the case-insensitive replacement using the precompiled matcher
+    new_line = keyword_matcher.sub(line, replace_keyword if detailed_logging or changes is not None else None)
+
+    # Log changes if detailed logging is enabled
+    if detailed_logging and new_line != line:
+        logging.info(
+            f"File: {file_path}, Line {line_number}: \n"
+            f"Before: {line}\n"
+            f"After:  {new_line}\n"
+            f"Obfuscation Type: Keyword Obfuscation\n"
+        )
+
+    return new_line
+    
+# Sub-routine to obfuscate HTTP/HTTPS URLs
+def obfuscate_http_https_urls(line, line_number, file_path, changes=None):
+    """
+    Identifies and replaces the domain and subdomain of HTTP/HTTPS URLs 
+    with generic replacements, while preserving the rest of the URL structure.
+    
+    Arguments:
+    line (str): The line to be processed.
+    line_number (int): The line number in the file.
+    file_path (str): The path to the file being processed.
+    changes (list): Optional list to add a (rule, offset, before, after) tuple to for each replacement.
+    
+    Returns:
+    str: The obfuscated line.
+    """
+
+    # Skip lines that cannot hold a URL
+    if "://" not in line:
+        return line
+
+    def replace_domain(match):
+        prefix = match.group(1)  # http:// or https://
+        domain = match.group(2)  # Domain and subdomain
+        path = match.group(3) if match.group(3) else ""  # Path (optional)
+
+        # Look up the domain's mapping for consistent obfuscation
+        generic_domain = replacement_map.get(domain, DOMAIN_TEMPLATE)
+        if changes is not None:
+            changes.append((URL_RULE, match.start(2), domain, generic_domain))
+
+        # Reconstruct the URL with the obfuscated domain
+        return f"{prefix}{generic_domain}{path}"
+
+    # Perform the replacement
+    return URL_REGEX.sub(replace_domain, line)
+
+# Sub-routine to obfuscate IPv4 addresses
+def obfuscate_ipv4_addresses(line, line_number, file_path, changes=None):
+    """
+    Identifies and replaces IPv4 addresses in the line with generic replacements,
+    unless the line contains the word 'version' or '.dll' (in which case, it is skipped).
+    
+    Arguments:
+    line (str): The line to be processed.
+    line_number (int): The line number in the file.
+    file_path (str): The path to the file being processed.
+    changes (list): Optional list to add a (rule, offset, before, after) tuple to for each replacement.
+    
+    Returns:
+    str: The obfuscated line.
+    """
+
+    # Skip lines without the three dots of an IPv4 address
+    if line.count(".") < 3:
+        return line
+
+    # Check if the line contains 'version' or '.dll' to avoid obfuscating version or DLL-related lines
+    lowered_line = line.lower()
+    if 'version' in lowered_line or '.dll' in lowered_line:
+        return line  # Skip modification if 'version' or '.dll' is present
+
+    def replace_ip(match):
+        ip = match.group(0)
+
+        # Look up the IP's mapping for consistent obfuscation
+        generic_ip = replacement_map.get(ip, IPV4_TEMPLATE)
+        if changes is not None:
+            changes.append((IPV4_RULE, match.start(), ip, generic_ip))
+        return generic_ip
+
+    # Perform the replacement
+    return IPV4_REGEX.sub(replace_ip, line)
+
+def detect_text_header_end(content):
+    """
+    Detects the end of the ASCII text header in a binary file.
+    Heuristic: Look for a non-ASCII byte or a specific delimiter (e.g., double newline).
+    Returns the byte offset where the text header ends.
+    
+    Arguments:
+    content (bytes): The binary content of the file, or a streamed chunk of it
+                     (any bytes-like object, e.g. bytearray or memoryview).
+    
+    Returns:
+    int: The byte offset where the ASCII text header ends.
+    """
+    
+    # Check whole blocks for non-ASCII bytes with bytes.isascii, which runs at
+    # C speed, and only search the block that holds the first one
+    for block_start in range(0, len(content), ASCII_SCAN_BLOCK):
+        block = bytes(content[block_start:block_start + ASCII_SCAN_BLOCK])
+        if not block.isascii():
+            return block_start + NON_ASCII_BYTE.search(block).start()
+    return len(content)  # Assume the entire content is ASCII if no non-ASCII byte is found
+
+# determine the file encoding type
+def detect_encoding(file_path, sample=None):
+    """
+    Detect the encoding of a file using a heuristic approach.
+    A byte order mark, plain ASCII or valid UTF-8 are recognised directly,
+    and only other samples are passed to chardet, whose results can be
+    cached for the files around it (see EncodingCache).
+    
+    Arguments:
+    file_path (str): Path to the file to be analyzed.
+    sample (bytes): The start of the file, if already read (optional).
+    
+    Returns:
+    str: Detected encoding type (e.g., 'utf-8', 'utf-8-sig').
+    """
+    if sample is None:
+        with open(file_path, 'rb') as f:
+            sample = f.read(ENCODING_SAMPLE_SIZE)  # Read a sample of the file
+
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    # Text without control bytes, which chardet checks for UTF-16 and escape
+    # sequence encodings, is ASCII or UTF-8 when it decodes as UTF-8
+    if sample and not CONTROL_BYTE.search(sample):
+        if sample.isascii():
+            return "ascii"
+        try:
+            # A full sample may end part way through a character
+            codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) < ENCODING_SAMPLE_SIZE)
+            return "utf-8"
+        except UnicodeDecodeError:
+            pass
+
+    encoding = encoding_cache.get(file_path)
+    if encoding is None:
+        encoding = chardet.detect(sample)['encoding']
+        encoding_cache.set(file_path, encoding)
+    return encoding
+
+# Construct the output file name
+def get_output_path(file_path, output_folder):
+    """
+    Returns the path a file is saved to once obfuscated, its name with
+    '_obfuscated' added before the extension, in the output folder.
+    
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_folder (str): The folder where the obfuscated file will be saved.
+    
+    Returns:
+    str: The path to the obfuscated file.
+    """
+
+    base_name = os.path.basename(file_path)
+
+    # Keep the suffix of an archive or compressed file, such as '.tar.gz', at the end
+    archive_format = get_archive_format(base_name)
+    suffix = "" if archive_format is None else base_name[-len(archive_format[0]):]
+    name, extension = os.path.splitext(base_name[:len(base_name) - len(suffix)])
+    obfuscated_name = f"{name}_obfuscated{extension}{suffix}"
+    return os.path.join(output_folder, obfuscated_name)
+
+# Find the format of an archive or compressed file from its name
+def get_archive_format(file_path):
+    """
+    Returns the archive or compression format a file's name suffix gives it.
+    
+    Arguments:
+    file_path (str): The path to the file.
+    
+    Returns:
+    tuple: The suffix, the kind ('zip', 'tar' or 'compressed') and the
+           compression ('gz', 'bz2', 'xz' or '') of the file, or None if it
+           is neither an archive nor a compressed file.
+    """
+
+    base_name = os.path.basename(file_path).lower()
+    for archive_format in ARCHIVE_SUFFIXES:
+        if base_name.endswith(archive_format[0]) and len(base_name) > len(archive_format[0]):
+            return archive_format
+    return None
+
+# Hash the content of a file
+def file_hash(file_path):
+    """
+    Returns the SHA-256 hash of a file's content, read a chunk at a time.
+    
+    Arguments:
+    file_path (str): The path to the file to be hashed.
+    
+    Returns:
+    str: The hex digest of the content.
+    """
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Fingerprint the settings that change a run's output
+def run_fingerprint(keyword_matcher, ipv4, mapping=None):
+    """
+    Returns a fingerprint of the keywords, in their order of precedence, the
+    IPv4 flag, the mapping and the script version, which an incremental
+    run's outputs depend on.
+    
+    Arguments:
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    ipv4 (bool): Whether to obfuscate IPv4 addresses.
+    mapping (str): Where replacements come from, if not the run's own numbering (default: None).
+    
+    Returns:
+    str: The hex digest of the settings.
+    """
+
+    settings = json.dumps([VERSION, ipv4, mapping, list(keyword_matcher.keywords.items())])
+    return hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+# Obfuscate a single file
+def obfuscate_file(file_path, output_folder, keyword_matcher, detailed_logging=False, ipv4=False, jobs=1, output_archive=None):
+    """
+    Obfuscates sensitive data in a single file and saves the obfuscated content.
+    The members of an archive or compressed file are saved to an archive or
+    compressed file of the same format.
+    
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_folder (str): The folder where the obfuscated file will be saved.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    jobs (int): The number of worker processes to split a large file across (default: 1).
+    output_archive (ArchiveWriter): The archive to add the obfuscated file to
+                                    instead of the output folder (default: None).
+    
+    Returns:
+    str: The path to the obfuscated file.
+    """
 
-# version number
-VERSION = "1.0.2" 
+    if output_archive is not None:
+        output_path = add_to_output_archive(file_path, output_folder, output_archive, keyword_matcher, detailed_logging, ipv4)
+    elif get_archive_format(file_path) is not None:
+        output_path = get_output_path(file_path, output_folder)
+        ensure_output_folder(output_folder)
+        obfuscate_archive_file(file_path, output_path, keyword_matcher, detailed_logging, ipv4)
+    else:
+        output_path = get_output_path(file_path, output_folder)
+        ensure_output_folder(output_folder)
+        obfuscate_plain_file(file_path, output_path, keyword_matcher, detailed_logging, ipv4, jobs)
 
-# Mapping dictionary for consistent obfuscation within a file
-replacement_map = {}
+    # Make the file's new replacements last as long as its output
+    replacement_map.flush()
 
-def get_executable_directory():
+    return output_path
+
+# Obfuscate a file that is not an archive
+def obfuscate_plain_file(file_path, output_path, keyword_matcher, detailed_logging=False, ipv4=False, jobs=1):
     """
-    Returns the directory where the script or compiled executable is located.
-    This is used to determine where the script resides to find associated files.
+    Obfuscates a file that is neither an archive nor a compressed file,
+    removing the output if it fails part way through.
+    
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_path (str): The path to save the obfuscated file to.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    jobs (int): The number of worker processes to split a large file across (default: 1).
     """
-    if getattr(sys, 'frozen', False):  # Check if running as a compiled executable
-        return os.path.dirname(sys.executable)
-    else:
-        return os.path.dirname(os.path.abspath(__file__))
 
-# read in the user defined keywords ini file
-def load_keywords_from_file(ini_filepath, script_filename):
+    # Open the file once, detecting its encoding from the first chunk read into its buffer
+    with open(file_path, "rb", buffering=max(CHUNK_SIZE, ENCODING_SAMPLE_SIZE)) as input_file:
+        start = time.perf_counter()
+        sample = input_file.peek(ENCODING_SAMPLE_SIZE)[:ENCODING_SAMPLE_SIZE]
+        encoding = detect_encoding(file_path, sample).lower()  # Normalize to lowercase
+        file_stats["detect_encoding"] += time.perf_counter() - start
+        #print(f"Detected encoding for {file_path}: {encoding}")
+
+        try:
+            # A file the rules cannot change is copied as it is
+            if encoding != 'utf-8-sig' and is_ascii_transparent(encoding):
+                lines = count_unchanged_lines(input_file, keyword_matcher, ipv4)
+                if lines is not None:
+                    counts = get_rule_scanner(keyword_matcher, ipv4).counts
+                    counts["lines"] += lines
+                    counts["cloned files"] += 1
+                    clone_file(input_file, output_path)
+                    return
+                input_file.seek(0)
+
+            # Handle UTF-8-BOM encoded files differently
+            if encoding == 'utf-8-sig':
+                obfuscate_utf8_bom_file(file_path, output_path, keyword_matcher, detailed_logging, ipv4, input_file)
+            elif (jobs > 1 and os.fstat(input_file.fileno()).st_size >= 2 * INTRA_FILE_CHUNK_SIZE
+                    and is_ascii_transparent(encoding)):
+                obfuscate_text_header_file_parallel(file_path, output_path, encoding, keyword_matcher, detailed_logging, ipv4, jobs, input_file)
+            else:
+                obfuscate_text_header_file(file_path, output_path, encoding, keyword_matcher, detailed_logging, ipv4, input_file)
+        except Exception:
+            # Don't leave a partly written output file behind
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+
+# Check whether obfuscating a file would leave it as it is
+def count_unchanged_lines(input_file, keyword_matcher, ipv4=False):
     """
-    Loads keyword/replacement pairs from a specified .ini file or a default file.
-    If the file doesn't exist, it creates one with a default template for easy customization.
+    Scans the ASCII text header of a file, which is all that is obfuscated
+    of a file in an ASCII transparent encoding, for anything the rules could
+    change. Whole chunks of lines are searched at once, stopping at the first
+    thing found, so a file with changes costs little more than reading its
+    start, and a file without any is never split into lines or written out.
     
     Arguments:
-    ini_filepath (str): Path to the user-defined .ini file (optional).
-    script_filename (str): The filename of the script, used to generate default paths.
+    input_file (file): The file opened in binary mode, read from its start.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
     
     Returns:
-    dict: A dictionary of keywords and their corresponding replacement values.
+    int: The number of lines in the header, None if the rules could change any of them.
     """
 
-    import configparser
-    config = configparser.ConfigParser()
-    config.optionxform = str  # Preserve case sensitivity for sections
-    keywords = {}
+    def read_text_header(input_file):
+        while True:
+            chunk = read_chunk(input_file)
+            text_header_end = detect_text_header_end(chunk)
+            yield chunk[:text_header_end]
+            if text_header_end < len(chunk) or not chunk:
+                return
 
-    # If no .ini file is provided, use the default one based on the script name
-    if not ini_filepath:
-        exe_dir = get_executable_directory()
-        ini_filepath = os.path.join(exe_dir, os.path.splitext(os.path.basename(script_filename))[0] + '.ini')
+    rule_scanner = get_rule_scanner(keyword_matcher, ipv4)
+    lines = 1
+    for text in iter_line_blocks(read_text_header(input_file)):
+        if rule_scanner.may_change(text.decode("ascii")):
+            return None
+        lines += text.count(b"\n")
+    return lines
 
-    # If the file doesn't exist, create it with a default comment and example sections
-    if not os.path.exists(ini_filepath):
-        print(f"{ini_filepath} not found. Creating a new blank keyword file.")
-        with open(ini_filepath, 'w') as f:
-            f.write("# This file contains keyword=replacement pairs organized by sections.\n")
-            f.write("[servers]\nserver1=generic_server1\nserver2=generic_server2\n\n")
-            f.write("[users]\nadmin=generic_admin\nguest=generic_guest\n\n")
-            f.write("[general]\npassword=obfuscated_password\nemail=obfuscated_email\n")
-        return {}
+# Copy a file as it is to the output
+def clone_file(input_file, output_path):
+    """
+    Copies a file to the output path without reading it into Python. Where
+    the filesystem supports it the output shares the blocks of the input,
+    so nothing is written but metadata, and otherwise the kernel copies it.
+    
+    Arguments:
+    input_file (file): The file to copy, opened in binary mode.
+    output_path (str): The path to copy it to.
+    """
 
-    # Read the file using configparser
-    config.read(ini_filepath)
+    with open(output_path, "wb") as output_file:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(output_file.fileno(), FICLONE, input_file.fileno())
+                return
+            except OSError:
+                pass  # Not supported by the filesystem, or across filesystems
+        copy_file_tail(input_file, output_file, 0)
 
-    # Combine all sections into a single dictionary
-    for section in config.sections():
-        for keyword, replacement in config.items(section):
-            lower_keyword = keyword.strip().lower()
-            if lower_keyword in keywords:
-                message = f"Duplicate keyword ignored: '{keyword}' in section [{section}]"
-                print(f"Warning: {message}")
-                logging.warning(message)
+# Stream a UTF-8-BOM encoded file through obfuscation
+def obfuscate_utf8_bom_file(file_path, output_path, keyword_matcher, detailed_logging=False, ipv4=False, input_file=None, output_file=None):
+    """
+    Obfuscates a UTF-8-BOM encoded file as text, a chunk at a time. The BOM is
+    stripped for processing and reapplied when saving the file.
+    
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_path (str): The path to save the obfuscated file to.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    input_file (file): The file already opened in binary mode (optional).
+    output_file (file): A file opened in binary mode to write to instead of output_path (optional).
+    """
+
+    bom = "\ufeff"  # BOM character
+
+    def read_chunks(input_file):
+        # Strip the BOM for processing, including any repeated at the start
+        chunk = read_chunk(input_file)
+        while chunk and not chunk.lstrip(bom):
+            chunk = read_chunk(input_file)
+        yield chunk.lstrip(bom)
+        while chunk:
+            chunk = read_chunk(input_file)
+            yield chunk
+
+    # Read the file as text, including the BOM
+    if input_file is None:
+        input_file = open(file_path, "rb")
+    with io.TextIOWrapper(input_file, encoding="utf-8-sig") as text_file:
+        chunks = read_chunks(text_file)
+        lines = obfuscate_lines(iter_lines(chunks), file_path, keyword_matcher, detailed_logging, ipv4)
+
+        # Reapply the BOM when saving the file
+        if output_file is None:
+            text_output = open(output_path, "w", encoding="utf-8-sig")
+        else:
+            text_output = io.TextIOWrapper(output_file, encoding="utf-8-sig")
+        try:
+            text_output.write(bom)
+            for text in iter_joined_lines(lines):
+                write_chunk(text_output, text)
+        finally:
+            if output_file is None:
+                text_output.close()
             else:
-                keywords[lower_keyword] = replacement.strip()
+                text_output.detach()  # Flushes, leaving the output file open
 
-    logging.info(f"Loaded {len(keywords)} unique keywords from {ini_filepath}.")
-    return keywords
+# Stream a file with a text header and binary body through obfuscation
+def obfuscate_text_header_file(file_path, output_path, encoding, keyword_matcher, detailed_logging=False, ipv4=False, input_file=None, output_file=None):
+    """
+    Obfuscates the ASCII text header of a file, a chunk at a time, and copies
+    the binary body following it to the output untouched.
+    
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_path (str): The path to save the obfuscated file to.
+    encoding (str): The detected encoding of the file.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    input_file (file): The file already opened in binary mode (optional).
+    output_file (file): A file opened in binary mode to write to instead of output_path (optional).
+    """
 
-# Setup logging
-def setup_logging(output_folder):
+    decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+    encoder = codecs.getincrementalencoder(encoding)(errors="ignore")
+    binary_body = []  # The first block of the binary body, once the header end is found
+    body_offset = []  # Or where the body starts, if the file can be read from there again
+
+    def read_text_header(input_file):
+        while True:
+            chunk = read_chunk(input_file)
+            if not chunk:
+                break
+
+            # Detect the end of the ASCII text header
+            text_header_end = detect_text_header_end(chunk)
+            if text_header_end < len(chunk):
+                yield decoder.decode(chunk[:text_header_end])
+                if input_file.seekable():
+                    body_offset.append(input_file.tell() - len(chunk) + text_header_end)
+                else:
+                    binary_body.append(chunk[text_header_end:])
+                break
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    # Read the file in binary mode
+    if input_file is None:
+        input_file = open(file_path, "rb")
+    with input_file:
+        chunks = read_text_header(input_file)
+        lines = obfuscate_lines(iter_lines(chunks), file_path, keyword_matcher, detailed_logging, ipv4)
+
+        # Write the obfuscated header and untouched binary body to the output file
+        if output_file is None:
+            output = open(output_path, "wb")
+        else:
+            output = contextlib.nullcontext(output_file)
+        with output as output_file:
+            for text in iter_joined_lines(lines):
+                write_chunk(output_file, encoder.encode(text))
+            output_file.write(encoder.encode("", final=True))
+
+            # The body follows the header end found, if one was
+            for chunk in binary_body:
+                output_file.write(chunk)
+                copy_file_tail(input_file, output_file)
+            for offset in body_offset:
+                copy_file_tail(input_file, output_file, offset)
+
+# Obfuscate a stream, such as a member of an archive, into an open output
+def obfuscate_stream(name, input_file, output_file, keyword_matcher, detailed_logging=False, ipv4=False):
     """
-    Sets up logging configuration to record the obfuscation process.
+    Obfuscates a file opened for reading in binary mode, detecting its
+    encoding from the start of it, into a file opened for writing.
     
     Arguments:
-    output_folder (str): The directory where log files will be stored.
+    name (str): The path the file is logged with, and its encoding cached by.
+    input_file (file): The file to obfuscate, opened for reading in binary mode.
+    output_file (file): The file to write to, opened in binary mode and left open.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    """
+
+    input_file = io.BufferedReader(input_file, max(CHUNK_SIZE, ENCODING_SAMPLE_SIZE))
+    start = time.perf_counter()
+    sample = input_file.peek(ENCODING_SAMPLE_SIZE)[:ENCODING_SAMPLE_SIZE]
+    encoding = detect_encoding(name, sample).lower()  # Normalize to lowercase
+    file_stats["detect_encoding"] += time.perf_counter() - start
+
+    if encoding == 'utf-8-sig':
+        obfuscate_utf8_bom_file(name, None, keyword_matcher, detailed_logging, ipv4, input_file, output_file)
+    else:
+        obfuscate_text_header_file(name, None, encoding, keyword_matcher, detailed_logging, ipv4, input_file, output_file)
+
+# Read the members of an archive or compressed file
+def iter_archive_members(file_path):
+    """
+    Opens an archive or compressed file and yields its members one at a time,
+    decompressed as they are read and each readable until the next is yielded.
+    Tar members other than files and folders, such as links, are skipped.
+    
+    Arguments:
+    file_path (str): The path to the archive or compressed file.
     
     Returns:
-    str: The path to the log file created.
+    iterator: (name, modification time, mode, file) tuples, the file being None
+              for a folder. The content of a compressed file has the name ''.
     """
+
+    suffix, kind, compression = get_archive_format(file_path)
+    if kind == "zip":
+        with zipfile.ZipFile(file_path) as archive:
+            for info in archive.infolist():
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                mode = info.external_attr >> 16
+                if info.is_dir():
+                    yield info.filename, mtime, mode, None
+                    continue
+                with archive.open(info) as member_file:
+                    yield info.filename, mtime, mode, member_file
+    elif kind == "tar":
+        # Members are read in order, so a compressed archive only seeks forward
+        with tarfile.open(file_path, "r:" + compression) as archive:
+            for member in archive:
+                if member.isdir():
+                    yield member.name, member.mtime, member.mode, None
+                elif member.isreg():
+                    with archive.extractfile(member) as member_file:
+                        yield member.name, member.mtime, member.mode, member_file
+                else:
+                    logging.info(f"Skipping {member.name} in {file_path}, it is not a file or folder")
+    else:
+        file_stat = os.stat(file_path)
+        with COMPRESSION_MODULES[compression].open(file_path, "rb") as member_file:
+            yield "", file_stat.st_mtime, file_stat.st_mode, member_file
+
+# Obfuscate the members of an archive or compressed file into an output archive
+def obfuscate_archive(file_path, output_archive, prefix, keyword_matcher, detailed_logging=False, ipv4=False):
+    """
+    Streams the members of an archive or compressed file through obfuscation
+    into an archive being written, without extracting them to disk.
     
-    log_filename = os.path.join(output_folder, f"__obfuscation_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-    logging.basicConfig(
-        filename=log_filename,
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-    )
- 
-    # Add a console handler for real-time output
-    #console_handler = logging.StreamHandler()
-    #console_handler.setLevel(logging.DEBUG)
-    #console_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-    #console_handler.setFormatter(console_formatter)
-    #logging.getLogger().addHandler(console_handler)
+    Arguments:
+    file_path (str): The path to the archive or compressed file.
+    output_archive (ArchiveWriter): The archive to add the obfuscated members to.
+    prefix (str): The folder to add the members under in the output archive, '' for none.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    """
 
-    logging.info("Log file initialized.")
-    return log_filename 
+    for name, mtime, mode, member_file in iter_archive_members(file_path):
+        # Drop the './' and trailing '/' some archivers add to member names
+        name = posixpath.normpath(name) if name else name
+        if name == ".":
+            name = ""
+        output_name = "/".join(part for part in (prefix, name) if part)
+        if member_file is None:
+            if output_name:
+                output_archive.add_folder(output_name, mtime, mode)
+            continue
 
-# Ensure the output folder exists
-def ensure_output_folder(output_folder):
+        member_path = os.path.join(file_path, *name.split("/")) if name else file_path
+        logging.info(f"Obfuscating {member_path}")
+        with output_archive.open_member(output_name, mtime, mode) as output_file:
+            obfuscate_stream(member_path, member_file, output_file, keyword_matcher, detailed_logging, ipv4)
+
+# Obfuscate an archive or compressed file into one of the same format
+def obfuscate_archive_file(file_path, output_path, keyword_matcher, detailed_logging=False, ipv4=False):
     """
-    Ensures that the output folder exists. If not, it creates the folder.
+    Obfuscates the members of an archive or compressed file into an archive or
+    compressed file of the same format, removing the output if it fails.
     
     Arguments:
-    output_folder (str): The path to the output folder.
+    file_path (str): The path to the archive or compressed file.
+    output_path (str): The path to save the obfuscated archive or compressed file to.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    """
+
+    output_archive = ArchiveWriter(output_path)
+    try:
+        obfuscate_archive(file_path, output_archive, "", keyword_matcher, detailed_logging, ipv4)
+    except Exception:
+        # Don't leave a partly written output file behind
+        output_archive.close()
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    output_archive.close()
+
+# Add a file to the output archive of the run
+def add_to_output_archive(file_path, output_folder, output_archive, keyword_matcher, detailed_logging=False, ipv4=False):
+    """
+    Obfuscates a file into the run's output archive, under the name of the
+    path it would be saved to relative to the output folder. The members of
+    an archive or compressed file are added in a folder named after it, or
+    as a file named after it for a compressed file.
     
-    Raises:
-    Exception: If there is an error while creating the output folder.
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_folder (str): The folder where the obfuscated file would be saved.
+    output_archive (ArchiveWriter): The archive to add the obfuscated file to.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    
+    Returns:
+    str: The path the file was added to, within the output archive.
+    """
+
+    base_name = os.path.basename(file_path)
+    archive_format = get_archive_format(file_path)
+    if archive_format is None:
+        output_name = output_archive.member_name(output_folder, base_name)
+        file_stat = os.stat(file_path)
+        with open(file_path, "rb") as input_file:
+            with output_archive.open_member(output_name, file_stat.st_mtime, file_stat.st_mode) as output_file:
+                obfuscate_stream(file_path, input_file, output_file, keyword_matcher, detailed_logging, ipv4)
+    else:
+        output_name = output_archive.member_name(output_folder, base_name[:-len(archive_format[0])])
+        obfuscate_archive(file_path, output_archive, output_name, keyword_matcher, detailed_logging, ipv4)
+
+    return os.path.join(output_archive.path, *output_name.split("/"))
+
+# Obfuscate a file to a stream, such as standard output
+def obfuscate_file_to_stream(file_path, output_file, keyword_matcher, detailed_logging=False, ipv4=False):
+    """
+    Obfuscates a file, or the content of a compressed file, to a stream.
+    
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_file (file): The stream to write to, opened in binary mode.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    """
+
+    if get_archive_format(file_path) is None:
+        with open(file_path, "rb") as input_file:
+            obfuscate_stream(file_path, input_file, output_file, keyword_matcher, detailed_logging, ipv4)
+    else:
+        for name, mtime, mode, member_file in iter_archive_members(file_path):
+            obfuscate_stream(file_path, member_file, output_file, keyword_matcher, detailed_logging, ipv4)
+    output_file.flush()
+
+# Check whether an encoding decodes the chunks of an ASCII text header alike
+def is_ascii_transparent(encoding):
+    """
+    Returns whether an encoding decodes ASCII bytes to the same characters
+    regardless of what comes before them, so the ASCII text header of a file
+    can be decoded a chunk at a time. UTF-16 and the escape sequence
+    encodings, such as ISO-2022-JP, are not.
+    
+    Arguments:
+    encoding (str): The detected encoding of the file.
+    
+    Returns:
+    bool: Whether the encoding is ASCII transparent.
     """
 
+    text = bytes(range(128)) + b"~{a~}\x1b$Bab\x1b(B"
     try:
-        os.makedirs(output_folder, exist_ok=True)
+        return text.decode(encoding, errors="strict") == text.decode("ascii")
+    except (LookupError, UnicodeDecodeError):
+        return False
+
+# Split a file into line aligned chunks
+def iter_chunk_bounds(input_file, size, chunk_size):
+    """
+    Splits a file into chunks of about chunk_size bytes, each ending just
+    after a newline (or at the end of the file), so no line spans two chunks.
+    
+    Arguments:
+    input_file (file): The file opened in binary mode.
+    size (int): The size of the file.
+    chunk_size (int): The size to aim for.
+    
+    Returns:
+    iterator: (start, end) byte offsets of the chunks.
+    """
+
+    start = 0
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            yield start, size
+            return
+
+        # Move the end past the next newline
+        input_file.seek(end)
+        while True:
+            block = input_file.read(ASCII_SCAN_BLOCK)
+            if not block:
+                end = size
+                break
+            newline = block.find(b"\n")
+            if newline >= 0:
+                end += newline + 1
+                break
+            end += len(block)
+        yield start, end
+        start = end
+
+# Run tasks in a pool, taking their results in order
+def iter_results_in_order(executor, task, task_args, window):
+    """
+    Submits the tasks to the executor, keeping at most window of them in
+    flight, and yields their results in the order the tasks were given.
+    Tasks not yet started are cancelled if the caller stops early.
+    
+    Arguments:
+    executor (Executor): The pool to run the tasks in.
+    task (callable): The task function.
+    task_args (iterable): The argument tuples of each task.
+    window (int): The most tasks to have submitted at once.
+    
+    Returns:
+    iterator: The results of the tasks.
+    """
+
+    pending = collections.deque()
+    task_args = iter(task_args)
+    try:
+        for args in task_args:
+            pending.append(executor.submit(task, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+# Read and decode a chunk of a file's text header
+def read_text_chunk(file_path, start, end, encoding):
+    """
+    Reads the chunk of a file between two byte offsets, stopping at the end
+    of the ASCII text header if it comes first.
+    
+    Returns:
+    tuple: The text of the chunk and the offset the text header ends at
+           within it (None if it does not).
+    """
+
+    with open(file_path, "rb") as input_file:
+        input_file.seek(start)
+        data = input_file.read(end - start)
+    text_header_end = detect_text_header_end(data)
+    if text_header_end == len(data):
+        text_header_end = None
+    else:
+        data = data[:text_header_end]
+    return data.decode(encoding, errors="ignore"), text_header_end
+
+# Survey a chunk of a file in a worker process, ahead of obfuscating it
+def survey_chunk_task(file_path, start, end, encoding):
+    """
+    Finds the end of the text header in a chunk and the number of lines
+    before it, and runs the rules over those lines to collect the domains and
+    IPs they look up, in the order they are first seen.
+    
+    Arguments:
+    file_path (str): The path to the file being processed.
+    start (int): The byte offset the chunk starts at.
+    end (int): The byte offset the chunk ends at.
+    encoding (str): The detected encoding of the file.
+    
+    Returns:
+    tuple: The offset of the end of the text header (None if not in the
+           chunk), the number of newlines and the (value, template) pairs.
+    """
+
+    global replacement_map
+    text, text_header_end = read_text_chunk(file_path, start, end, encoding)
+    if text_header_end is not None:
+        text_header_end += start
+
+    keyword_matcher, ipv4 = worker_settings["keyword_matcher"], worker_settings["ipv4"]
+    run_map, replacement_map = replacement_map, ChunkReplacementMap()
+    try:
+        for line in obfuscate_lines(text.split("\n"), file_path, keyword_matcher, False, ipv4):
+            pass
+        values = list(replacement_map.values.items())
+    finally:
+        replacement_map = run_map
+    get_rule_scanner(keyword_matcher, ipv4).pop_counts()  # Counted when obfuscated
+    return text_header_end, text.count("\n"), values
+
+# Obfuscate a chunk of a file in a worker process
+def obfuscate_chunk_task(file_path, start, end, encoding, first_line_number, last, replacements):
+    """
+    Obfuscates the lines of a chunk of a file, looking values up in the
+    replacements numbered by the main process.
+    Detailed log records are collected and returned, for the main process
+    to log in file order.
+    
+    Arguments:
+    file_path (str): The path to the file being processed.
+    start (int): The byte offset the chunk starts at.
+    end (int): The byte offset the chunk ends at.
+    encoding (str): The detected encoding of the file.
+    first_line_number (int): The line number of the first line of the chunk.
+    last (bool): Whether the chunk is the last of the text header, which
+                 keeps the text after its last newline as a line.
+    replacements (dict): The replacements of the values in the chunk.
+    
+    Returns:
+    tuple: The obfuscated bytes, the (value, template) pairs looked up, the
+           detailed log records and the prefilter counts.
+    """
+
+    global replacement_map
+    keyword_matcher, ipv4 = worker_settings["keyword_matcher"], worker_settings["ipv4"]
+    detailed_logging = worker_settings["detailed_logging"]
+    text, _ = read_text_chunk(file_path, start, end, encoding)
+    lines = text.split("\n")
+    if not last:
+        lines.pop()  # The empty text after the chunk's final newline
+
+    run_map, replacement_map = replacement_map, ChunkReplacementMap(replacements)
+    loggers = (logging.getLogger(), logging.getLogger(CHANGES_LOGGER))
+    handlers = [logger.handlers[:] for logger in loggers]
+    buffer_handler = logging.handlers.BufferingHandler(capacity=sys.maxsize)
+    for logger in loggers:
+        logger.handlers[:] = [buffer_handler]
+    try:
+        text = "\n".join(obfuscate_lines(lines, file_path, keyword_matcher, detailed_logging, ipv4, first_line_number))
+        values = list(replacement_map.values.items())
+    finally:
+        replacement_map = run_map
+        for logger, logger_handlers in zip(loggers, handlers):
+            logger.handlers[:] = logger_handlers
+
+    if not last:
+        text += "\n"
+    records = []
+    for record in buffer_handler.buffer:
+        record.msg, record.args = record.getMessage(), None
+        records.append(record)
+    counts = get_rule_scanner(keyword_matcher, ipv4).pop_counts()
+    return text.encode(encoding, errors="ignore"), values, records, counts
+
+# Obfuscate a large file with a text header across a pool of worker processes
+def obfuscate_text_header_file_parallel(file_path, output_path, encoding, keyword_matcher, detailed_logging, ipv4, jobs, input_file):
+    """
+    Obfuscates the ASCII text header of a large file in line aligned chunks
+    across a pool of worker processes, and writes them out in order followed
+    by the binary body, the same as obfuscate_text_header_file would.
+
+    The workers first survey their chunks for the domains and IPs they look
+    up, which the main process numbers in file order in the run's mapping,
+    and then obfuscate the chunks with those replacements and line numbers
+    counted from the start of the file. Keyed hash replacements are looked
+    up the same way, though they do not depend on the order. Should a chunk look up other values than it did
+    in the survey, which happens when a replacement is looked up again as a
+    value (e.g. http://10.1.2.3/ once 10.1.2.3 is replaced), the file is
+    obfuscated again sequentially.
+    
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_path (str): The path to save the obfuscated file to.
+    encoding (str): The detected encoding of the file, which must be ASCII transparent.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes.
+    ipv4 (bool): Whether to obfuscate IPv4 addresses.
+    jobs (int): The number of worker processes.
+    input_file (file): The file opened in binary mode.
+    """
+
+    size = os.fstat(input_file.fileno()).st_size
+    bounds = list(iter_chunk_bounds(input_file, size, INTRA_FILE_CHUNK_SIZE))
+    saved_count = len(replacement_map) if isinstance(replacement_map, (ReplacementMap, CompactReplacementMap)) else None
+    rule_scanner = get_rule_scanner(keyword_matcher, ipv4)
+
+    log_queue = multiprocessing.Queue()
+    listener = start_log_listener(log_queue)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=init_worker,
+            initargs=(None, log_queue, keyword_matcher, detailed_logging, ipv4, encoding_cache.key),
+        ) as executor:
+            # Survey the chunks up to the end of the text header
+            chunks = []  # (start, end, first line number, values)
+            line_number = 1
+            surveys = iter_results_in_order(
+                executor, survey_chunk_task,
+                ((file_path, start, end, encoding) for start, end in bounds), jobs * 2,
+            )
+            text_header_end = size
+            for (start, end), (chunk_header_end, newlines, values) in zip(bounds, surveys):
+                chunks.append((start, end if chunk_header_end is None else chunk_header_end, line_number, values))
+                line_number += newlines
+                if chunk_header_end is not None:
+                    text_header_end = chunk_header_end
+                    break
+            surveys.close()
+
+            # Number the values in file order, as the sequential path would
+            chunk_replacements = []
+            for start, end, first_line_number, values in chunks:
+                chunk_replacements.append({value: replacement_map.get(value, template) for value, template in values})
+
+            logged_lines = 0  # Lines whose detailed changes have been logged
+            with open(output_path, "wb") as output_file:
+                results = iter_results_in_order(
+                    executor, obfuscate_chunk_task,
+                    ((file_path, start, end, encoding, first_line_number, index == len(chunks) - 1, chunk_replacements[index])
+                     for index, (start, end, first_line_number, values) in enumerate(chunks)), jobs * 2,
+                )
+                next_first_line_numbers = [chunk[2] for chunk in chunks[1:]] + [line_number]
+                for (start, end, first_line_number, values), next_first_line_number, (data, looked_up, records, counts) in zip(
+                        chunks, next_first_line_numbers, results):
+                    if looked_up != values:
+                        raise ChunkFallback(f"lines from {first_line_number} looked up other values than surveyed")
+                    for record in records:
+                        logging.getLogger(record.name).handle(record)
+                    logged_lines = next_first_line_number - 1
+                    for key, count in counts.items():
+                        rule_scanner.counts[key] += count
+                    output_file.write(data)
+
+                copy_file_tail(input_file, output_file, text_header_end)
+    except ChunkFallback as e:
+        # Numbering could differ from the sequential path, so fall back to it
+        logging.warning(f"Obfuscating {file_path} sequentially, a chunk did not match its survey: {e}")
+        if saved_count is not None:
+            replacement_map.rollback(saved_count)
+        input_file.seek(0)
+        changes_filter = ChangesAfterLine(logged_lines)
+        logging.getLogger(CHANGES_LOGGER).addFilter(changes_filter)
+        try:
+            obfuscate_text_header_file(file_path, output_path, encoding, keyword_matcher, detailed_logging, ipv4, input_file)
+        finally:
+            logging.getLogger(CHANGES_LOGGER).removeFilter(changes_filter)
+    finally:
+        listener.stop()
+
+# Report the result of processing a single file
+def report_file_result(file_path, output_path, error, current_index, total_files):
+    """
+    Logs and prints the progress line for a processed file, or its error.
+    
+    Arguments:
+    file_path (str): The path to the file that was processed.
+    output_path (str): The path to the obfuscated file.
+    error (str): The error raised processing the file, None on success.
+    current_index (int): The current file index (for logging purposes).
+    total_files (int or str): The total number of files being processed, or
+                              those found so far while a folder is walked.
+    """
+
+    if error is not None:
+        logging.error(f"Error processing file {file_path}: {error}")
+        print(f"Error processing file {file_path}: {error}")
+        return
+
+    progress = f"Processing file {current_index} of {total_files}"
+    logging.info(f"{progress}: {file_path} -> {output_path}")
+    print(f"{progress}: {file_path} -> {output_path}")
+
+# Process a single file
+def process_file(file_path, output_folder, current_index, total_files, keyword_matcher, detailed_logging=False, ipv4=False, manifest=None, jobs=1, output_archive=None):
+    """
+    Processes a single file to obfuscate sensitive data and saves the obfuscated content.
+    
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_folder (str): The folder where the obfuscated file will be saved.
+    current_index (int): The current file index (for logging purposes).
+    total_files (int): The total number of files being processed.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    manifest (RunManifest): The manifest of an incremental run (default: None).
+    jobs (int): The number of worker processes to split a large file across (default: 1).
+    output_archive (ArchiveWriter): The archive to add the obfuscated file to (default: None).
+    """
+
+    if skip_file(file_path, output_folder, current_index, total_files, manifest):
+        return
+
+    output_path, error, stats = obfuscate_file_timed(file_path, output_folder, keyword_matcher, detailed_logging, ipv4, jobs, output_archive)
+    if error is None and manifest is not None:
+        try:
+            manifest.record(file_path, output_path)
+        except Exception as e:
+            output_path, error = None, e
+    run_report.add_file(file_path, output_path, error, stats)
+    report_file_result(file_path, output_path, error, current_index, total_files)
+
+# Obfuscate a file, timing it for the run report
+def obfuscate_file_timed(file_path, output_folder, keyword_matcher, detailed_logging=False, ipv4=False, jobs=1, output_archive=None):
+    """
+    Runs obfuscate_file, timing the file and its stages and taking the
+    prefilter and match counts of the file from the rule scanner.
+    
+    Arguments:
+    file_path (str): The path to the file to be processed.
+    output_folder (str): The folder where the obfuscated file will be saved.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    jobs (int): The number of worker processes to split a large file across (default: 1).
+    output_archive (ArchiveWriter): The archive to add the obfuscated file to (default: None).
+    
+    Returns:
+    tuple: The path to the obfuscated file (None on error), the exception
+           raised (or None) and a dict of the file's seconds, stage times and counts.
+    """
+
+    for stage in file_stats:
+        file_stats[stage] = 0.0
+    rule_scanner = get_rule_scanner(keyword_matcher, ipv4)
+    output_path, error = None, None
+    start = time.perf_counter()
+    try:
+        output_path = obfuscate_file(file_path, output_folder, keyword_matcher, detailed_logging, ipv4, jobs, output_archive)
     except Exception as e:
-        logging.error(f"Error creating output folder {output_folder}: {e}")
-        raise
+        error = e
+    stats = {"seconds": time.perf_counter() - start, "stages": dict(file_stats), "counts": rule_scanner.pop_counts()}
+    return output_path, error, stats
 
-# Primary obfuscation function
-def obfuscate_content(content, file_path, keywords_dict, detailed_logging=False, ipv4=False):
+# Skip a file an incremental run does not need to process
+def skip_file(file_path, output_folder, current_index, total_files, manifest):
     """
-    Processes the content of a file to identify and obfuscate sensitive data.
-    Logs changes with before/after values, line numbers, and the type of obfuscation performed
-    if detailed_logging is True.
+    Checks whether an incremental run can skip a file, because it has not
+    changed since the last run or is one of the run's own files, and logs
+    and prints the progress line for it if so.
     
     Arguments:
-    content (str): The content of the file to be obfuscated.
-    file_path (str): The path to the file being processed.
-    keywords_dict (dict): The dictionary containing keywords and their replacement values.
-    detailed_logging (bool): Whether to log detailed changes (default: False).
+    file_path (str): The path to the file to be processed.
+    output_folder (str): The folder where the obfuscated file will be saved.
+    current_index (int): The current file index (for logging purposes).
+    total_files (int): The total number of files being processed.
+    manifest (RunManifest): The manifest of an incremental run, None if not incremental.
     
     Returns:
-    str: The obfuscated content.
+    bool: Whether the file is skipped.
+    """
+
+    if manifest is None:
+        return False
+
+    output_path = get_output_path(file_path, output_folder)
+    if manifest.is_own_file(file_path):
+        reason = "output of an earlier run"
+    elif manifest.is_unchanged(file_path, output_path):
+        reason = "unchanged"
+    else:
+        return False
+
+    run_report.skipped += 1
+    progress = f"Skipping file {current_index} of {total_files}"
+    logging.info(f"{progress}: {file_path} ({reason})")
+    print(f"{progress}: {file_path} ({reason})")
+    return True
+
+# Initialise a worker process of a parallel run
+def init_worker(replacement_proxy, log_queue, keyword_matcher, detailed_logging, ipv4, encoding_cache_key=None, profile=False):
     """
+    Sets up a worker process to share the run's replacement mapping and to
+    send its log records back to the main process.
     
-    #lines = content.splitlines()
-    # Explicitly split content only on newlines to preserve other characters
-    lines = content.split("\n")  # Explicitly use "\n" to avoid splitting on other special characters
-    #logging.debug(f"Split lines from content: {lines}")
-    obfuscated_lines = []
+    Arguments:
+    replacement_proxy: The proxy to the ReplacementMap held by the ReplacementManager,
+                       None for the workers obfuscating the chunks of a file, or a
+                       map each worker can have its own copy of.
+    log_queue (Queue): The queue read by the main process' log listener.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes.
+    ipv4 (bool): Whether to obfuscate IPv4 addresses.
+    encoding_cache_key (str): What files share a cached encoding by (default: None, no caching).
+    profile (bool): Whether to profile every file obfuscated (default: False).
+    """
 
-    for line_number, line in enumerate(lines, start=1):
-        original_line = line
-        obfuscation_type = None  # Track which type of obfuscation was performed
+    global replacement_map, encoding_cache
+    if isinstance(replacement_proxy, (HashedReplacementMap, ScanReplacementMap)):
+        replacement_map = replacement_proxy
+    elif replacement_proxy is not None:
+        replacement_map = SharedReplacementMap(replacement_proxy)
+    encoding_cache = EncodingCache(encoding_cache_key)
 
-        # Debug: Log original line
-        #logging.debug(f"Original line {line_number}: {original_line}")
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(logging.INFO)
 
-        # Call individual obfuscation sub-routines
-        new_line = obfuscate_http_https_urls(line, line_number, file_path)
-        if new_line != line:
-            obfuscation_type = 'HTTP/HTTPS URL Obfuscation'
-            line = new_line  # Update line if modified by the URL obfuscation
+    # Detailed changes go the same way, to the change log of the main process
+    changes_logger = logging.getLogger(CHANGES_LOGGER)
+    changes_logger.propagate = False
+    changes_logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
 
-        # Apply IPv4 obfuscation only if enabled
-        if ipv4:
-            new_line = obfuscate_ipv4_addresses(line, line_number, file_path)
-            if new_line != line:
-                obfuscation_type = 'IPv4 Address Obfuscation'
-                line = new_line  # Update line if modified by the IP obfuscation
-
-        new_line = obfuscate_keywords(line, line_number, file_path, keywords_dict, detailed_logging)
-        if new_line != line:
-            obfuscation_type = 'Keyword Obfuscation'
-            line = new_line  # Update line if modified by the keyword obfuscation
-
-        # Debug: Log obfuscation result
-        #if original_line != line:
-        #    logging.debug(
-        #        f"Line {line_number} obfuscated ({obfuscation_type}): \n"
-        #        f"Before: {original_line}\n"
-        #        f"After:  {line}"
-        #    )
-
-        # Add line to the obfuscated result
-        obfuscated_lines.append(line)
-
-        # Log changes if the line was modified and detailed logging is enabled
-        if detailed_logging and original_line != line:
-            logging.info(
-                f"File: {file_path}, Line {line_number}: \n"
-                f"Before: {original_line}\n"
-                f"After:  {line}\n"
-                f"Obfuscation Type: {obfuscation_type}\n"
-            )
+    worker_settings.update(
+        keyword_matcher=keyword_matcher,
+        detailed_logging=detailed_logging,
+        ipv4=ipv4,
+        profile=profile,
+    )
 
-    return "\n".join(obfuscated_lines)
+# Obfuscate a single file in a worker process of a parallel run
+def process_file_task(file_path, output_folder):
+    """
+    Runs obfuscate_file with the worker's settings. Errors are returned rather
+    than raised so the main process can report every file in order.
+    
+    Returns:
+    tuple: The path to the obfuscated file, the error message (or None) and
+           the stats of the file for the run report, with its profile stats
+           if profiling.
+    """
 
-# Sub-routine to obfuscate based on user defined keywords
-def obfuscate_keywords(line, line_number, file_path, keywords_dict, detailed_logging=False):
+    profiler = cProfile.Profile() if worker_settings["profile"] else None
+    if profiler is not None:
+        profiler.enable()
+    output_path, error, stats = obfuscate_file_timed(
+        file_path, output_folder, worker_settings["keyword_matcher"],
+        worker_settings["detailed_logging"], worker_settings["ipv4"],
+    )
+    if profiler is not None:
+        profiler.disable()
+        profiler.create_stats()
+        stats["profile"] = profiler.stats
+    return output_path, None if error is None else str(error), stats
+
+# Updated process_folder function to include detailed_logging
+def process_folder(folder_path, output_folder, keyword_matcher, detailed_logging, ipv4, jobs=1, manifest=None, output_archive=None,
+                   include=None, exclude=None):
     """
-    Replaces keywords in the line with their defined replacements.
-    The keywords and their replacements are loaded from the .ini file.
+    Processes all files in a specified directory, obfuscating sensitive data and saving the results.
     
     Arguments:
-    line (str): The line to be processed.
-    line_number (int): The line number in the file.
-    file_path (str): The path to the file being processed.
-    keywords_dict (dict): The dictionary containing keywords and their replacement values.
+    directory (str): The path to the directory containing files to be processed.
+    output_folder (str): The folder where the obfuscated files will be saved.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
     detailed_logging (bool): Whether to log detailed changes (default: False).
-    
-    Returns:
-    str: The obfuscated line.
+    jobs (int): The number of worker processes to spread the files across (default: 1).
+    manifest (RunManifest): The manifest of an incremental run (default: None).
+    output_archive (ArchiveWriter): The archive to add the obfuscated files to, one
+                                    at a time, instead of the output folder (default: None).
+    include (list): Patterns a file must match one of to be processed (default: None, every file).
+    exclude (list): Patterns of files and folders to leave out (default: None).
     """
-    
-    def replace_keyword(match):
-        keyword = match.group(0)
-        replacement = keywords_dict.get(keyword.lower(), keyword)  # Match case-insensitively
-        if detailed_logging:
-            logging.info(f"Keyword '{keyword}' replaced with '{replacement}' on line {line_number}")
-        return replacement
-        
-    # Regex to match keywords as substrings
-    if keywords_dict:
-        # Build a case-insensitive regex pattern
-        keywords_pattern = r'(' + '|'.join(re.escape(keyword) for keyword in keywords_dict.keys()) + r')'
-        #logging.debug(f"Regex pattern for keywords: {keywords_pattern}")
-
-        # Apply the case-insensitive replacement
-        new_line = re.sub(keywords_pattern, replace_keyword, line, flags=re.IGNORECASE)
-
-        # Log changes if detailed logging is enabled
-        if detailed_logging and new_line != line:
-            logging.info(
-                f"File: {file_path}, Line {line_number}: \n"
-                f"Before: {line}\n"
-                f"After:  {new_line}\n"
-                f"Obfuscation Type: Keyword Obfuscation\n"
-            )
 
-        return new_line
+    try:
+        # Files are processed as the folder is walked, the totals growing as it goes
+        scan = FolderScan(folder_path, output_folder, include, exclude)
+        logging.info(f"Processing files as they are found in {folder_path}")
+        print(f"Processing files as they are found in {folder_path}")
+
+        if jobs > 1 and output_archive is not None:
+            logging.info("Files are obfuscated one at a time into the output archive.")
+        if jobs > 1 and output_archive is None:
+            process_folder_parallel(scan, keyword_matcher, detailed_logging, ipv4, jobs, manifest)
+        else:
+            for current_file_index, (file_path, current_output_folder) in enumerate(scan, start=1):
+                process_file(file_path, current_output_folder, current_file_index, scan.total(), keyword_matcher, detailed_logging, ipv4, manifest,
+                             output_archive=output_archive)
 
-    return line  # Return the line unmodified if no keywords exist
-    
-# Sub-routine to obfuscate HTTP/HTTPS URLs
-def obfuscate_http_https_urls(line, line_number, file_path):
+        if scan.excluded:
+            logging.info(f"Left out {scan.excluded} files not matching the include and exclude patterns.")
+        logging.info(f"Processed {scan.files} files across {scan.folders} folders.")
+        print(f"Processed {scan.files} files across {scan.folders} folders.")
+    except Exception as e:
+        logging.error(f"Error processing folder {folder_path}: {e}")
+        print(f"Error processing folder {folder_path}: {e}")
+
+# Walk a folder for the files to process
+class FolderScan:
     """
-    Identifies and replaces the domain and subdomain of HTTP/HTTPS URLs 
-    with generic replacements, while preserving the rest of the URL structure.
-    
+    Walks a folder tree once with os.scandir in a background thread, handing
+    the files to process over through a bounded queue as they are found, so
+    processing starts straight away and the walk never runs far ahead of it.
+    Files and folders are counted as they are found, the totals only being
+    final once the walk is done. Files are found in the same order as os.walk
+    would find them, so numbered replacements are the same.
+
+    Include and exclude patterns are matched against a file's name, or its
+    path relative to the folder if the pattern holds a '/'. Folders matching
+    an exclude pattern are not walked at all.
+
     Arguments:
-    line (str): The line to be processed.
-    line_number (int): The line number in the file.
-    file_path (str): The path to the file being processed.
-    
-    Returns:
-    str: The obfuscated line.
+    folder_path (str): The path to the directory containing files to be processed.
+    output_folder (str): The folder where the obfuscated files will be saved.
+    include (list): Patterns a file must match one of to be processed (default: None, every file).
+    exclude (list): Patterns of files and folders to leave out (default: None).
     """
 
-    # Regex to match the domain and subdomain in a URL
-    url_regex = r"(https?://)([a-zA-Z0-9.-]+)(/[^\s]*)?"
+    def __init__(self, folder_path, output_folder, include=None, exclude=None):
+        self.folder_path = folder_path
+        self.output_folder = output_folder
+        self.include = include or []
+        self.exclude = exclude or []
+        self.files = 0
+        self.folders = 0
+        self.excluded = 0
+        self.done = False
+        self.queue = queue.Queue(FOLDER_SCAN_QUEUE_SIZE)
+        self.stopped = threading.Event()
 
-    def replace_domain(match):
-        prefix = match.group(1)  # http:// or https://
-        domain = match.group(2)  # Domain and subdomain
-        path = match.group(3) if match.group(3) else ""  # Path (optional)
+    def total(self):
+        """
+        Returns the number of files found, followed by '+' while the walk goes on.
+        """
+        return f"{self.files}" if self.done else f"{self.files}+"
 
-        # Check if the domain is already mapped for consistent obfuscation
-        if domain not in replacement_map:
-            generic_domain = f"generic-domain-{len(replacement_map) + 1}.com"
-            replacement_map[domain] = generic_domain
+    def __iter__(self):
+        """
+        Yields (file path, output folder) tuples for every file to process.
+        """
+        walker = threading.Thread(target=self._walk, name="FolderScan", daemon=True)
+        walker.start()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Let the walk finish if it is waiting for room in the queue
+            self.stopped.set()
+            while walker.is_alive():
+                try:
+                    self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
 
-        # Reconstruct the URL with the obfuscated domain
-        return f"{prefix}{replacement_map[domain]}{path}"
+    def _put(self, item):
+        # Returns False once the files are no longer wanted
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
 
-    # Perform the replacement
-    return re.sub(url_regex, replace_domain, line)
+    def _matches(self, patterns, name, relative_path):
+        return any(fnmatch.fnmatch(relative_path if "/" in pattern else name, pattern) for pattern in patterns)
 
-# Sub-routine to obfuscate IPv4 addresses
-def obfuscate_ipv4_addresses(line, line_number, file_path):
+    def _walk(self):
+        try:
+            folders = [(self.folder_path, self.output_folder, "")]
+            while folders:
+                folder_path, output_folder, relative_folder = folders.pop()
+                try:
+                    with os.scandir(folder_path) as scan:
+                        entries = list(scan)
+                except OSError as e:
+                    logging.warning(f"Cannot read folder {folder_path}: {e}")
+                    continue
+
+                subfolders = []
+                for entry in entries:
+                    relative_path = relative_folder + entry.name
+                    try:
+                        is_folder = entry.is_dir()
+                    except OSError:
+                        is_folder = False
+                    if is_folder:
+                        if self._matches(self.exclude, entry.name, relative_path):
+                            continue
+                        self.folders += 1
+                        if not entry.is_symlink():  # Links to folders are not followed, as by os.walk
+                            subfolders.append((entry.path, os.path.join(output_folder, entry.name), relative_path + "/"))
+                    elif ((not self.include or self._matches(self.include, entry.name, relative_path))
+                          and not self._matches(self.exclude, entry.name, relative_path)):
+                        self.files += 1
+                        if not self._put((entry.path, output_folder)):
+                            return
+                    else:
+                        self.excluded += 1
+
+                # Walk the subfolders depth first, in the order they were found
+                folders.extend(reversed(subfolders))
+        except Exception as e:
+            self._put(e)
+        finally:
+            self.done = True
+            self._put(None)
+
+# Process the files of a folder with a pool of worker processes
+def process_folder_parallel(scan, keyword_matcher, detailed_logging, ipv4, jobs, manifest=None):
     """
-    Identifies and replaces IPv4 addresses in the line with generic replacements,
-    unless the line contains the word 'version' or '.dll' (in which case, it is skipped).
+    Spreads the files of a folder across a pool of worker processes, handing
+    them out as the folder walk finds them, a few ahead of the workers. The
+    replacement mapping is served to every worker by a ReplacementManager so
+    domains and IPs map to the same values across the whole run, and the
+    workers' log records are written by a listener in this process. Progress
+    is reported in file order as the results come back.
     
     Arguments:
-    line (str): The line to be processed.
-    line_number (int): The line number in the file.
-    file_path (str): The path to the file being processed.
-    
-    Returns:
-    str: The obfuscated line.
+    scan (FolderScan): The walk of the folder whose files are processed.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes.
+    ipv4 (bool): Whether to obfuscate IPv4 addresses.
+    jobs (int): The number of worker processes.
+    manifest (RunManifest): The manifest of an incremental run (default: None).
     """
 
-    # Check if the line contains 'version' or '.dll' to avoid obfuscating version or DLL-related lines
-    if 'version' in line.lower() or '.dll' in line.lower():
-        return line  # Skip modification if 'version' or '.dll' is present
-
-    # Regex to match IPv4 addresses
-    ipv4_regex = r"\b(?:\d{1,3}\.){3}\d{1,3}\b"
+    submitted = collections.deque()  # The index and path of each file handed to the workers
 
-    def replace_ip(match):
-        ip = match.group(0)
+    def iter_task_args():
+        for current_file_index, (file_path, current_output_folder) in enumerate(scan, start=1):
+            if skip_file(file_path, current_output_folder, current_file_index, scan.total(), manifest):
+                continue
+            submitted.append((current_file_index, file_path))
+            yield file_path, current_output_folder
 
-        # Check if the IP is already mapped for consistent obfuscation
-        if ip not in replacement_map:
-            generic_ip = f"192.0.2.{len(replacement_map) + 1}"  # Use reserved IP range for generic values
-            replacement_map[ip] = generic_ip
+    log_queue = multiprocessing.Queue()
+    listener = start_log_listener(log_queue)
+    try:
+        with ReplacementManager() as manager:
+            shared_map = replacement_map.serve(manager)
 
-        # Return the generic replacement
-        return replacement_map[ip]
+            with ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=init_worker,
+                initargs=(shared_map, log_queue, keyword_matcher, detailed_logging, ipv4, encoding_cache.key, run_report.profile),
+            ) as executor:
+                for output_path, error, stats in iter_results_in_order(executor, process_file_task, iter_task_args(), jobs * 2):
+                    current_file_index, file_path = submitted.popleft()
+                    if manifest is not None and error is None:
+                        try:
+                            manifest.record(file_path, output_path)
+                        except Exception as e:
+                            output_path, error = None, e
+                    run_report.add_file(file_path, output_path, error, stats)
+                    report_file_result(file_path, output_path, error, current_file_index, scan.total())
 
-    # Perform the replacement
-    return re.sub(ipv4_regex, replace_ip, line)
+            # Keep the run's mapping in this process for anything processed afterwards
+            replacement_map.collect(shared_map)
+    finally:
+        listener.stop()
 
-def detect_text_header_end(content):
+# A live log file followed as it is written
+class FollowedFile:
     """
-    Detects the end of the ASCII text header in a binary file.
-    Heuristic: Look for a non-ASCII byte or a specific delimiter (e.g., double newline).
-    Returns the byte offset where the text header ends.
-    
+    Follows a log file as lines are appended to it, obfuscating each line
+    once its newline is written and appending it to the output straight
+    away. The keyword matcher and replacement map stay in memory throughout.
+
+    When the file is rotated, replaced by a new file of the same name, the
+    rest of the old file is read before the new one is followed from its
+    start, and a file truncated in place is followed from its start again.
+    Where followed files are not kept open (see KEEP_FOLLOWED_FILES_OPEN),
+    lines written just before a rotation can be missed.
+
     Arguments:
-    content (bytes): The binary content of the file.
-    
-    Returns:
-    int: The byte offset where the ASCII text header ends.
+    file_path (str): The path to the file to follow.
+    output_path (str): The path to write the obfuscated lines to.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
     """
-    
-    for i, byte in enumerate(content):
-        # Check for non-ASCII bytes
-        if byte > 127:
-            return i
-    return len(content)  # Assume the entire content is ASCII if no non-ASCII byte is found
 
-# determine the file encoding type
-def detect_encoding(file_path):
+    def __init__(self, file_path, output_path, keyword_matcher, detailed_logging=False, ipv4=False):
+        self.file_path = file_path
+        self.output_path = output_path
+        self.keyword_matcher = keyword_matcher
+        self.detailed_logging = detailed_logging
+        self.ipv4 = ipv4
+        self.input_file = None
+        self.file_id = None  # The device and inode of the file being read
+        self.file_ids = set()  # Those of every file followed under the name
+        self.position = 0
+        self.obfuscator = None  # The Obfuscator of the file being read
+        self.encoder = None
+        ensure_output_folder(os.path.dirname(output_path))
+        self.output_file = open(output_path, "wb")
+
+    def poll(self):
+        """
+        Obfuscates the lines written since the last poll.
+
+        Returns:
+        bool: Whether anything was read.
+        """
+        read_any = self.input_file is not None and self._read_to_end()
+
+        # Only look for a rotated or truncated file once the current one is read to its end
+        if not read_any:
+            self._check_file()
+            if self.input_file is not None:
+                read_any = self._read_to_end()
+
+        if not KEEP_FOLLOWED_FILES_OPEN:
+            self._close_input()
+        return read_any
+
+    def close(self):
+        """
+        Writes out the last line, even without its newline, and closes the files.
+        """
+        self._finish_file("")
+        self._close_input()
+        if self.encoder is not None:
+            self.output_file.write(self.encoder.encode("", final=True))
+        self.output_file.close()
+
+    def _check_file(self):
+        try:
+            file_stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            # Rotated away until the new file is created. Unless it is still open, all of it has been
+            # read, and the new file is followed from its start even if it reuses the old inode
+            if self.input_file is None and self.file_id is not None:
+                self._finish_file("\n")
+                self.file_id = None
+                self.position = 0
+                self.obfuscator = None
+            return
+        except OSError:
+            return  # Not readable for now
+
+        file_id = (file_stat.st_dev, file_stat.st_ino)
+        if file_id != self.file_id or file_stat.st_size < self.position:
+            if self.file_id is not None:
+                reason = "rotated" if file_id != self.file_id else "truncated"
+                logging.info(f"Following {self.file_path} from its start, it was {reason}")
+                self._finish_file("\n")
+            self._close_input()
+            self.file_id = file_id
+            self.file_ids.add(file_id)
+            self.position = 0
+            self.obfuscator = Obfuscator(self.keyword_matcher, self.ipv4, name=self.file_path, detailed_logging=self.detailed_logging)
+
+        if self.input_file is None:
+            try:
+                self.input_file = open(self.file_path, "rb")
+            except OSError:
+                return
+            self.input_file.seek(self.position)
+
+    def _close_input(self):
+        if self.input_file is not None:
+            self.input_file.close()
+            self.input_file = None
+
+    def _read_to_end(self):
+        read_any = False
+        while True:
+            data = self.input_file.read(CHUNK_SIZE)
+            if not data:
+                return read_any
+            read_any = True
+            self.position += len(data)
+            self.obfuscator.feed(data)
+            self._write_lines("")
+
+    def _finish_file(self, end):
+        # Write out the last line of a file that will not grow any more
+        if self.obfuscator is not None:
+            self.obfuscator.close()
+            self._write_lines(end)
+
+    def _write_lines(self, end):
+        text = "".join(self.obfuscator.iter_lines())
+        if not text:
+            return
+        if not text.endswith("\n"):
+            text += end
+
+        # The output keeps the encoding of the first file followed
+        if self.encoder is None:
+            self.encoder = codecs.getincrementalencoder(self.obfuscator.encoding)(errors="ignore")
+        self.output_file.write(self.encoder.encode(text))
+        self.output_file.flush()
+
+# Find the files to follow
+def iter_follow_files(path, output_folder, include=None, exclude=None):
     """
-    Detect the encoding of a file using a heuristic approach.
+    Finds the files to follow, every file in a folder tree or the files
+    matching a path that may hold wildcards, such as 'C:\\Logs\\*.log'.
+    Archives and compressed files are left out, as they do not grow.
     
     Arguments:
-    file_path (str): Path to the file to be analyzed.
+    path (str): The path to a log file or folder, or a wildcard pattern.
+    output_folder (str): The folder where the obfuscated files will be saved.
+    include (list): Patterns a file in a folder must match one of to be followed (default: None, every file).
+    exclude (list): Patterns of files and folders in a folder to leave out (default: None).
     
     Returns:
-    str: Detected encoding type (e.g., 'utf-8', 'utf-8-sig').
+    iterator: (file path, output folder) tuples for the files.
     """
-    with open(file_path, 'rb') as f:
-        raw_data = f.read(4096)  # Read a sample of the file
-        result = chardet.detect(raw_data)
-        return result['encoding']
 
-# Process a single file
-def process_file(file_path, output_folder, current_index, total_files, keywords_dict, detailed_logging=False, ipv4=False):
+    if os.path.isdir(path):
+        folder_files = FolderScan(path, output_folder, include, exclude)
+    else:
+        folder_files = ((file_path, output_folder) for file_path in glob.glob(path) if os.path.isfile(file_path))
+
+    for file_path, current_output_folder in folder_files:
+        if get_archive_format(file_path) is None:
+            yield file_path, current_output_folder
+
+# Follow live log files until interrupted
+def follow(path, output_folder, keyword_matcher, detailed_logging=False, ipv4=False, include=None, exclude=None):
     """
-    Processes a single file to obfuscate sensitive data and saves the obfuscated content.
+    Follows a log file, the files of a folder tree or the files matching a
+    wildcard pattern, obfuscating their lines as they are written until
+    interrupted with Ctrl+C. Files created later in the folder, or matching
+    the pattern, are picked up by checking for them every FOLLOW_SCAN_INTERVAL
+    seconds, and followed from their start.
     
     Arguments:
-    file_path (str): The path to the file to be processed.
-    output_folder (str): The folder where the obfuscated file will be saved.
-    current_index (int): The current file index (for logging purposes).
-    total_files (int): The total number of files being processed.
-    keywords_dict (dict): The dictionary containing keywords and their replacement values.
+    path (str): The path to a log file or folder, or a wildcard pattern.
+    output_folder (str): The folder where the obfuscated files will be saved.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
     detailed_logging (bool): Whether to log detailed changes (default: False).
+    ipv4 (bool): Whether to obfuscate IPv4 addresses (default: False).
+    include (list): Patterns a file in a folder must match one of to be followed (default: None, every file).
+    exclude (list): Patterns of files and folders in a folder to leave out (default: None).
     """
 
+    followed_files = {}  # Followed files by path
+    output_paths = set()  # The outputs, left out when found inside the followed folder
+    last_scan = None
     try:
-        # Detect file encoding
-        encoding = detect_encoding(file_path).lower()  # Normalize to lowercase
-        #print(f"Detected encoding for {file_path}: {encoding}")
-        
-        # Construct the output file name
-        base_name = os.path.basename(file_path)
-        obfuscated_name = f"{os.path.splitext(base_name)[0]}_obfuscated{os.path.splitext(base_name)[1]}"
-        output_path = os.path.join(output_folder, obfuscated_name)
-
-        # Handle UTF-8-BOM encoded files differently
-        if encoding == 'utf-8-sig':
-            #print(f"***Processing UTF-8-BOM file: {file_path}")
-            
-            # Read the file as text, including the BOM
-            with open(file_path, "r", encoding="utf-8-sig") as input_file:
-                content = input_file.read()
-            #logging.debug(f"Content read from file {file_path}:\n{repr(content)}")
-
-            # Strip the BOM for processing
-            bom = "\ufeff"  # BOM character
-            if content.startswith(bom):
-                content = content.lstrip(bom)  # Remove BOM
-
-            # Obfuscate the content
-            obfuscated_content = obfuscate_content(content, file_path, keywords_dict, detailed_logging, ipv4)
-
-            # Reapply the BOM when saving the file
-            with open(output_path, "w", encoding="utf-8-sig") as output_file:
-                output_file.write(bom + obfuscated_content)
-            
-            #print(f"Processed UTF-8-BOM file: {file_path} -> {output_path}")
-        else:
-            #print(f"Processing file with encoding {encoding}: {file_path}")
+        while True:
+            if last_scan is None or time.monotonic() - last_scan >= FOLLOW_SCAN_INTERVAL:
+                last_scan = time.monotonic()
+                for file_path, current_output_folder in iter_follow_files(path, output_folder, include, exclude):
+                    output_path = get_output_path(file_path, current_output_folder)
+                    if (file_path in followed_files or os.path.basename(file_path).startswith(OWN_FILE_PREFIX)
+                            or os.path.normcase(os.path.abspath(file_path)) in output_paths):
+                        continue
 
-            # Read the file in binary mode
-            with open(file_path, "rb") as input_file:
-                content = input_file.read()
+                    # A rotated file is found under its new name, but was followed under its old one
+                    try:
+                        file_stat = os.stat(file_path)
+                    except OSError:
+                        continue  # Removed since it was found, or not readable, until the next check
+                    file_id = (file_stat.st_dev, file_stat.st_ino)
+                    if any(file_id in followed_file.file_ids for followed_file in followed_files.values()):
+                        continue
 
-            # Detect the end of the ASCII text header
-            text_header_end = detect_text_header_end(content)
+                    logging.info(f"Following {file_path} -> {output_path}")
+                    print(f"Following {file_path} -> {output_path}")
+                    followed_files[file_path] = FollowedFile(file_path, output_path, keyword_matcher, detailed_logging, ipv4)
+                    output_paths.add(os.path.normcase(os.path.abspath(output_path)))
 
-            # Separate the text header and binary body
-            text_header = content[:text_header_end]
-            binary_body = content[text_header_end:]
+            read_any = False
+            for followed_file in followed_files.values():
+                read_any = followed_file.poll() or read_any
+            if read_any:
+                replacement_map.flush()
+            else:
+                time.sleep(FOLLOW_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        logging.info("Stopped following.")
+        print("Stopped following.")
+    finally:
+        for followed_file in followed_files.values():
+            followed_file.close()
+        replacement_map.flush()
 
-            # Decode and process the text header
-            try:
-                text_header_decoded = text_header.decode(encoding, errors="ignore")
-            except UnicodeDecodeError as e:
-                logging.error(f"Error decoding text header in file {file_path}: {e}")
-                text_header_decoded = ""
+# Scan a stream for what obfuscation would replace
+def scan_stream(name, input_file, keyword_matcher, ipv4=False, max_hits=None):
+    """
+    Finds what the rules would replace in a file opened for reading in binary
+    mode, without writing anything. The same text is scanned as obfuscation
+    would change: all of a UTF-8-BOM file and the text header of any other.
+    Blocks of whole lines are searched at once for anything a rule could
+    match, and only the lines of the blocks that could hold a hit are run
+    through the rule scanner.
+    
+    Arguments:
+    name (str): The path the file is reported with, and its encoding cached by.
+    input_file (file): The file to scan, opened for reading in binary mode.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    ipv4 (bool): Whether to scan for IPv4 addresses (default: False).
+    max_hits (int): The number of hits to stop scanning the file at (default: None, scan it all).
+    
+    Returns:
+    dict: The path, encoding, lines scanned, hits of each rule and the line
+          and offset of the first hits, and whether the scan stopped at max_hits.
+    """
 
-            obfuscated_header = obfuscate_content(text_header_decoded, file_path, keywords_dict, detailed_logging, ipv4)
+    input_file = io.BufferedReader(input_file, max(CHUNK_SIZE, ENCODING_SAMPLE_SIZE))
+    sample = input_file.peek(ENCODING_SAMPLE_SIZE)[:ENCODING_SAMPLE_SIZE]
+    encoding = detect_encoding(name, sample).lower()  # Normalize to lowercase
 
-            # Write the obfuscated header and untouched binary body to the output file
-            with open(output_path, "wb") as output_file:
-                output_file.write(obfuscated_header.encode(encoding, errors="ignore"))
-                output_file.write(binary_body)
-           
-            #print(f"Processed file with encoding {encoding}: {file_path} -> {output_path}")
-
-        progress = f"Processing file {current_index} of {total_files}"
-        logging.info(f"{progress}: {file_path} -> {output_path}")
-        print(f"{progress}: {file_path} -> {output_path}")
-    except Exception as e:
-        logging.error(f"Error processing file {file_path}: {e}")
-        print(f"Error processing file {file_path}: {e}")
+    def read_text(input_file):
+        decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+        while True:
+            chunk = read_chunk(input_file)
+            if not chunk:
+                break
+            text_header_end = len(chunk) if encoding == 'utf-8-sig' else detect_text_header_end(chunk)
+            yield decoder.decode(chunk[:text_header_end])
+            if text_header_end < len(chunk):
+                break
+        yield decoder.decode(b"", final=True)
 
-# Updated process_folder function to include detailed_logging
-def process_folder(folder_path, output_folder, keywords_dict, detailed_logging, ipv4):
+    rule_scanner = get_rule_scanner(keyword_matcher, ipv4)
+    hits = dict.fromkeys(RULE_NAMES.values(), 0)
+    samples = []
+    line_number = 1
+
+    def scan_lines(text):
+        # Scans whole lines, each ending with a newline, returning whether max_hits was reached
+        nonlocal line_number
+        if not rule_scanner.may_change(text):
+            line_number += text.count("\n")
+            return False
+        for line in text[:-1].split("\n"):
+            for rule, offset, before, after in rule_scanner.obfuscate_line(line)[1]:
+                hits[RULE_NAMES[rule]] += 1
+                if len(samples) < SCAN_SAMPLES:
+                    samples.append({"rule": RULE_NAMES[rule], "line": line_number, "offset": offset})
+            if max_hits and sum(hits.values()) >= max_hits:
+                return True
+            line_number += 1
+        return False
+
+    stopped = False
+    for text in iter_line_blocks(read_text(input_file)):
+        if not text.endswith("\n"):
+            text += "\n"  # The last line, without its newline
+        if scan_lines(text):
+            stopped = True
+            break
+
+    return {
+        "path": name,
+        "encoding": encoding,
+        "lines": line_number if stopped else line_number - 1,
+        "hits": hits,
+        "samples": samples,
+        "stopped": stopped,
+    }
+
+# Scan a file, or the members of an archive, for what obfuscation would replace
+def scan_file(file_path, keyword_matcher, ipv4=False, max_hits=None):
     """
-    Processes all files in a specified directory, obfuscating sensitive data and saving the results.
+    Runs scan_stream over a file, or over each member of an archive or
+    compressed file as it is decompressed.
     
     Arguments:
-    directory (str): The path to the directory containing files to be processed.
-    output_folder (str): The folder where the obfuscated files will be saved.
-    keywords_dict (dict): The dictionary containing keywords and their replacement values.
-    detailed_logging (bool): Whether to log detailed changes (default: False).
+    file_path (str): The path to the file to be scanned.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    ipv4 (bool): Whether to scan for IPv4 addresses (default: False).
+    max_hits (int): The number of hits to stop scanning a file at (default: None, scan it all).
+    
+    Returns:
+    list: The results of scan_stream, one for each file scanned.
+    """
+
+    if get_archive_format(file_path) is None:
+        with open(file_path, "rb") as input_file:
+            return [scan_stream(file_path, input_file, keyword_matcher, ipv4, max_hits)]
+
+    results = []
+    for name, mtime, mode, member_file in iter_archive_members(file_path):
+        if member_file is not None:
+            member_path = os.path.join(file_path, *name.split("/")) if name else file_path
+            results.append(scan_stream(member_path, member_file, keyword_matcher, ipv4, max_hits))
+    return results
+
+# Scan a single file in a worker process of a parallel scan
+def scan_file_task(file_path, max_hits):
+    """
+    Runs scan_file with the worker's settings. Errors are returned rather
+    than raised so the main process can report every file in order.
+    
+    Returns:
+    tuple: The results of the file and the error message (or None).
     """
 
     try:
-        total_files, total_folders = count_files_and_folders(folder_path)
-        current_file_index = 0
-
-        logging.info(f"Total files to process: {total_files}")
-        logging.info(f"Total folders to process: {total_folders}")
-        print(f"Total files to process: {total_files}")
-        print(f"Total folders to process: {total_folders}")
-
-        # Walk through the directory tree
-        for root, dirs, files in os.walk(folder_path):
-            relative_path = os.path.relpath(root, folder_path)
-            current_output_folder = os.path.join(output_folder, relative_path)
-            ensure_output_folder(current_output_folder)
-
-            for file_name in files:
-                current_file_index += 1
-                file_path = os.path.join(root, file_name)
-                process_file(file_path, current_output_folder, current_file_index, total_files, keywords_dict, detailed_logging, ipv4)
-
-        logging.info(f"Processed {total_files} files across {total_folders} folders.")
-        print(f"Processed {total_files} files across {total_folders} folders.")
+        return scan_file(file_path, worker_settings["keyword_matcher"], worker_settings["ipv4"], max_hits), None
     except Exception as e:
-        logging.error(f"Error processing folder {folder_path}: {e}")
-        print(f"Error processing folder {folder_path}: {e}")
+        return [], str(e)
 
-# Count total files and folders
-def count_files_and_folders(folder_path):
+# Scan files for sensitive data without obfuscating them
+def scan(path, report_folder, keyword_matcher, ipv4=False, jobs=1, max_hits=None, include=None, exclude=None,
+         report_output=None):
     """
-    Counts the total number of files and folders in a specified directory 
-    and its subdirectories.
-
+    Scans a file, a folder or standard input for the URLs, IPv4 addresses and
+    keywords obfuscation would replace, writing no output but a JSON report
+    of the files with hits, the hits of each rule and where the first are.
+    
     Arguments:
-    folder_path (str): The path to the directory where the files and folders 
-                       will be counted.
-
+    path (str): The path to a file or folder, or - for standard input.
+    report_folder (str): The folder to save the report to, None to write it to report_output.
+    keyword_matcher (KeywordMatcher): The compiled keywords and their replacement values.
+    ipv4 (bool): Whether to scan for IPv4 addresses (default: False).
+    jobs (int): The number of worker processes to spread a folder's files across (default: 1).
+    max_hits (int): The number of hits to stop scanning a file at (default: None, scan it all).
+    include (list): Patterns a file in a folder must match one of to be scanned (default: None, every file).
+    exclude (list): Patterns of files and folders in a folder to leave out (default: None).
+    report_output (file): The text stream to write the report to without a report folder (default: None, only print the totals).
+    
     Returns:
-    tuple: A tuple containing:
-           - The total number of files in the directory (int).
-           - The total number of folders in the directory (int).
+    int: The number of files with hits.
     """
 
-    total_files = 0
-    total_folders = 0
-    for root, dirs, files in os.walk(folder_path):
-        total_files += len(files)
-        total_folders += len(dirs)
-    return total_files, total_folders
+    started = datetime.now()
+    start = time.perf_counter()
+    results, errors = [], []
+
+    def add_results(file_path, file_results, error):
+        if error is not None:
+            logging.error(f"Error scanning file {file_path}: {error}")
+            print(f"Error scanning file {file_path}: {error}")
+            errors.append({"path": file_path, "error": str(error)})
+        for result in file_results:
+            results.append(result)
+            total = sum(result["hits"].values())
+            if total:
+                found = ", ".join(f"{rule} {count}" for rule, count in result["hits"].items())
+                more = " or more" if result["stopped"] else ""
+                logging.info(f"{total}{more} hits in {result['path']} ({found})")
+                print(f"{total}{more} hits in {result['path']} ({found})")
+
+    if path == "-":
+        add_results("<stdin>", [scan_stream("<stdin>", sys.stdin.buffer, keyword_matcher, ipv4, max_hits)], None)
+    elif os.path.isfile(path):
+        try:
+            add_results(path, scan_file(path, keyword_matcher, ipv4, max_hits), None)
+        except Exception as e:
+            add_results(path, [], e)
+    elif jobs > 1:
+        scan_paths = collections.deque()  # The path of each file handed to the workers
+
+        def iter_task_args():
+            for file_path, output_folder in FolderScan(path, "", include, exclude):
+                scan_paths.append(file_path)
+                yield file_path, max_hits
+
+        log_queue = multiprocessing.Queue()
+        listener = start_log_listener(log_queue)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=init_worker,
+                initargs=(ScanReplacementMap(), log_queue, keyword_matcher, False, ipv4, encoding_cache.key),
+            ) as executor:
+                for file_results, error in iter_results_in_order(executor, scan_file_task, iter_task_args(), jobs * 2):
+                    add_results(scan_paths.popleft(), file_results, error)
+        finally:
+            listener.stop()
+    else:
+        for file_path, output_folder in FolderScan(path, "", include, exclude):
+            try:
+                add_results(file_path, scan_file(file_path, keyword_matcher, ipv4, max_hits), None)
+            except Exception as e:
+                add_results(file_path, [], e)
+
+    seconds = time.perf_counter() - start
+    hit_files = [result for result in results if any(result["hits"].values())]
+    hits = {rule: sum(result["hits"][rule] for result in results) for rule in RULE_NAMES.values()}
+    logging.info(f"Scanned {len(results)} files, {len(hit_files)} with hits.")
+    print(f"Scanned {len(results)} files, {len(hit_files)} with hits.")
+
+    if report_folder is not None or report_output is not None:
+        report = {
+            "version": VERSION,
+            "started": started.isoformat(timespec="seconds"),
+            "seconds": round(seconds, 3),
+            "max_hits": max_hits,
+            "totals": {
+                "files": len(results),
+                "files_with_hits": len(hit_files),
+                "errors": len(errors),
+                "lines": sum(result["lines"] for result in results),
+                "hits": hits,
+            },
+            "files": hit_files,
+            "errors": errors,
+        }
+        if report_folder is None:
+            json.dump(report, report_output, indent=1)
+            report_output.write("\n")
+        else:
+            report_path = os.path.join(report_folder, f"{OWN_FILE_PREFIX}scan_{started.strftime('%Y%m%d_%H%M%S')}.json")
+            with open(report_path, "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, indent=1)
+            logging.info(f"Scan report saved to {report_path}")
+            print(f"Scan report saved to {report_path}")
+
+    return len(hit_files)
 
 # Main function
 def main():
     import argparse
+    global replacement_map, run_report
 
     parser = argparse.ArgumentParser(description="Obfuscate sensitive data in log files.")
-    parser.add_argument("path", nargs="?", help="Path to a log file or folder containing log files.")
+    parser.add_argument("path", nargs="?", help="Path to a log file or folder containing log files, or - to obfuscate "
+                                                "standard input to standard output. Archives and compressed files "
+                                                "(.zip, .tar, .gz, .bz2, .xz) are read without extracting them.")
+    parser.add_argument(
+        "-a", "--output-archive",
+        help="Path to a .zip or .tar (optionally .gz, .bz2 or .xz compressed) archive to write the obfuscated "
+             "files into, keeping the folder structure, instead of the output folder (optional)."
+    )
     parser.add_argument(
         "-d", "--detailed", 
         action="store_true", 
-        help="Enable detailed logging of individual obfuscations (default: off)."
+        help="Enable detailed logging of individual obfuscations to a JSON Lines change log (default: off)."
+    )
+    parser.add_argument(
+        "-e", "--encoding-cache",
+        choices=("folder", "pattern"),
+        help="Reuse the encoding detected for a file for the other files in its folder, "
+             "or in its folder with the same name apart from digits (default: off)."
+    )
+    parser.add_argument(
+        "-f", "--follow",
+        action="store_true",
+        help="Keep following the file, every file in the folder or the files matching a wildcard pattern such as "
+             "'logs/*.log', obfuscating lines as they are written, including after log rotation, and picking up "
+             "new files, until stopped with Ctrl+C (default: off)."
+    )
+    parser.add_argument(
+        "-I", "--include",
+        action="append",
+        metavar="PATTERN",
+        help="Only process the files of a folder matching a wildcard pattern such as '*.log', matched against "
+             "the file name, or the path within the folder if the pattern holds a '/'. Can be given more than once (optional)."
     )
     parser.add_argument(
         "-i", "--ipv4",
         action="store_true",
         help="Enable obfuscation of IPv4 addresses (default: off)."
     )   
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes to spread a folder's files, or the chunks of a single large file, "
+             "across, 0 uses every CPU (default: 1)."
+    )
     parser.add_argument(
         "-k", "--keywords", 
         help="Path to the keyword .ini file (optional). If not provided, defaults to the script's local .ini file."
     )
+    mapping_group = parser.add_mutually_exclusive_group()
+    mapping_group.add_argument(
+        "-H", "--hash-key-file",
+        help="Path to a file holding a secret key. Domains and IPs are replaced with values derived from "
+             "a keyed hash, the same in every run with the key, instead of being numbered. IPs are replaced "
+             "with 192.0.2.N, N above 999, which is never an address left unchanged in the log (optional)."
+    )
+    mapping_group.add_argument(
+        "-m", "--mapping-store",
+        help="Path to a SQLite database to keep the domain and IP mapping in, so values map to the same "
+             "replacements in every run using it. Created if it does not exist (optional)."
+    )
+    parser.add_argument(
+        "--map-memory",
+        type=int,
+        metavar="MB",
+        help="Bound the memory the run's domain and IP mapping takes, moving its values to a temporary "
+             "database on disk whenever they would take more (default: no bound)."
+    )
+    parser.add_argument(
+        "--map-spill-folder",
+        metavar="FOLDER",
+        help="Folder for the temporary database of the mapping bounded by --map-memory "
+             "(default: the system's temporary folder)."
+    )
+    parser.add_argument(
+        "--no-keyword-cache",
+        action="store_true",
+        help="Compile the keywords afresh instead of loading them from the cache of compiled keyword files, "
+             "and do not save them to it (default: off)."
+    )
     parser.add_argument("-o", "--output", help="Path to the output folder (optional).")
+    parser.add_argument(
+        "-p", "--profile",
+        action="store_true",
+        help="Profile the run, in worker processes as well, saving the profile as a .pstats file next to the "
+             "run report and listing its slowest functions in the report (default: off)."
+    )
+    parser.add_argument(
+        "-r", "--incremental",
+        action="store_true",
+        help="Skip files unchanged since the last incremental run into the output folder, "
+             "keeping its domain and IP mapping (default: off)."
+    )
+    parser.add_argument(
+        "--scan",
+        action="store_true",
+        help="Only scan for what would be obfuscated, writing no output but a JSON report of the files with "
+             "hits, the hits of each rule and the lines they are on, into the output folder or else to standard "
+             "output. Exits with status 2 if anything is found (default: off)."
+    )
+    parser.add_argument(
+        "--scan-limit",
+        type=int,
+        metavar="HITS",
+        help="Stop scanning a file once this many hits are found in it (default: scan every file to the end)."
+    )
+    parser.add_argument(
+        "-s", "--stdout",
+        action="store_true",
+        help="Write the obfuscated file, or the content of a compressed file, to standard output instead of a file. "
+             "Messages go to standard error, and the log file is only written with an output folder (default: off)."
+    )
+    parser.add_argument(
+        "-X", "--exclude",
+        action="append",
+        metavar="PATTERN",
+        help="Leave out the files and folders of a folder matching a wildcard pattern, such as '*.dmp' or "
+             "'*.etl' for binary dumps and traces. Can be given more than once (optional)."
+    )
     parser.add_argument("-v", "--version", action="store_true", help="Display the version of the script.")
 
     args = parser.parse_args()
@@ -551,11 +4847,70 @@ def main():
         print("Error: You must specify a path to a file or folder.")
         sys.exit(1)
 
-    if not os.path.exists(args.path):
+    if args.jobs < 0:
+        print("Error: The number of jobs cannot be negative.")
+        sys.exit(1)
+    jobs = args.jobs or os.cpu_count() or 1
+
+    if args.scan_limit is not None and (args.scan_limit < 1 or not args.scan):
+        print("Error: The scan limit must be a positive number of hits, given with --scan.")
+        sys.exit(1)
+    if args.scan and (args.output_archive or args.detailed or args.follow or args.hash_key_file
+                      or args.mapping_store or args.incremental or args.stdout or args.map_memory is not None):
+        print("Error: A scan writes no output, so cannot be combined with options for the output or mapping.")
+        sys.exit(1)
+
+    if args.map_memory is not None and args.map_memory < 1:
+        print("Error: The memory of the mapping must be a positive number of MB.")
+        sys.exit(1)
+    if args.map_spill_folder and args.map_memory is None:
+        print("Error: A spill folder is only used with --map-memory.")
+        sys.exit(1)
+    if args.map_spill_folder and not os.path.isdir(args.map_spill_folder):
+        print(f"Error: The spill folder does not exist: {args.map_spill_folder}")
+        sys.exit(1)
+    if args.map_memory is not None and (args.hash_key_file or args.mapping_store):
+        print("Error: --map-memory bounds the mapping numbered within the run, so cannot be combined "
+              "with a hash key or mapping store.")
+        sys.exit(1)
+
+    # Piped output goes to standard output, so messages go to standard error
+    standard_output = sys.stdout
+    pipe = args.path == "-" or args.stdout
+    if pipe:
+        pipe_output = sys.stdout.buffer
+        sys.stdout = sys.stderr
+        if args.follow or args.output_archive or args.incremental:
+            print("Error: Writing to standard output cannot be combined with --follow, an output archive or --incremental.")
+            sys.exit(1)
+        path_format = get_archive_format(args.path)
+        if args.path != "-" and (os.path.isdir(args.path) or path_format is not None and path_format[1] != "compressed"):
+            print(f"Error: Only a single file or compressed file can be written to standard output: {args.path}")
+            sys.exit(1)
+        if (args.detailed or args.profile) and not args.output:
+            print("Error: Detailed logging or profiling with standard output needs an output folder for the change log or profile.")
+            sys.exit(1)
+
+    # A scan without an output folder writes no files, its report going to standard output
+    if args.scan and not args.output:
+        sys.stdout = sys.stderr
+        if args.profile:
+            print("Error: Profiling a scan needs an output folder for the profile.")
+            sys.exit(1)
+
+    # A followed path can be a wildcard pattern, matching files that may not exist yet
+    follow_pattern = args.follow and any(character in args.path for character in "*?[")
+    if follow_pattern and not args.output and any(character in os.path.dirname(args.path) for character in "*?["):
+        print("Error: An output folder must be given to follow a pattern with wildcards in its folders.")
+        sys.exit(1)
+
+    if not follow_pattern and args.path != "-" and not os.path.exists(args.path):
         print(f"Error: The specified path does not exist: {args.path}")
         sys.exit(1)
 
-    if os.path.isfile(args.path):
+    if pipe or args.scan:
+        default_output_folder = None  # Nothing is written to a folder unless one is given
+    elif os.path.isfile(args.path) or follow_pattern:
         default_output_folder = os.path.dirname(args.path)
     elif os.path.isdir(args.path):
         default_output_folder = args.path
@@ -563,24 +4918,167 @@ def main():
         print(f"Error: The specified path is neither a file nor a folder: {args.path}")
         sys.exit(1)
 
+    output_archive_format = args.output_archive and get_archive_format(args.output_archive)
+    if args.output_archive and (not output_archive_format or output_archive_format[1] == "compressed"):
+        print(f"Error: The output archive must be a .zip, .tar, .tar.gz, .tar.bz2 or .tar.xz file: {args.output_archive}")
+        sys.exit(1)
+    if args.output_archive and args.incremental:
+        print("Error: An output archive is written afresh by every run, so cannot be used with --incremental.")
+        sys.exit(1)
+    if args.follow and (args.output_archive or args.incremental):
+        print("Error: Following files cannot be combined with an output archive or --incremental.")
+        sys.exit(1)
+
     output_folder = args.output if args.output else default_output_folder
-    ensure_output_folder(output_folder)
-    log_file = setup_logging(output_folder)
+    if output_folder is None:
+        # Without a log file, only warnings and errors are logged, to standard error
+        logging.basicConfig(stream=sys.stderr, level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+        log_file = None
+    else:
+        ensure_output_folder(output_folder)
+        log_file = setup_logging(output_folder)
+
+    encoding_cache.key = args.encoding_cache
+
+    run_report = RunReport(args.profile)
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
 
     # Load keywords from the specified or default .ini file
-    keywords_dict = load_keywords_from_file(args.keywords, __file__)
+    keyword_matcher = load_keywords_from_file(args.keywords, __file__, not args.no_keyword_cache, args.ipv4)
 
     print("Starting the obfuscation process...")
+    change_log_listener = None
     if args.detailed:
-        print("Detailed logging is enabled. Changes will be logged.")
+        change_log, change_log_listener = setup_change_log(output_folder)
+        logging.info(f"Detailed changes are written to {change_log}")
+        print(f"Detailed logging is enabled. Changes will be logged to {change_log}")
+
+    # Where replacements come from, if not numbered within the run
+    mapping = None
+    if args.hash_key_file:
+        try:
+            with open(args.hash_key_file, "rb") as key_file:
+                key = key_file.read().strip()
+        except OSError as e:
+            logging.error(f"Error reading hash key file {args.hash_key_file}: {e}")
+            print(f"Error: Cannot read the hash key file {args.hash_key_file}: {e}")
+            sys.exit(1)
+        if not key:
+            print(f"Error: The hash key file is empty: {args.hash_key_file}")
+            sys.exit(1)
+        replacement_map = HashedReplacementMap(key)
+        mapping = "hmac-reserved:" + hashlib.sha256(key).hexdigest()  # Outputs of the older IPv4 hashing are redone
+        logging.info("Using keyed hash replacements.")
+    elif args.mapping_store:
+        try:
+            replacement_map = StoredReplacementMap(args.mapping_store)
+        except sqlite3.Error as e:
+            logging.error(f"Error opening mapping store {args.mapping_store}: {e}")
+            print(f"Error: Cannot open the mapping store {args.mapping_store}: {e}")
+            sys.exit(1)
+        mapping = "store:" + os.path.abspath(args.mapping_store)
+        logging.info(f"Using mapping store: {args.mapping_store}")
+    elif args.map_memory is not None:
+        replacement_map = CompactReplacementMap(args.map_memory * 1024 * 1024, args.map_spill_folder)
+        logging.info(f"Bounding the mapping to {args.map_memory} MB in memory.")
+
+    output_archive = None
+    if args.output_archive:
+        try:
+            output_archive = ArchiveWriter(args.output_archive, output_folder)
+        except OSError as e:
+            logging.error(f"Error creating output archive {args.output_archive}: {e}")
+            print(f"Error: Cannot create the output archive {args.output_archive}: {e}")
+            sys.exit(1)
+        logging.info(f"Writing obfuscated files to {args.output_archive}")
+
+    # Pick up the files and mapping of the last incremental run, unless the
+    # mapping comes from elsewhere
+    manifest = None
+    if args.incremental:
+        manifest = RunManifest(output_folder, args.path, run_fingerprint(keyword_matcher, args.ipv4, mapping))
+        if mapping is None:
+            replacement_map.update(manifest.replacements.items())
 
-    if os.path.isfile(args.path):
-        process_file(args.path, output_folder, 1, 1, keywords_dict, args.detailed, args.ipv4)
+    hit_files = 0
+    if args.scan:
+        replacement_map = ScanReplacementMap()  # Nothing found is kept
+        hit_files = scan(args.path, output_folder, keyword_matcher, args.ipv4, jobs, args.scan_limit, args.include, args.exclude,
+                         standard_output)
+    elif pipe:
+        try:
+            if args.path == "-":
+                obfuscate_piped_stream(sys.stdin.buffer, pipe_output, keyword_matcher, args.detailed, args.ipv4)
+            else:
+                obfuscate_file_to_stream(args.path, pipe_output, keyword_matcher, args.detailed, args.ipv4)
+        except BrokenPipeError:
+            # The reader of the output stopped early, as 'head' does
+            os.dup2(os.open(os.devnull, os.O_WRONLY), pipe_output.fileno())
+            logging.warning("Standard output was closed before all of the input was obfuscated.")
+        except OSError as e:
+            logging.error(f"Error processing file {args.path}: {e}")
+            print(f"Error processing file {args.path}: {e}")
+            sys.exit(1)
+    elif args.follow:
+        print("Following files for new lines, press Ctrl+C to stop.")
+        follow(args.path, output_folder, keyword_matcher, args.detailed, args.ipv4, args.include, args.exclude)
+    elif os.path.isfile(args.path):
+        process_file(args.path, output_folder, 1, 1, keyword_matcher, args.detailed, args.ipv4, manifest, jobs, output_archive)
     elif os.path.isdir(args.path):
-        process_folder(args.path, output_folder, keywords_dict, args.detailed, args.ipv4)
+        process_folder(args.path, output_folder, keyword_matcher, args.detailed, args.ipv4, jobs, manifest, output_archive,
+                       args.include, args.exclude)
+
+    if output_archive is not None:
+        output_archive.close()
+
+    if manifest is not None:
+        manifest.save(replacement_map.items() if mapping is None else [])
+    mapping_footprint = None
+    if isinstance(replacement_map, (ReplacementMap, CompactReplacementMap)):
+        mapping_footprint = replacement_map.footprint()
+        logging.info(
+            f"Mapping: {mapping_footprint['values']} values, at most {mapping_footprint['peak_memory_bytes'] / 1e6:.1f} MB "
+            f"in memory, {mapping_footprint['spilled_values']} spilled to disk ({mapping_footprint['spill_bytes'] / 1e6:.1f} MB)"
+        )
+    replacement_map.close()
+
+    if change_log_listener is not None:
+        change_log_listener.stop()
+        for handler in change_log_listener.handlers:
+            handler.close()
+
+    # Counts of followed or piped input, not taken by a file of the report
+    run_report.add_counts(get_rule_scanner(keyword_matcher, args.ipv4).pop_counts())
+    log_prefilter_counts(run_report.counts)
+
+    if output_folder is not None:
+        timestamp = run_report.started.strftime('%Y%m%d_%H%M%S')
+        profile_stats = None
+        if profiler is not None:
+            profiler.disable()
+            profile_stats = run_report.merge_profile(profiler)
+            profile_path = os.path.join(output_folder, f"{OWN_FILE_PREFIX}profile_{timestamp}.pstats")
+            profile_stats.dump_stats(profile_path)
+            logging.info(f"Profile saved to {profile_path}")
+            print(f"Profile saved to {profile_path}")
+        if not args.scan:  # Which saves a report of its own
+            report_path = os.path.join(output_folder, f"{OWN_FILE_PREFIX}report_{timestamp}.json")
+            run_report.save(report_path, profile_stats, mapping_footprint)
+            logging.info(f"Run report saved to {report_path}")
+            print(f"Run report saved to {report_path}")
 
     logging.info("Obfuscation process completed.")
-    print(f"Obfuscation process completed. Log file created: {log_file}")
+    if log_file is None:
+        print("Obfuscation process completed.")
+    else:
+        print(f"Obfuscation process completed. Log file created: {log_file}")
+
+    if hit_files:
+        sys.exit(2)  # The scan found something to obfuscate
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Needed for worker processes of the compiled executable
     main()
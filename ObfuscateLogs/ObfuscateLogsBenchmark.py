@@ -0,0 +1,561 @@
+# ObfuscateLogsBenchmark.py
+#
+# Copyright (C) 2026, David C. Merritt, david.c.merritt@siemens.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ---------------------------------------------------------------------
+#
+# Script to benchmark the performance of ObfuscateLogs.py. 
+#
+# ---------------------------------------------------------------------
+#
+# 2026-10-18 dcm initial release, text header detection micro-benchmark
+#                added --suite to benchmark the obfuscation stages over a
+#                synthetic corpus, with baselines to compare runs against
+#                compile_cached stage, loading the keywords from the keyword cache
+#                keyword cache of the stages kept in the suite's work folder
+#
+
+import os
+import sys
+import io
+import time
+import json
+import random
+import shutil
+import string
+import logging
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ObfuscateLogs
+
+# Sizes used when none are given on the command line
+DEFAULT_SIZES = ["1M", "16M", "128M", "1G"]
+
+# Encodings the synthetic corpus can mix, in the order files cycle through them
+CORPUS_ENCODINGS = ["ascii", "utf-8-bom", "utf-16", "text-header-binary"]
+
+# Keyword file sizes the suite is run with when none are given
+DEFAULT_KEYWORD_COUNTS = [10, 1000, 100000]
+
+# Fraction slower than the baseline a stage can be before it counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+# Parse a size such as 512K, 16M or 1G into bytes
+def parse_size(size):
+    """
+    Converts a size with an optional K, M or G suffix into a number of bytes.
+    
+    Arguments:
+    size (str): The size to convert.
+    
+    Returns:
+    int: The size in bytes.
+    """
+
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    size = size.strip().upper()
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+# Format a number of bytes for display
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+# The original per-byte loop, kept as the baseline for comparison
+def legacy_detect_text_header_end(content):
+    for i, byte in enumerate(content):
+        if byte > 127:
+            return i
+    return len(content)
+
+# Time a header detection function over a file streamed in chunks
+def time_header_detection(detect, chunk, total_size):
+    """
+    Times the detection of the text header end over a pure-ASCII file of
+    total_size bytes, streamed in chunks the way process_file reads it. The
+    same chunk is reused so large sizes don't need the memory to hold them.
+    
+    Arguments:
+    detect (callable): The header detection function to time.
+    chunk (bytes): An ASCII chunk of CHUNK_SIZE bytes.
+    total_size (int): The size of the simulated file in bytes.
+    
+    Returns:
+    float: The elapsed time in seconds.
+    """
+
+    full_chunks, remainder = divmod(total_size, len(chunk))
+    start = time.perf_counter()
+    for _ in range(full_chunks):
+        assert detect(chunk) == len(chunk)
+    if remainder:
+        detect(chunk[:remainder])
+    return time.perf_counter() - start
+
+# Benchmark the text header detection
+def benchmark_header_detection(sizes, legacy_limit):
+    """
+    Compares the per-byte loop text header detection with the block scan in
+    ObfuscateLogs.detect_text_header_end, printing a table of the timings.
+    The per-byte loop is extrapolated from its largest measured size for
+    sizes above legacy_limit, as it takes minutes on a 1 GB file.
+    
+    Arguments:
+    sizes (list): The simulated file sizes in bytes.
+    legacy_limit (int): The largest size to time the per-byte loop on.
+    """
+
+    line = b"2024-11-29 12:00:00.000 INFO [worker-1] Connected to server01 at 10.0.0.1 version 1.2.3\r\n"
+    chunk = (line * (ObfuscateLogs.CHUNK_SIZE // len(line) + 1))[:ObfuscateLogs.CHUNK_SIZE]
+
+    print("Text header detection (pure-ASCII file, streamed in "
+          f"{format_size(ObfuscateLogs.CHUNK_SIZE)} chunks)")
+    print(f"{'Size':>10}  {'Per-byte loop':>16}  {'Block scan':>12}  {'Block MB/s':>11}  {'Speedup':>9}")
+
+    legacy_rate = None  # seconds per byte of the largest measured per-byte loop run
+    for size in sizes:
+        if size <= legacy_limit or legacy_rate is None:
+            legacy_time = time_header_detection(legacy_detect_text_header_end, chunk, size)
+            legacy_rate = legacy_time / size
+            legacy_text = f"{legacy_time:.3f} s"
+        else:
+            legacy_time = legacy_rate * size
+            legacy_text = f"~{legacy_time:.3f} s"
+
+        block_time = time_header_detection(ObfuscateLogs.detect_text_header_end, chunk, size)
+        throughput = size / (1024 ** 2) / block_time if block_time else float("inf")
+        speedup = legacy_time / block_time if block_time else float("inf")
+        print(f"{format_size(size):>10}  {legacy_text:>16}  {block_time:>10.4f} s  {throughput:>11.0f}  {speedup:>8.0f}x")
+
+# Generate the keywords of a keyword file
+def generate_keywords(count, seed):
+    """
+    Generates distinct random keywords. The same seed always gives the same
+    keywords in the same order, so a smaller set is the start of a larger one.
+    
+    Arguments:
+    count (int): The number of keywords.
+    seed (int): The seed of the random generator.
+    
+    Returns:
+    list: The keywords.
+    """
+
+    rng = random.Random(seed)
+    keywords = []
+    seen = set()
+    while len(keywords) < count:
+        keyword = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 14)))
+        if keyword not in seen:
+            seen.add(keyword)
+            keywords.append(keyword)
+    return keywords
+
+# Write a keyword .ini file
+def write_keyword_file(ini_path, keywords):
+    with open(ini_path, "w") as ini_file:
+        ini_file.write("[benchmark]\n")
+        for index, keyword in enumerate(keywords):
+            ini_file.write(f"{keyword}=generic_keyword_{index}\n")
+
+# Generate the lines of a synthetic log
+def generate_lines(rng, size, url_density, ipv4_density, keyword_rate, keywords, non_ascii=False):
+    """
+    Generates log lines of about size characters in total, with the given
+    fractions of lines holding a URL, an IPv4 address and a keyword.
+    
+    Arguments:
+    rng (random.Random): The random generator.
+    size (int): The number of characters to generate.
+    url_density (float): The fraction of lines with a URL.
+    ipv4_density (float): The fraction of lines with an IPv4 address.
+    keyword_rate (float): The fraction of lines with a keyword.
+    keywords (list): The keywords lines are given.
+    non_ascii (bool): Whether lines can hold non-ASCII characters (default: False).
+    
+    Returns:
+    list: The lines, each ending with a newline.
+    """
+
+    levels = ["INFO", "WARN", "DEBUG", "ERROR"]
+    words = ["connected", "request", "completed", "retrying", "session", "closed", "timeout", "user", "queue", "cache"]
+    if non_ascii:
+        words += ["café", "Größe", "naïve", "résumé"]
+
+    lines = []
+    total = 0
+    while total < size:
+        parts = [
+            f"2026-10-18 {rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}.{rng.randrange(1000):03d}",
+            rng.choice(levels),
+            f"[worker-{rng.randrange(16)}]",
+        ]
+        parts += rng.choices(words, k=rng.randint(3, 9))
+        if rng.random() < url_density:
+            parts.append(f"https://host{rng.randrange(500)}.example{rng.randrange(20)}.com/api/v1/item?id={rng.randrange(10 ** 6)}")
+        if rng.random() < ipv4_density:
+            parts.append(f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}")
+        if keywords and rng.random() < keyword_rate:
+            parts.insert(rng.randint(3, len(parts)), rng.choice(keywords))
+        line = " ".join(parts) + "\n"
+        lines.append(line)
+        total += len(line)
+    return lines
+
+# Generate a synthetic corpus of log files
+def generate_corpus(folder, size, files, encodings, url_density, ipv4_density, keyword_rate, keywords, seed):
+    """
+    Writes a corpus of log files of about size bytes in total, spread over a
+    number of files cycling through the encodings, into a subfolder tree.
+    
+    Arguments:
+    folder (str): The folder to write the corpus to.
+    size (int): The total size of the corpus in bytes.
+    files (int): The number of files.
+    encodings (list): The encodings of CORPUS_ENCODINGS the files cycle through.
+    url_density (float): The fraction of lines with a URL.
+    ipv4_density (float): The fraction of lines with an IPv4 address.
+    keyword_rate (float): The fraction of lines with a keyword.
+    keywords (list): The keywords lines are given.
+    seed (int): The seed of the random generator.
+    
+    Returns:
+    dict: The total bytes and text lines of the corpus, and the path to its
+          largest ASCII file (or None), for the in-memory stages.
+    """
+
+    rng = random.Random(seed)
+    corpus = {"bytes": 0, "lines": 0, "ascii_file": None}
+    for index in range(files):
+        encoding = encodings[index % len(encodings)]
+        file_folder = os.path.join(folder, f"host{index % 4}")
+        os.makedirs(file_folder, exist_ok=True)
+        file_path = os.path.join(file_folder, f"app{index}_{encoding}.log")
+
+        file_size = size // files
+        text_size = file_size // 4 if encoding == "text-header-binary" else file_size
+        if encoding == "utf-16":
+            text_size //= 2
+        lines = generate_lines(rng, text_size, url_density, ipv4_density, keyword_rate, keywords, encoding in ("utf-8-bom", "utf-16"))
+        text = "".join(lines)
+
+        if encoding == "ascii":
+            data = text.encode("ascii")
+            corpus["ascii_file"] = file_path
+        elif encoding == "utf-8-bom":
+            data = text.encode("utf-8-sig")
+        elif encoding == "utf-16":
+            data = text.encode("utf-16")
+        else:
+            data = text.encode("ascii") + b"\x89BIN" + rng.randbytes(max(file_size - len(text), 0))
+
+        with open(file_path, "wb") as output_file:
+            output_file.write(data)
+        corpus["bytes"] += len(data)
+        corpus["lines"] += len(lines)
+    return corpus
+
+# Find the peak memory use of this process
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or None
+    where it cannot be read.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # Bytes on macOS, KB elsewhere
+
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    return None
+
+# Run one stage of the suite, in a fresh worker process
+def run_stage(stage, ini_path, corpus_folder, ascii_file, ipv4, cache_folder):
+    """
+    Times one stage of the suite. Each stage runs in a process of its own, so
+    its peak memory use is its own and it starts from an empty replacement map.
+    The keyword cache of the stages is kept in a folder of the suite's own, so
+    the user's cache files are not replaced by the suite's keyword files.
+    
+    Arguments:
+    stage (str): The stage, 'compile', 'compile_cached', 'obfuscate_content', 'obfuscate_keywords'
+                 or 'process_folder'. Only 'compile' compiles the keywords without the cache.
+    ini_path (str): The path to the keyword file.
+    corpus_folder (str): The folder holding the corpus.
+    ascii_file (str): The path to the ASCII file of the corpus the in-memory stages use.
+    ipv4 (bool): Whether to obfuscate IPv4 addresses.
+    cache_folder (str): The folder to keep the keyword cache in.
+    
+    Returns:
+    tuple: The elapsed time in seconds and the peak memory use in bytes (or None).
+    """
+
+    logging.disable(logging.INFO)  # Leave out the log messages of every file and keyword
+    ObfuscateLogs.get_keyword_cache_folder = lambda: cache_folder  # This process only
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stage == "compile_cached":
+            ObfuscateLogs.load_keywords_from_file(ini_path, ObfuscateLogs.__file__, ipv4=ipv4)  # Fills the cache if need be
+        start = time.perf_counter()
+        keyword_matcher = ObfuscateLogs.load_keywords_from_file(ini_path, ObfuscateLogs.__file__, stage != "compile", ipv4)
+        ObfuscateLogs.get_rule_scanner(keyword_matcher, ipv4)
+        compiled = time.perf_counter()
+
+        if stage in ("compile", "compile_cached"):
+            return compiled - start, peak_rss()
+
+        if stage == "process_folder":
+            output_folder = tempfile.mkdtemp(prefix="obfuscation_benchmark_")
+            try:
+                start = time.perf_counter()
+                ObfuscateLogs.process_folder(corpus_folder, output_folder, keyword_matcher, False, ipv4)
+                return time.perf_counter() - start, peak_rss()
+            finally:
+                shutil.rmtree(output_folder, ignore_errors=True)
+
+        with open(ascii_file, "r", encoding="ascii") as input_file:
+            content = input_file.read()
+        if stage == "obfuscate_content":
+            start = time.perf_counter()
+            ObfuscateLogs.obfuscate_content(content, ascii_file, keyword_matcher, False, ipv4)
+            return time.perf_counter() - start, peak_rss()
+
+        lines = content.split("\n")
+        start = time.perf_counter()
+        for line_number, line in enumerate(lines, start=1):
+            ObfuscateLogs.obfuscate_keywords(line, line_number, ascii_file, keyword_matcher)
+        return time.perf_counter() - start, peak_rss()
+
+# Compare results with a baseline
+def compare_with_baseline(results, baseline, threshold):
+    """
+    Prints how much faster or slower each stage ran than in the baseline.
+    
+    Arguments:
+    results (dict): The results of this run, by stage.
+    baseline (dict): The saved results of an earlier run.
+    threshold (float): The fraction slower a stage can be before it is a regression.
+    
+    Returns:
+    list: The stages that regressed.
+    """
+
+    if baseline.get("settings") != results["settings"]:
+        print("Warning: the baseline was run with other settings, so the comparison may not be like for like.")
+
+    regressions = []
+    print(f"{'Stage':<36}  {'Baseline':>10}  {'This run':>10}  {'Change':>8}")
+    for name, result in results["stages"].items():
+        baseline_result = baseline.get("stages", {}).get(name)
+        if baseline_result is None:
+            print(f"{name:<36}  {'-':>10}  {result['seconds']:>8.3f} s  {'new':>8}")
+            continue
+        change = result["seconds"] / baseline_result["seconds"] - 1 if baseline_result["seconds"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<36}  {baseline_result['seconds']:>8.3f} s  {result['seconds']:>8.3f} s  {change:>+7.1%}{flag}")
+    return regressions
+
+# Benchmark the obfuscation stages over a synthetic corpus
+def benchmark_suite(args):
+    """
+    Generates a synthetic corpus and keyword files of each size, times every
+    stage over them and prints lines/s, MB/s and peak memory use. The results
+    can be saved as a baseline, and compared with an earlier one.
+    
+    Arguments:
+    args (Namespace): The parsed command line arguments.
+    
+    Returns:
+    int: The exit code, 1 if a stage regressed against the baseline.
+    """
+
+    encodings = args.encodings.split(",")
+    for encoding in encodings:
+        if encoding not in CORPUS_ENCODINGS:
+            print(f"Error: Unknown encoding {encoding}, expected some of {','.join(CORPUS_ENCODINGS)}")
+            return 1
+
+    size = parse_size(args.corpus_size)
+    all_keywords = generate_keywords(max(args.keyword_counts), args.seed)
+    corpus_keywords = all_keywords[:min(args.keyword_counts)]  # Found in every keyword file
+
+    work_folder = tempfile.mkdtemp(prefix="obfuscation_benchmark_")
+    try:
+        corpus_folder = args.corpus or os.path.join(work_folder, "corpus")
+        start = time.perf_counter()
+        corpus = generate_corpus(corpus_folder, size, args.files, encodings, args.url_density,
+                                 args.ipv4_density, args.keyword_rate, corpus_keywords, args.seed)
+        print(f"Generated {format_size(corpus['bytes'])} corpus of {corpus['lines']} lines in "
+              f"{args.files} files in {time.perf_counter() - start:.1f} s")
+
+        stages = ["compile", "compile_cached", "process_folder"]
+        if corpus["ascii_file"] is not None:
+            stages[2:2] = ["obfuscate_content", "obfuscate_keywords"]
+            with open(corpus["ascii_file"], "rb") as ascii_file:
+                ascii_data = ascii_file.read()
+            ascii_stats = {"bytes": len(ascii_data), "lines": ascii_data.count(b"\n")}
+
+        results = {
+            "settings": {
+                "corpus_size": size, "files": args.files, "encodings": encodings,
+                "url_density": args.url_density, "ipv4_density": args.ipv4_density,
+                "keyword_rate": args.keyword_rate, "ipv4": args.ipv4, "seed": args.seed,
+            },
+            "stages": {},
+        }
+
+        print(f"{'Stage':<36}  {'Time':>10}  {'Lines/s':>12}  {'MB/s':>8}  {'Peak RSS':>10}")
+        spawn = multiprocessing.get_context("spawn")
+        for keyword_count in args.keyword_counts:
+            ini_path = os.path.join(work_folder, f"keywords_{keyword_count}.ini")
+            write_keyword_file(ini_path, all_keywords[:keyword_count])
+
+            for stage in stages:
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                    seconds, peak = executor.submit(
+                        run_stage, stage, ini_path, corpus_folder, corpus["ascii_file"], args.ipv4,
+                        os.path.join(work_folder, "keyword_cache"),
+                    ).result()
+
+                name = f"{stage} ({keyword_count} keywords)"
+                stats = corpus if stage == "process_folder" else ascii_stats if not stage.startswith("compile") else None
+                result = {"seconds": seconds, "peak_rss": peak}
+                if stats is not None and seconds:
+                    result["lines_per_s"] = stats["lines"] / seconds
+                    result["mb_per_s"] = stats["bytes"] / (1024 ** 2) / seconds
+                results["stages"][name] = result
+
+                lines_text = f"{result['lines_per_s']:>12.0f}" if "lines_per_s" in result else f"{'-':>12}"
+                mb_text = f"{result['mb_per_s']:>8.1f}" if "mb_per_s" in result else f"{'-':>8}"
+                peak_text = format_size(peak) if peak is not None else "-"
+                print(f"{name:<36}  {seconds:>8.3f} s  {lines_text}  {mb_text}  {peak_text:>10}")
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"\nCompared with baseline {args.compare}:")
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) more than {args.threshold:.0%} slower than the baseline.")
+            exit_code = 1
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=1)
+        print(f"Saved baseline to {args.save_baseline}")
+    return exit_code
+
+# Main function
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the performance of ObfuscateLogs.")
+    parser.add_argument(
+        "-s", "--sizes",
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help=f"File sizes to benchmark, with an optional K, M or G suffix (default: {' '.join(DEFAULT_SIZES)})."
+    )
+    parser.add_argument(
+        "--legacy-limit",
+        default="128M",
+        help="Largest size to time the original per-byte loop on, larger sizes are extrapolated (default: 128M)."
+    )
+
+    suite = parser.add_argument_group("suite", "Benchmark the obfuscation stages over a synthetic corpus.")
+    suite.add_argument("--suite", action="store_true", help="Run the suite instead of the text header benchmark.")
+    suite.add_argument("--corpus-size", default="64M", help="Total size of the synthetic corpus (default: 64M).")
+    suite.add_argument("--corpus", help="Folder to write the corpus to and keep, instead of a temporary folder (optional).")
+    suite.add_argument("--files", type=int, default=8, help="Number of files in the corpus (default: 8).")
+    suite.add_argument(
+        "--encodings",
+        default=",".join(CORPUS_ENCODINGS),
+        help=f"Comma separated encodings the corpus files cycle through (default: {','.join(CORPUS_ENCODINGS)})."
+    )
+    suite.add_argument("--url-density", type=float, default=0.2, help="Fraction of lines with a URL (default: 0.2).")
+    suite.add_argument("--ipv4-density", type=float, default=0.2, help="Fraction of lines with an IPv4 address (default: 0.2).")
+    suite.add_argument("--keyword-rate", type=float, default=0.1, help="Fraction of lines with a keyword (default: 0.1).")
+    suite.add_argument(
+        "--keyword-counts",
+        type=int,
+        nargs="+",
+        default=DEFAULT_KEYWORD_COUNTS,
+        help=f"Keyword file sizes to run the stages with (default: {' '.join(map(str, DEFAULT_KEYWORD_COUNTS))})."
+    )
+    suite.add_argument("--ipv4", action="store_true", help="Obfuscate IPv4 addresses as well (default: off).")
+    suite.add_argument("--seed", type=int, default=1, help="Seed of the corpus and keyword generator (default: 1).")
+    suite.add_argument("--save-baseline", help="Path to save the results to as a baseline (optional).")
+    suite.add_argument(
+        "--compare",
+        help="Path to a saved baseline to compare with, exiting with 1 if a stage regressed (optional)."
+    )
+    suite.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Fraction slower than the baseline that counts as a regression (default: {DEFAULT_THRESHOLD})."
+    )
+
+    args = parser.parse_args()
+
+    if args.suite:
+        sys.exit(benchmark_suite(args))
+
+    sizes = [parse_size(size) for size in args.sizes]
+    benchmark_header_detection(sizes, parse_size(args.legacy_limit))
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,118 @@
+# Tests of archived and compressed inputs and the output archive of ObfuscateLogs.py
+
+import gzip
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ObfuscateLogs
+
+# Member names in the order they are archived, and their content
+LOGS = {
+    "app.log": b"server at http://a.com/x from 10.1.2.3\nplain line\n",
+    "sub/db.log": b"".join(b"svr-01 http://b.org/%d 10.0.0.%d\n" % (number, number) for number in range(50))
+                  + b"\xff\xfe\x00binary\n\x00body",
+    "sub/bom.log": b"\xef\xbb\xbfserver \xc3\xa9 http://a.com/ 10.1.2.3\n",
+}
+MTIME = 1700000000
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        self.input_folder = os.path.join(self.folder, "input")
+        for name, data in LOGS.items():
+            path = os.path.join(self.input_folder, *name.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as log_file:
+                log_file.write(data)
+            os.utime(path, (MTIME, MTIME))
+        self.keyword_matcher = ObfuscateLogs.KeywordMatcher({"server": "SRV", "svr-01": "HOSTX"})
+        self.addCleanup(setattr, ObfuscateLogs, "replacement_map", ObfuscateLogs.replacement_map)
+        quiet = mock.patch("builtins.print")
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+    def obfuscate_files(self, names):
+        # The obfuscated content of plain files, numbered in the order given
+        ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+        output_folder = os.path.join(self.folder, "plain_output")
+        obfuscated = {}
+        for name in names:
+            output_path = ObfuscateLogs.obfuscate_file(os.path.join(self.input_folder, *name.split("/")),
+                                                       output_folder, self.keyword_matcher, False, True)
+            with open(output_path, "rb") as output_file:
+                obfuscated[name] = output_file.read()
+        return obfuscated
+
+    def obfuscate_archive(self, path):
+        ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+        return ObfuscateLogs.obfuscate_file(path, os.path.join(self.folder, "output"), self.keyword_matcher, False, True)
+
+    def read_members(self, path):
+        if path.endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                return {name: archive.read(name) for name in archive.namelist() if not name.endswith("/")}
+        with tarfile.open(path) as archive:
+            members = {member.name: member for member in archive if member.isreg()}
+            self.assertEqual({member.mtime for member in members.values()}, {MTIME})
+            return {name: archive.extractfile(member).read() for name, member in members.items()}
+
+    def test_archive_members_match_plain_files(self):
+        expected = self.obfuscate_files(LOGS)
+        for suffix in (".zip", ".tar", ".tar.gz", ".tar.bz2", ".tar.xz"):
+            path = os.path.join(self.folder, "logs" + suffix)
+            if suffix == ".zip":
+                with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+                    for name, data in LOGS.items():
+                        archive.writestr(name, data)
+            else:
+                with tarfile.open(path, "w:" + suffix[len(".tar."):]) as archive:
+                    for name in LOGS:
+                        archive.add(os.path.join(self.input_folder, *name.split("/")), name)
+            with self.subTest(suffix=suffix):
+                output_path = self.obfuscate_archive(path)
+                self.assertTrue(output_path.endswith("logs_obfuscated" + suffix))
+                self.assertEqual(self.read_members(output_path), expected)
+
+    def test_compressed_file_matches_plain_file(self):
+        expected = self.obfuscate_files(["sub/db.log"])
+        path = os.path.join(self.folder, "db.log.gz")
+        with gzip.open(path, "wb") as compressed_file:
+            compressed_file.write(LOGS["sub/db.log"])
+        with gzip.open(self.obfuscate_archive(path)) as output_file:
+            self.assertEqual(output_file.read(), expected["sub/db.log"])
+
+    def test_output_archive_matches_output_folder(self):
+        output_folder = os.path.join(self.folder, "output")
+        ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+        ObfuscateLogs.process_folder(self.input_folder, output_folder, self.keyword_matcher, False, True)
+        expected = {}
+        for name in LOGS:
+            output_path = ObfuscateLogs.get_output_path(os.path.join(self.input_folder, *name.split("/")),
+                                                        os.path.join(output_folder, *name.split("/")[:-1]))
+            with open(output_path, "rb") as output_file:
+                expected["output/" + name] = output_file.read()
+
+        for suffix in (".zip", ".tar.gz"):
+            with self.subTest(suffix=suffix):
+                path = os.path.join(self.folder, "obfuscated" + suffix)
+                output_archive = ObfuscateLogs.ArchiveWriter(path, self.folder)
+                ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+                ObfuscateLogs.process_folder(self.input_folder, output_folder, self.keyword_matcher, False, True,
+                                             output_archive=output_archive)
+                output_archive.close()
+                self.assertEqual(self.read_members(path), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
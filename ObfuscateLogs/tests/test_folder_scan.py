@@ -0,0 +1,94 @@
+# Tests of the single pass folder walk of ObfuscateLogs.py against os.walk
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ObfuscateLogs
+
+# Files of the tree, and folders that are links to another folder or cannot be read
+FILES = ["a.log", "b.txt", "z.log", "sub/c.log", "sub/d.log", "sub/deeper/e.log", "skip/f.log", "locked/g.log"]
+FOLDER_LINKS = {"link": "sub", "sub/deeper/up": "sub"}
+LOCKED = "locked"
+
+
+class FolderScanTest(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder_path = os.path.join(folder.name, "input")
+        self.output_folder = os.path.join(folder.name, "output")
+        for name in FILES:
+            path = os.path.join(self.folder_path, *name.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as log_file:
+                log_file.write(name)
+        for name, target in FOLDER_LINKS.items():
+            os.symlink(os.path.join(self.folder_path, target), os.path.join(self.folder_path, *name.split("/")))
+        os.symlink(os.path.join(self.folder_path, "a.log"), os.path.join(self.folder_path, "file_link"))
+        os.symlink(os.path.join(self.folder_path, "missing"), os.path.join(self.folder_path, "sub", "broken"))
+
+        # The folder is unreadable to os.walk and the scan alike, even when run as root
+        scandir = os.scandir
+
+        def locked_scandir(path="."):
+            if os.path.basename(path) == LOCKED:
+                raise PermissionError(13, "Permission denied", path)
+            return scandir(path)
+
+        patcher = mock.patch("os.scandir", locked_scandir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scan(self, include=None, exclude=None):
+        scan = ObfuscateLogs.FolderScan(self.folder_path, self.output_folder, include, exclude)
+        with self.assertLogs(level="WARNING") as logs:
+            files = list(scan)
+        self.assertTrue(any(LOCKED in message for message in logs.output))
+        self.assertTrue(scan.done)
+        self.assertEqual(scan.total(), str(len(files)))
+        return scan, files
+
+    def relative(self, files):
+        return [os.path.relpath(file_path, self.folder_path).replace(os.sep, "/") for file_path, output_folder in files]
+
+    def test_scan_matches_os_walk(self):
+        expected = []
+        folders = 0
+        for root, dirnames, filenames in os.walk(self.folder_path):
+            relative_root = os.path.relpath(root, self.folder_path)
+            output_folder = self.output_folder if relative_root == "." else os.path.join(self.output_folder, relative_root)
+            expected.extend((os.path.join(root, name), output_folder) for name in filenames)
+            folders += len(dirnames)
+
+        scan, files = self.scan()
+        self.assertEqual(files, expected)
+        self.assertEqual(scan.files, len(expected))
+        self.assertEqual(scan.folders, folders)
+        self.assertEqual(scan.excluded, 0)
+        self.assertIn("sub/broken", self.relative(files))
+        self.assertIn("file_link", self.relative(files))
+        self.assertFalse(any(path.startswith(("link/", LOCKED + "/")) for path in self.relative(files)))
+
+    def test_include_and_exclude(self):
+        scan, files = self.scan(include=["*.log"], exclude=["skip", "sub/d.*"])
+        self.assertEqual(sorted(self.relative(files)), ["a.log", "sub/c.log", "sub/deeper/e.log", "z.log"])
+        self.assertEqual(scan.folders, 5)  # sub, deeper, up, link and locked, but not skip
+        self.assertEqual(scan.excluded, 4)  # b.txt, file_link, sub/d.log and sub/broken
+
+    def test_stopping_early_ends_the_walk(self):
+        with mock.patch.object(ObfuscateLogs, "FOLDER_SCAN_QUEUE_SIZE", 1):
+            scan = ObfuscateLogs.FolderScan(self.folder_path, self.output_folder)
+            for _ in scan:
+                break
+        self.assertTrue(scan.done)
+        self.assertLess(scan.files, len(FILES))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+# Tests of following live log files in ObfuscateLogs.py
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ObfuscateLogs
+
+
+class FollowTest(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        self.output_folder = os.path.join(self.folder, "output")
+        self.keyword_matcher = ObfuscateLogs.KeywordMatcher({"password": "PW"})
+        ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+        quiet = mock.patch("builtins.print")
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+    def write(self, name, text):
+        path = os.path.join(self.folder, name)
+        with open(path, "a") as log_file:
+            log_file.write(text)
+        return path
+
+    def read_output(self, name):
+        with open(os.path.join(self.output_folder, name)) as output_file:
+            return output_file.read()
+
+    def test_file_removed_once_found_is_passed_over(self):
+        kept = self.write("kept.log", "password one\n")
+        gone = os.path.join(self.folder, "gone.log")
+        found = [(gone, self.output_folder), (kept, self.output_folder)]
+        with mock.patch.object(ObfuscateLogs, "iter_follow_files", return_value=found), \
+                mock.patch.object(ObfuscateLogs.time, "sleep", side_effect=KeyboardInterrupt):
+            ObfuscateLogs.follow(self.folder, self.output_folder, self.keyword_matcher)
+        self.assertEqual(self.read_output("kept_obfuscated.log"), "PW one\n")
+        self.assertFalse(os.path.exists(os.path.join(self.output_folder, "gone_obfuscated.log")))
+
+    def test_followed_file_removed_then_created_again(self):
+        path = self.write("app.log", "password one\n")
+        followed_file = ObfuscateLogs.FollowedFile(path, os.path.join(self.output_folder, "app_obfuscated.log"),
+                                                   self.keyword_matcher)
+        self.assertTrue(followed_file.poll())
+        followed_file._close_input()
+        os.remove(path)
+        self.assertFalse(followed_file.poll())
+        self.write("app.log", "password two\n")
+        self.assertTrue(followed_file.poll())
+        followed_file.close()
+        self.assertEqual(self.read_output("app_obfuscated.log"), "PW one\nPW two\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# Tests of incremental runs of ObfuscateLogs.py
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ObfuscateLogs
+
+
+class ManifestRecordTest(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.input_folder = os.path.join(folder.name, "input")
+        self.output_folder = os.path.join(folder.name, "output")
+        os.makedirs(self.input_folder)
+        for name in ("a.log", "b.log", "c.log"):
+            with open(os.path.join(self.input_folder, name), "w") as log_file:
+                log_file.write(f"password in {name}\n")
+        self.keyword_matcher = ObfuscateLogs.KeywordMatcher({"password": "PW"})
+        for name in ("replacement_map", "run_report"):
+            self.addCleanup(setattr, ObfuscateLogs, name, getattr(ObfuscateLogs, name))
+        quiet = mock.patch("builtins.print")
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+    def test_failed_record_is_the_file_error(self):
+        real_record = ObfuscateLogs.RunManifest.record
+
+        def record(manifest, file_path, output_path):
+            if file_path.endswith("b.log"):
+                raise OSError("disk full")
+            return real_record(manifest, file_path, output_path)
+
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+                ObfuscateLogs.run_report = ObfuscateLogs.RunReport()
+                manifest = ObfuscateLogs.RunManifest(self.output_folder, self.input_folder, "fingerprint")
+                with mock.patch.object(ObfuscateLogs.RunManifest, "record", record):
+                    ObfuscateLogs.process_folder(self.input_folder, self.output_folder, self.keyword_matcher, False, False,
+                                                 jobs, manifest)
+                errors = {os.path.basename(entry["path"]): entry["error"] for entry in ObfuscateLogs.run_report.files}
+                self.assertEqual(errors, {"a.log": None, "b.log": "disk full", "c.log": None})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# Tests of the keyword matcher and its cache in ObfuscateLogs.py
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ObfuscateLogs
+
+KEYWORDS = "[servers]\nserver=SRV\nsvr-01=HOST\n[general]\npassword=PW\n"
+LINE = "Password for svr-01 at http://www.example.com/ from 10.1.2.3"
+
+
+class KeywordCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.ini_path = os.path.join(folder.name, "keywords.ini")
+        with open(self.ini_path, "w") as ini_file:
+            ini_file.write(KEYWORDS)
+        patcher = mock.patch.object(ObfuscateLogs, "get_keyword_cache_folder",
+                                    return_value=os.path.join(folder.name, "cache"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        quiet = mock.patch("builtins.print")
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+    def obfuscate(self, keyword_matcher):
+        ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+        return ObfuscateLogs.get_rule_scanner(keyword_matcher, True).obfuscate_line(LINE)[0]
+
+    def test_cached_matcher_obfuscates_the_same(self):
+        fresh = ObfuscateLogs.load_keywords_from_file(self.ini_path, __file__, use_cache=False, ipv4=True)
+        ObfuscateLogs.load_keywords_from_file(self.ini_path, __file__, ipv4=True)
+        with mock.patch.object(ObfuscateLogs.KeywordMatcher, "__init__", side_effect=AssertionError("not cached")):
+            cached = ObfuscateLogs.load_keywords_from_file(self.ini_path, __file__, ipv4=True)
+        self.assertIsNotNone(cached.regexes["scanner ipv4=True"][1])
+        self.assertEqual(self.obfuscate(cached), self.obfuscate(fresh))
+
+    def test_uncached_compile_needs_no_re_internals(self):
+        with mock.patch.object(ObfuscateLogs, "regex_code", side_effect=AssertionError("internals used")):
+            keyword_matcher = ObfuscateLogs.load_keywords_from_file(self.ini_path, __file__, use_cache=False, ipv4=True)
+        self.assertEqual(self.obfuscate(keyword_matcher).count("PW"), 1)
+
+    def test_unloadable_code_falls_back_to_re_compile(self):
+        keyword_matcher = ObfuscateLogs.load_keywords_from_file(self.ini_path, __file__, ipv4=True)
+        expected = self.obfuscate(keyword_matcher)
+        state = keyword_matcher.to_cache()
+        state["regexes"] = {name: (source, ("not", "code")) for name, (source, code) in state["regexes"].items()}
+        self.assertEqual(self.obfuscate(ObfuscateLogs.KeywordMatcher.from_cache(state)), expected)
+        with mock.patch.object(ObfuscateLogs, "sre_parse", None):
+            self.assertIsNone(ObfuscateLogs.regex_code("a(?P<b>c)"))
+
+
+if __name__ == "__main__":
+    unittest.main()
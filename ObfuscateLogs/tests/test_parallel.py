@@ -0,0 +1,113 @@
+# Tests of a single file obfuscated in chunks by worker processes in ObfuscateLogs.py
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ObfuscateLogs
+
+DOMAINS = ["a.com", "b.org", "www.Example.com", "x.corp.local"]
+survey_chunk_task = ObfuscateLogs.survey_chunk_task
+
+
+# A survey missing the last value of each chunk, so obfuscating the chunk looks it up unsurveyed
+def survey_missing_a_value(*args):
+    chunk_header_end, newlines, values = survey_chunk_task(*args)
+    return chunk_header_end, newlines, values[:-1]
+
+
+# A worker failing on a bug of its own rather than on a chunk that does not match its survey
+def obfuscate_chunk_with_a_bug(*args):
+    raise KeyError("bug")
+
+
+class ChunkedFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(11)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        self.keyword_matcher = ObfuscateLogs.KeywordMatcher({"server": "SRV", "svr-01": "HOSTX", "generic": "GEN"})
+        self.addCleanup(setattr, ObfuscateLogs, "replacement_map", ObfuscateLogs.replacement_map)
+        changes_logger = logging.getLogger(ObfuscateLogs.CHANGES_LOGGER)
+        self.addCleanup(setattr, changes_logger, "handlers", changes_logger.handlers[:])
+        for patcher in (mock.patch("builtins.print"), mock.patch.object(ObfuscateLogs, "INTRA_FILE_CHUNK_SIZE", 1000)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_log(self, binary_tail):
+        lines = []
+        for number in range(self.random.randint(200, 1500)):
+            ip = f"10.{self.random.randint(0, 3)}.{self.random.randint(0, 9)}.{self.random.randint(0, 20)}"
+            domain = self.random.choice(DOMAINS + [ip])
+            lines.append(self.random.choice([
+                f"line {number} http://{domain}/p {ip}", f"user svr-01 server {ip} version", f"plain {number}",
+                f"https://{domain}:80/{ip} generic", "", "\r",
+            ]))
+        data = "\n".join(lines).encode()
+        if binary_tail:
+            data += b"\n\xff\xfebinary\n\x00stuff"
+        path = os.path.join(self.folder, "input.log")
+        with open(path, "wb") as log_file:
+            log_file.write(data)
+        return path
+
+    def obfuscate(self, path, jobs, ipv4):
+        output_folder = os.path.join(self.folder, f"output_{jobs}")
+        os.makedirs(output_folder, exist_ok=True)
+        ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+        change_log, listener = ObfuscateLogs.setup_change_log(output_folder)
+        try:
+            ObfuscateLogs.obfuscate_file(path, output_folder, self.keyword_matcher, True, ipv4, jobs)
+        finally:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+        with open(ObfuscateLogs.get_output_path(path, output_folder), "rb") as output_file:
+            output = output_file.read()
+        with open(change_log, encoding="utf-8") as change_log_file:
+            changes = change_log_file.read()
+        return output, changes, ObfuscateLogs.replacement_map.items()
+
+    def test_chunks_match_sequential(self):
+        for trial, (binary_tail, ipv4) in enumerate([(True, True), (False, True), (True, False)]):
+            path = self.write_log(binary_tail)
+            sequential = self.obfuscate(path, 1, ipv4)
+            with mock.patch.object(ObfuscateLogs, "obfuscate_text_header_file_parallel",
+                                   wraps=ObfuscateLogs.obfuscate_text_header_file_parallel) as parallel:
+                chunked = self.obfuscate(path, 3, ipv4)
+            with self.subTest(trial=trial, binary_tail=binary_tail, ipv4=ipv4):
+                self.assertEqual(parallel.call_count, 1)
+                self.assertTrue(sequential[1])
+                self.assertEqual(chunked[0], sequential[0])
+                self.assertEqual(chunked[1], sequential[1])
+                self.assertEqual(chunked[2], sequential[2])
+
+    def test_unsurveyed_value_falls_back_to_sequential(self):
+        path = self.write_log(True)
+        sequential = self.obfuscate(path, 1, True)
+        with mock.patch.object(ObfuscateLogs, "survey_chunk_task", survey_missing_a_value), \
+                mock.patch.object(ObfuscateLogs, "obfuscate_text_header_file",
+                                  wraps=ObfuscateLogs.obfuscate_text_header_file) as fallback:
+            chunked = self.obfuscate(path, 3, True)
+        self.assertEqual(fallback.call_count, 1)
+        self.assertEqual(chunked, sequential)
+
+    def test_other_errors_are_not_a_fallback(self):
+        path = self.write_log(False)
+        with mock.patch.object(ObfuscateLogs, "obfuscate_chunk_task", obfuscate_chunk_with_a_bug), \
+                mock.patch.object(ObfuscateLogs, "obfuscate_text_header_file") as fallback:
+            with self.assertRaises(KeyError):
+                self.obfuscate(path, 3, True)
+        fallback.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,236 @@
+# Tests of the replacement maps of ObfuscateLogs.py
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ObfuscateLogs
+
+
+class HashedReplacementMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(1)
+        self.addCleanup(setattr, ObfuscateLogs, "replacement_map", ObfuscateLogs.replacement_map)
+
+    def replacement_number(self, replacement):
+        # The number of an IPv4 replacement, which is never a dotted quad
+        self.assertIsNone(ObfuscateLogs.IPV4_REGEX.search(replacement))
+        prefix = ObfuscateLogs.IPV4_TEMPLATE.format("")
+        self.assertTrue(replacement.startswith(prefix))
+        number = int(replacement[len(prefix):])
+        self.assertGreaterEqual(number, ObfuscateLogs.HashedReplacementMap.IPV4_NUMBER_OFFSET)
+        return number
+
+    def test_separate_maps_never_merge_addresses(self):
+        # Each map stands in for a worker process or machine, with no state in common
+        maps = [ObfuscateLogs.HashedReplacementMap(b"secret") for _ in range(4)]
+        values = {"10.0.0.64", "10.0.1.104"}
+        while len(values) < 20000:
+            values.add(".".join(str(self.random.randrange(256)) for _ in range(4)))
+        replacements = {}
+        for value in values:
+            replacement = self.random.choice(maps).get(value, ObfuscateLogs.IPV4_TEMPLATE)
+            self.replacement_number(replacement)
+            replacements[value] = replacement
+        self.assertEqual(len(set(replacements.values())), len(values))
+        self.assertNotEqual(replacements["10.0.0.64"], replacements["10.0.1.104"])
+
+    def test_other_dotted_quads_never_take_an_address(self):
+        addresses = ObfuscateLogs.HashedReplacementMap(b"secret")
+        others = ObfuscateLogs.HashedReplacementMap(b"secret")
+        values = set()
+        while len(values) < 3000:
+            values.add(".".join(str(self.random.randrange(1000)).zfill(self.random.choice((1, 2, 3))) for _ in range(4)))
+        address_values = {value for value in values if addresses._is_address(value.split("."))}
+        replacements = {}
+        for value in values:
+            replacement = (addresses if value in address_values else others).get(value, ObfuscateLogs.IPV4_TEMPLATE)
+            number = self.replacement_number(replacement) - ObfuscateLogs.HashedReplacementMap.IPV4_NUMBER_OFFSET
+            self.assertEqual(number < 2 ** 32, value in address_values)
+            replacements[value] = replacement
+        self.assertEqual(len(set(replacements.values())), len(values))
+
+    def test_replacements_are_never_addresses_left_in_the_log(self):
+        # Addresses on 'version' lines are left unchanged, which no replacement may then be mistaken for
+        ObfuscateLogs.replacement_map = ObfuscateLogs.HashedReplacementMap(b"secret")
+        rule_scanner = ObfuscateLogs.RuleScanner(ObfuscateLogs.KeywordMatcher({}), True)
+        kept, replaced = set(), set()
+        for number in range(5000):
+            ips = [".".join(str(self.random.randrange(256)) for _ in range(4)) for _ in range(3)]
+            version = number % 2 == 1
+            new_line, changes = rule_scanner.obfuscate_line(f"{'version ' if version else ''}from {ips[0]} to {ips[1]} "
+                                                            f"via http://{ips[2]}/")
+            (kept if version else replaced).update(ips[:2])
+            replaced.add(ips[2])
+            self.assertEqual(set(ObfuscateLogs.IPV4_REGEX.findall(new_line)), set(ips[:2]) if version else set())
+        replacements = {ObfuscateLogs.replacement_map.get(ip, ObfuscateLogs.IPV4_TEMPLATE) for ip in replaced | kept}
+        self.assertFalse(replacements & kept)
+
+    def test_same_key_same_replacements(self):
+        first = ObfuscateLogs.HashedReplacementMap(b"secret")
+        second = ObfuscateLogs.HashedReplacementMap(b"secret")
+        other_key = ObfuscateLogs.HashedReplacementMap(b"other")
+        for value, template in (("10.1.2.3", ObfuscateLogs.IPV4_TEMPLATE), ("010.1.2.3", ObfuscateLogs.IPV4_TEMPLATE),
+                                ("www.example.com", ObfuscateLogs.DOMAIN_TEMPLATE)):
+            self.assertEqual(first.get(value, template), second.get(value, template))
+            self.assertNotEqual(first.get(value, template), other_key.get(value, template))
+
+
+class StoredReplacementMapTest(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, "mapping.db")
+
+    def assert_write_lock_free(self, free=True):
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        try:
+            if free:
+                other.execute("BEGIN IMMEDIATE")  # Raises 'database is locked' if the write lock is held
+                other.execute("ROLLBACK")
+            else:
+                self.assertRaises(sqlite3.OperationalError, other.execute, "BEGIN IMMEDIATE")
+        finally:
+            other.close()
+
+    def test_write_lock_is_held_only_for_a_batch(self):
+        stored = ObfuscateLogs.StoredReplacementMap(self.path)
+        self.addCleanup(stored.close)
+        stored.get("www.example.com", ObfuscateLogs.DOMAIN_TEMPLATE)
+        self.assert_write_lock_free(False)
+        stored.flush()
+        self.assertFalse(stored.connection.in_transaction)
+        self.assert_write_lock_free()
+
+        # The timer commits a batch no other value follows
+        with mock.patch.object(ObfuscateLogs.StoredReplacementMap, "BATCH_SECONDS", 0.01):
+            stored.get("www.example.org", ObfuscateLogs.DOMAIN_TEMPLATE)
+            time.sleep(1)
+        self.assertFalse(stored.connection.in_transaction)
+        self.assert_write_lock_free()
+
+    def test_batches_are_committed_together(self):
+        stored = ObfuscateLogs.StoredReplacementMap(self.path)
+        self.addCleanup(stored.close)
+        other = sqlite3.connect(self.path)
+        self.addCleanup(other.close)
+        with mock.patch.object(ObfuscateLogs.StoredReplacementMap, "BATCH_SIZE", 10):
+            for number in range(25):
+                stored.get(f"host{number}.example.com", ObfuscateLogs.DOMAIN_TEMPLATE)
+        self.assertEqual(other.execute("SELECT COUNT(*) FROM replacements").fetchone()[0], 20)
+        stored.flush()
+        self.assertEqual(other.execute("SELECT COUNT(*) FROM replacements").fetchone()[0], 25)
+
+    def test_maps_sharing_a_database_agree(self):
+        first = ObfuscateLogs.StoredReplacementMap(self.path)
+        second = ObfuscateLogs.StoredReplacementMap(self.path)
+        self.addCleanup(first.close)
+        self.addCleanup(second.close)
+        values = [f"host{number}.example.com" for number in range(200)]
+        random.Random(1).shuffle(values)
+        replacements = {}
+        # Each map waits for the other's batch to be committed by its timer
+        with mock.patch.object(ObfuscateLogs.StoredReplacementMap, "BATCH_SECONDS", 0.001):
+            for index, value in enumerate(values):
+                stored = (first, second)[index // 3 % 2]
+                replacements[value] = stored.get(value, ObfuscateLogs.DOMAIN_TEMPLATE)
+        for value in values:
+            self.assertEqual(first.get(value, ObfuscateLogs.DOMAIN_TEMPLATE), replacements[value])
+            self.assertEqual(second.get(value, ObfuscateLogs.DOMAIN_TEMPLATE), replacements[value])
+        self.assertEqual(len(set(replacements.values())), len(values))
+
+
+class PackedAddressTableTest(unittest.TestCase):
+
+    def test_table_matches_dict(self):
+        rng = random.Random(3)
+        table = ObfuscateLogs.PackedAddressTable()
+        expected = {}
+        for code in range(1, 5000):
+            address = rng.randrange(2 ** 32) if rng.random() < 0.7 else rng.choice(list(expected) or [0])
+            self.assertEqual(table.setdefault(address, code), expected.setdefault(address, code))
+            probe = rng.randrange(2 ** 32)
+            self.assertEqual(table.get(probe), expected.get(probe, 0))
+        self.assertEqual(len(table), len(expected))
+        self.assertEqual(dict(table.items()), expected)
+        self.assertGreater(len(table.codes), ObfuscateLogs.PackedAddressTable.MIN_SLOTS)
+
+
+class CompactReplacementMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(7)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+    def random_value(self):
+        kind = self.random.random()
+        if kind < 0.5:
+            return ".".join(str(self.random.randrange(256)) for _ in range(4))
+        if kind < 0.6:
+            return f"0{self.random.randrange(50)}.1.2.3"  # A dotted quad that is not packed
+        return f"host{self.random.randrange(3000)}.example.com"
+
+    def compare(self, memory_limit):
+        # Random lookups and rollbacks, checked against the ReplacementMap after each step
+        compact = ObfuscateLogs.CompactReplacementMap(memory_limit, self.folder)
+        self.addCleanup(compact.close)
+        expected = ObfuscateLogs.ReplacementMap()
+        seen = []
+        for step in range(20000):
+            if self.random.random() < 0.002:
+                count = self.random.randint(max(len(expected) - 300, 0), len(expected))
+                compact.rollback(count)
+                expected.rollback(count)
+                self.assertEqual(len(compact), len(expected))
+                continue
+            value = self.random.choice(seen) if seen and self.random.random() < 0.3 else self.random_value()
+            seen.append(value)
+            template = self.random.choice((ObfuscateLogs.IPV4_TEMPLATE, ObfuscateLogs.DOMAIN_TEMPLATE))
+            self.assertEqual(compact.get(value, template), expected.get(value, template), f"step {step}: {value}")
+        self.assertEqual(len(compact), len(expected))
+        self.assertEqual(compact.items(), expected.items())
+        first = len(expected) // 2
+        self.assertEqual(compact.items(first), expected.items(first))
+        return compact
+
+    def test_below_the_spill_threshold(self):
+        compact = self.compare(None)
+        self.assertEqual(compact.footprint()["spilled_values"], 0)
+        self.assertIsNone(compact.spill_path)
+
+    def test_above_the_spill_threshold(self):
+        compact = self.compare(20000)
+        footprint = compact.footprint()
+        self.assertGreater(footprint["spilled_values"], 0)
+        self.assertLessEqual(footprint["peak_memory_bytes"], 20000 + 200)  # Spilled once a value crosses the limit
+        spill_path = compact.spill_path
+        self.assertTrue(os.path.exists(spill_path))
+        compact.close()
+        self.assertFalse(os.path.exists(spill_path))
+
+    def test_addresses_take_a_fraction_of_the_memory(self):
+        # An address is packed into 18 to 36 bytes, where a dict holds a pair of strings
+        compact = ObfuscateLogs.CompactReplacementMap(None)
+        expected = ObfuscateLogs.ReplacementMap()
+        for _ in range(100000):
+            value = ".".join(str(self.random.randrange(256)) for _ in range(4))
+            compact.get(value, ObfuscateLogs.IPV4_TEMPLATE)
+            expected.get(value, ObfuscateLogs.IPV4_TEMPLATE)
+        compact_bytes = compact.footprint()["memory_bytes"]
+        self.assertLessEqual(compact_bytes, 36 * len(compact) + 1024)
+        self.assertLess(compact_bytes * 4, expected.footprint()["memory_bytes"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# Tests of the single pass RuleScanner of ObfuscateLogs.py against the rules applied one after another
+
+import os
+import random
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ObfuscateLogs
+
+# Pieces of lines and keywords, chosen so URLs, IPs and keywords overlap and
+# keywords can match within the generic replacements
+LINE_PIECES = [
+    "http://", "https://", "HTTP://", "a.b", "x.com", "/p/q", "1.2.3.4", "10.0.0.1", "192.0.2.1", "9.9.9.999",
+    " ", "  ", "-", ".", "_", "version", ".DLL", "ab", "Ab", "generic", "com", "m", "om", "1", "19", "é", "İ", "\u212a",
+    "K", ":", "/", "x", "h", "ht", "http", "2",
+]
+KEYWORD_PIECES = [
+    "a", "b", "ab", "x", "h", "ht", "http", "com", "m", "1", ".", "-", " ", "gen", "generic-", "domain", "192",
+    "0.2", "/", "p", "version", "é", "k", "_", "2",
+]
+
+
+class RuleScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(5)
+        self.addCleanup(setattr, ObfuscateLogs, "replacement_map", ObfuscateLogs.replacement_map)
+
+    def random_keywords(self):
+        keywords = {}
+        for _ in range(self.random.randint(0, 5)):
+            keyword = "".join(self.random.choices(KEYWORD_PIECES, k=self.random.randint(1, 3))).lower().strip()
+            if keyword and keyword not in keywords:
+                keywords[keyword] = f"R{len(keywords)}"
+        return keywords
+
+    def test_single_pass_matches_rules_in_passes(self):
+        for trial in range(800):
+            keyword_matcher = ObfuscateLogs.KeywordMatcher(self.random_keywords())
+            rule_scanner = ObfuscateLogs.RuleScanner(keyword_matcher, self.random.random() < 0.7)
+            lines = ["".join(self.random.choices(LINE_PIECES, k=self.random.randint(0, 10))) for _ in range(15)]
+
+            ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+            expected = [rule_scanner.obfuscate_line_in_passes(line) for line in lines]
+            expected_items = ObfuscateLogs.replacement_map.items()
+
+            ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+            for line, (expected_line, expected_changes) in zip(lines, expected):
+                with self.subTest(trial=trial, keywords=keyword_matcher.keywords, ipv4=rule_scanner.ipv4, line=line):
+                    new_line, changes = rule_scanner.obfuscate_line(line)
+                    self.assertEqual(new_line, expected_line)
+                    self.assertEqual(sorted(changes), sorted(expected_changes))
+                    for rule, offset, before, after in changes:
+                        if rule is ObfuscateLogs.URL_RULE:
+                            self.assertEqual(line[offset:offset + len(before)], before)
+            self.assertEqual(ObfuscateLogs.replacement_map.items(), expected_items)
+
+    def test_changes_are_at_offsets_in_the_original_line(self):
+        keyword_matcher = ObfuscateLogs.KeywordMatcher({"password": "PW", "generic": "GEN"})
+        rule_scanner = ObfuscateLogs.RuleScanner(keyword_matcher, True)
+        line = "password http://a.com/10.1.2.3 password"
+        expected = [
+            (ObfuscateLogs.KEYWORD_RULE, 0, "password", "PW"),
+            (ObfuscateLogs.URL_RULE, 16, "a.com", "generic-domain-1.com"),
+            (ObfuscateLogs.KEYWORD_RULE, 16, "generic", "GEN"),  # In the generic domain
+            (ObfuscateLogs.IPV4_RULE, 22, "10.1.2.3", "192.0.2.2"),
+            (ObfuscateLogs.KEYWORD_RULE, 31, "password", "PW"),
+        ]
+        for obfuscate_line in (rule_scanner.obfuscate_line, rule_scanner.obfuscate_line_in_passes):
+            ObfuscateLogs.replacement_map = ObfuscateLogs.ReplacementMap()
+            new_line, changes = obfuscate_line(line)
+            self.assertEqual(new_line, "PW http://GEN-domain-1.com/192.0.2.2 PW")
+            self.assertEqual(sorted(changes, key=lambda change: change[1]), expected)
+
+    def test_keyword_matcher_matches_alternation(self):
+        for trial in range(500):
+            keywords = self.random_keywords()
+            keyword_matcher = ObfuscateLogs.KeywordMatcher(keywords)
+            line = "".join(self.random.choices(LINE_PIECES + list(keywords), k=self.random.randint(0, 12)))
+            expected = line
+            if keywords:
+                alternation = re.compile("|".join(re.escape(keyword) for keyword in keywords), re.IGNORECASE)
+                expected = alternation.sub(lambda match: keywords.get(match.group(0).lower(), match.group(0)), line)
+            with self.subTest(keywords=keywords, line=line):
+                self.assertEqual(keyword_matcher.sub(line), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+# Tests of scanning for what obfuscation would replace in ObfuscateLogs.py
+
+import io
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ObfuscateLogs
+
+CHUNK = 16  # Bytes read at a time, so a line spans many chunks
+
+
+class LongLineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.keyword_matcher = ObfuscateLogs.KeywordMatcher({"password": "PW"})
+        patcher = mock.patch.object(ObfuscateLogs, "read_chunk", lambda input_file, size=None: input_file.read(CHUNK))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_line_blocks_join_pieces(self):
+        for chunks in (["ab", "c\nd", "e", "\n", "f"], [b"ab", b"c\nd", b"e", b"\n", b"f"], ["a\n", "", "b\n"]):
+            with self.subTest(chunks=chunks):
+                blocks = list(ObfuscateLogs.iter_line_blocks(chunks))
+                self.assertEqual(blocks[0][:0].join(blocks), chunks[0][:0].join(chunks))
+                newline = "\n" if isinstance(chunks[0], str) else b"\n"
+                self.assertTrue(all(block.endswith(newline) for block in blocks[:-1]))
+
+    def test_scan_of_a_single_line_over_many_chunks(self):
+        # A keyword across a chunk boundary, in a line of 2 MB without a newline, read 16 bytes
+        # at a time: well within a second, where copying the line again for each chunk took 15
+        data = b"x" * (CHUNK - 3) + b"password" + b"y" * (2 * 1024 * 1024)
+        start = time.perf_counter()
+        result = ObfuscateLogs.scan_stream("one_line.log", io.BytesIO(data), self.keyword_matcher)
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertEqual(result["lines"], 1)
+        self.assertEqual(result["hits"]["keyword"], 1)
+        self.assertEqual(result["samples"], [{"rule": "keyword", "line": 1, "offset": CHUNK - 3}])
+
+    def test_clone_check_of_a_single_line_over_many_chunks(self):
+        data = b"y" * (2 * 1024 * 1024)
+        self.assertEqual(ObfuscateLogs.count_unchanged_lines(io.BytesIO(data + b"\n" + data), self.keyword_matcher), 2)
+        self.assertIsNone(ObfuscateLogs.count_unchanged_lines(io.BytesIO(data + b"Password"), self.keyword_matcher))
+
+
+if __name__ == "__main__":
+    unittest.main()